@@ -8,9 +8,14 @@ A wrapper around pdflatex/xelatex which
 - opens the pdf file if needed
 """
 
-from .processor import Processor
+from .processor import Processor, ResourceLimitExceeded
 from .runner import Runner, LaTeXError
 from .typesetter import Typesetter
 from .open_pdf import OpenPdf
 from .log_processor import LogProcessor
 from .cleaner import Cleaner
+from .filters import MessageFilter, FilterRule
+from .batch import BatchRunner
+from .history import BuildHistory
+from .result import BuildResult, Message
+from .metrics import Metrics
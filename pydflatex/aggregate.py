@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+from collections import OrderedDict
+
+class Locations(object):
+	"""
+	A compact set of page or line numbers, stored as at most `max_ranges` ranges.
+	"""
+	def __init__(self, max_ranges):
+		self.max_ranges = max_ranges
+		self.ranges = []
+		self.truncated = False
+
+	def add(self, value):
+		try:
+			value = int(value)
+		except (TypeError, ValueError):
+			return
+		for interval in self.ranges:
+			first, last = interval
+			if first <= value <= last:
+				return
+			if value == last + 1:
+				interval[1] = value
+				self.merge()
+				return
+			if value == first - 1:
+				interval[0] = value
+				self.merge()
+				return
+		if len(self.ranges) < self.max_ranges:
+			self.ranges.append([value, value])
+		else:
+			self.truncated = True
+
+	def merge(self):
+		"""
+		Merge the adjacent ranges.
+		"""
+		self.ranges.sort()
+		merged = self.ranges[:1]
+		for first, last in self.ranges[1:]:
+			if first <= merged[-1][1] + 1:
+				merged[-1][1] = max(last, merged[-1][1])
+			else:
+				merged.append([first, last])
+		self.ranges = merged
+
+	def __str__(self):
+		parts = []
+		for first, last in self.ranges:
+			if first == last:
+				parts.append(str(first))
+			else:
+				parts.append('{0}-{1}'.format(first, last))
+		if self.truncated:
+			parts.append('...')
+		return ','.join(parts)
+
+class Group(object):
+	"""
+	Identical messages: the first occurrence, the number of occurrences and where they occurred.
+	"""
+	def __init__(self, kind, message, max_ranges):
+		self.kind = kind
+		self.message = message
+		self.count = 0
+		self.pages = Locations(max_ranges)
+		self.lines = Locations(max_ranges)
+
+	def add(self, message):
+		self.count += 1
+		self.pages.add(message.get('page'))
+		self.lines.add(message.get('line'))
+
+class Aggregator(object):
+	"""
+	Group identical messages by kind, package and text.
+	The memory used is bounded: each group stores at most `max_ranges` page and line ranges,
+	and messages beyond `max_groups` distinct ones are only counted.
+	"""
+	def __init__(self, max_ranges=8, max_groups=1000):
+		self.max_ranges = max_ranges
+		self.max_groups = max_groups
+		self.groups = OrderedDict()
+		self.dropped = 0
+
+	def add(self, kind, message):
+		key = (kind, message.get('pkg'), message.get('text'))
+		group = self.groups.get(key)
+		if group is None:
+			if len(self.groups) >= self.max_groups:
+				self.dropped += 1
+				return
+			group = Group(kind, message, self.max_ranges)
+			self.groups[key] = group
+		group.add(message)
+
+	def extend(self, kind, messages):
+		for message in messages:
+			self.add(kind, message)
+		return self
+
+	def __iter__(self):
+		return iter(self.groups.values())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .processor import Processor, LaTeXError
+from .runner import Runner
+from .history import BuildHistory
+from .metrics import Metrics
+from .manifest import Manifest, input_hashes, input_digest
+
+def build(tex_path, options):
+	"""
+	Build one document. This runs in a worker process.
+	The metrics of the build are returned to the main process, which exports them.
+	The digest of the sources is that of the sources read by the build, according to its .fls file,
+	as they were before it started, so that a source modified during the build is built again.
+	"""
+	options = dict(options, metrics_file=None)
+	full_path = Runner.paths(tex_path)['full_path']
+	hashes = input_hashes(full_path) if options['manifest'] else None
+	runner = Runner(options=options)
+	time_start = time.time()
+	error = None
+	error_types = []
+	try:
+		runner.run(tex_path)
+	except Exception as e:
+		error = '{0}: {1}'.format(type(e).__name__, e)
+		error_types = [cls.__name__ for cls in type(e).__mro__]
+	metrics = runner.build_metrics.items() if runner.build_metrics is not None else []
+	result = {'tex_path': tex_path, 'success': error is None, 'error': error, 'error_types': error_types, 'duration': time.time() - time_start, 'metrics': metrics}
+	if hashes is not None:
+		result['digest'] = input_digest(full_path, hashes)
+	return result
+
+class BatchRunner(Processor):
+	"""
+	Build several documents on a pool of worker processes.
+	Options (besides those of `Runner`):
+		- jobs: number of worker processes (defaults to the number of processors)
+		- metrics_port: serve the metrics over HTTP on that port while the documents are built
+		- manifest: JSON file in which the status of each document is checkpointed
+		- resume: skip the documents of the manifest which were built from their current sources
+		- retries: number of times a document is built again after a transient failure
+		- retry_delay: waiting time before the first retry, in seconds, doubled at each retry
+		- transient_errors: names of the exceptions considered as transient failures
+		- permanent_errors: names of subclasses of the transient errors which are not transient
+	"""
+
+	defaults = Runner.defaults.copy()
+	defaults.update({
+		'jobs': None,
+		'metrics_port': None,
+		'manifest': None,
+		'resume': False,
+		'retries': 0,
+		'retry_delay': 1.,
+		'transient_errors': ['ResourceLimitExceeded', 'OSError'],
+		'permanent_errors': ['FileNotFoundError', 'PermissionError', 'IsADirectoryError', 'NotADirectoryError'],
+	})
+
+	# checkpoint of the current batch, if any
+	manifest = None
+
+	def schedule(self, tex_paths):
+		"""
+		Order the documents so that the longest builds, according to the history, start first.
+		Documents which were never built are started first, since nothing is known about them.
+		"""
+		if not self.options['history']:
+			return list(tex_paths)
+		history = BuildHistory(self.options['history'])
+		expected = dict((tex_path, history.expected_duration(Runner.paths(tex_path)['full_path'])) for tex_path in tex_paths)
+		return sorted(tex_paths, key=lambda tex_path: (expected[tex_path] is not None, -(expected[tex_path] or 0)))
+
+	def transient(self, result):
+		"""
+		True if the failure of a build may not happen again.
+		The most specific of the transient and permanent error types of the exception decides.
+		"""
+		for error_type in result['error_types']:
+			if error_type in self.options['permanent_errors']:
+				return False
+			if error_type in self.options['transient_errors']:
+				return True
+		return False
+
+	def build_all(self, tex_paths, results):
+		with ProcessPoolExecutor(max_workers=self.options['jobs']) as executor:
+			futures = dict((executor.submit(build, tex_path, self.options), 0) for tex_path in tex_paths)
+			# the retries waiting for their delay, as (time, tex_path, retry), so that they do not hold a worker
+			delayed = []
+			while futures or delayed:
+				now = time.time()
+				for due in [due for due in delayed if due[0] <= now]:
+					delayed.remove(due)
+					futures[executor.submit(build, due[1], self.options)] = due[2]
+				if not futures:
+					time.sleep(min(due[0] for due in delayed) - now)
+					continue
+				timeout = min(due[0] for due in delayed) - now if delayed else None
+				done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+				for future in done:
+					retry = futures.pop(future)
+					result = future.result()
+					self.metrics.merge(result.pop('metrics'))
+					if self.manifest is not None:
+						self.manifest.update(result)
+					if not result['success'] and retry < self.options['retries'] and self.transient(result):
+						delay = self.options['retry_delay'] * 2**retry
+						self.logger.warning('{tex_path}: {error}; retrying in {delay:.1f}s'.format(delay=delay, **result))
+						delayed.append((time.time() + delay, result['tex_path'], retry + 1))
+						continue
+					results.append(result)
+					if result['success']:
+						self.logger.success('{tex_path}: built in {duration:.1f}s'.format(**result))
+					else:
+						self.logger.error('{tex_path}: {error}'.format(**result))
+
+	def checkpoint(self, tex_paths):
+		"""
+		Load the manifest, and return the documents which need to be built.
+		"""
+		if not self.options['manifest']:
+			return tex_paths
+		self.manifest = Manifest(self.options['manifest'])
+		if self.options['resume']:
+			skipped = [tex_path for tex_path in tex_paths if self.manifest.up_to_date(tex_path, input_digest(Runner.paths(tex_path)['full_path']))]
+			if skipped:
+				self.logger.message('Skipping {0} documents already built'.format(len(skipped)))
+			tex_paths = [tex_path for tex_path in tex_paths if tex_path not in skipped]
+		self.manifest.pending(tex_paths)
+		return tex_paths
+
+	def run(self, tex_paths):
+		"""
+		Build all the documents, and raise an error if some of them failed.
+		"""
+		ordered = self.schedule(self.checkpoint(tex_paths))
+		time_start = time.time()
+		results = []
+		self.metrics = Metrics()
+		if self.options['metrics_file']:
+			self.metrics = Metrics.load(self.options['metrics_file'])
+		server = None
+		if self.options['metrics_port'] is not None:
+			server = self.metrics.serve(self.options['metrics_port'])
+		try:
+			self.build_all(ordered, results)
+		finally:
+			if server is not None:
+				server.shutdown()
+				server.server_close()
+		if self.options['metrics_file']:
+			self.metrics.write(self.options['metrics_file'])
+		failed = [result for result in results if not result['success']]
+		self.logger.message('Built {0} documents in {1:.1f}s'.format(len(results), time.time() - time_start))
+		if failed:
+			raise LaTeXError('{0} of {1} documents failed'.format(len(failed), len(results)))
+		return results
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+End-to-end benchmark of the orchestration of pydflatex, with the simulated engine of `pydflatex.simulate`:
+
+	python -m pydflatex.benchmark [--delay SECONDS] [--documents N] [--jobs 1,2,4] [--repeat N]
+
+The delay of the simulated engine is subtracted, so that the results measure the overhead of pydflatex itself.
+The batches are measured by their throughput, which depends on the number of processors.
+"""
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+from argparse import ArgumentParser
+
+from .runner import Runner
+from .batch import BatchRunner
+from . import latex_logger
+
+# the directory containing this package, in which the simulated engine is found
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def engine_command(scenario_path):
+	return [sys.executable, '-m', 'pydflatex.simulate', '--scenario', scenario_path]
+
+class Benchmark(object):
+	"""
+	Documents built with the simulated engine, in a temporary directory.
+	"""
+	def __init__(self, delay=0., documents=8, repeat=5):
+		self.delay = delay
+		self.documents = documents
+		self.repeat = repeat
+		self.directory = tempfile.mkdtemp(prefix='pydflatex-benchmark-')
+		self.tex_paths = []
+		for index in range(documents):
+			tex_path = 'document{0}.tex'.format(index)
+			open(os.path.join(self.directory, tex_path), 'w').close()
+			self.tex_paths.append(tex_path)
+
+	def close(self):
+		shutil.rmtree(self.directory)
+
+	def scenario(self, name, **spec):
+		path = os.path.join(self.directory, name + '.json')
+		with open(path, 'w') as scenario:
+			json.dump(dict(spec, delay=self.delay), scenario)
+		return path
+
+	def reset(self):
+		"""
+		Remove the output files, so that every build starts from scratch.
+		"""
+		for name in os.listdir(self.directory):
+			if os.path.splitext(name)[1] not in ('.tex', '.json'):
+				os.remove(os.path.join(self.directory, name))
+
+	def options(self, scenario_path, **options):
+		return dict(options, engine=engine_command(scenario_path), colour=False)
+
+	def time_builds(self, options, tex_path):
+		"""
+		The durations of `repeat` builds of one document, with the given options.
+		"""
+		durations = []
+		for index in range(self.repeat):
+			self.reset()
+			runner = Runner(logger=latex_logger.silent_logger(), options=options)
+			time_start = time.time()
+			runner.run(tex_path)
+			durations.append(time.time() - time_start)
+		return durations
+
+	def pass_loop(self, reruns=2):
+		"""
+		Builds rerunning the engine until the references are stable: overhead per pass.
+		"""
+		options = self.options(self.scenario('reruns', reruns=reruns), max_passes=reruns + 1)
+		durations = self.time_builds(options, self.tex_paths[0])
+		passes = reruns + 1
+		best = min(durations)
+		return [('pass loop', '{0} passes'.format(passes), best, 1000*(best - passes*self.delay)/passes, 'ms/pass')]
+
+	def stages(self, warnings=5000):
+		"""
+		Builds with a long log, with the post processing stages overlapping the log processing or not.
+		"""
+		rows = []
+		scenario_path = self.scenario('warnings', warnings=warnings)
+		for overlap in [False, True]:
+			options = self.options(scenario_path, overlap_stages=overlap, open_after=False)
+			best = min(self.time_builds(options, self.tex_paths[0]))
+			rows.append(('stages', 'overlap' if overlap else 'sequential', best, 1000*(best - self.delay), 'ms'))
+		return rows
+
+	def batch(self, jobs=(1, 2, 4)):
+		"""
+		Batches of documents on pools of increasing size: throughput.
+		"""
+		rows = []
+		scenario_path = self.scenario('batch')
+		for count in jobs:
+			self.reset()
+			runner = BatchRunner(logger=latex_logger.silent_logger(), options=self.options(scenario_path, jobs=count))
+			time_start = time.time()
+			runner.run(self.tex_paths)
+			duration = time.time() - time_start
+			rows.append(('batch', '{0} jobs'.format(count), duration, self.documents/duration, 'documents/s'))
+		return rows
+
+	def run(self, jobs=(1, 2, 4)):
+		cwd = os.getcwd()
+		python_path = os.environ.get('PYTHONPATH')
+		# the workers of the batches log to the standard handler
+		level = latex_logger.std_handler.level
+		latex_logger.std_handler.setLevel(logging.CRITICAL + 1)
+		os.chdir(self.directory)
+		# the simulated engine runs in the directory of the documents, with this package
+		os.environ['PYTHONPATH'] = os.pathsep.join([package_directory] + ([python_path] if python_path else []))
+		try:
+			return self.pass_loop() + self.stages() + self.batch(jobs)
+		finally:
+			os.chdir(cwd)
+			latex_logger.std_handler.setLevel(level)
+			if python_path is None:
+				del os.environ['PYTHONPATH']
+			else:
+				os.environ['PYTHONPATH'] = python_path
+
+def report(rows):
+	lines = ['{0:<10} {1:<12} {2:>10} {3:>24}'.format('benchmark', 'setting', 'time (s)', 'overhead or throughput')]
+	for name, setting, duration, value, unit in rows:
+		lines.append('{0:<10} {1:<12} {2:>10.3f} {3:>12.1f} {4}'.format(name, setting, duration, value, unit))
+	return '\n'.join(lines)
+
+def main(arguments):
+	parser = ArgumentParser(description='Benchmark the orchestration of pydflatex with a simulated engine.')
+	parser.add_argument('--delay', type=float, default=0., help='duration of each run of the simulated engine, in seconds')
+	parser.add_argument('--documents', type=int, default=8, help='number of documents of the batches')
+	parser.add_argument('--jobs', type=lambda jobs: [int(count) for count in jobs.split(',')], default=[1, 2, 4], help='sizes of the pools building the batches (comma separated)')
+	parser.add_argument('--repeat', type=int, default=5, help='number of builds, of which the fastest is kept')
+	args = parser.parse_args(arguments)
+	benchmark = Benchmark(args.delay, args.documents, args.repeat)
+	try:
+		print(report(benchmark.run(args.jobs)))
+	finally:
+		benchmark.close()
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
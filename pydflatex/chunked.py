@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+from .latexlogparser import LogCheck
+
+class Outer(object):
+	"""
+	Placeholder, in the result of a chunk, for a value which is only known at the end of the preceding chunks:
+	the file `depth` levels below the top of the file stack, the last file read or the current page.
+	"""
+	def __init__(self, name, depth=0):
+		self.name = name
+		self.depth = depth
+
+	def resolve(self, state):
+		if self.name == 'pos':
+			if self.depth >= len(state['pos']):
+				raise IndexError("File stack underflow")
+			return state['pos'][-1-self.depth]
+		return state[self.name]
+
+class Either(object):
+	"""
+	Placeholder for the top of the file stack, or the last file read if the stack contains no file.
+	"""
+	def __init__(self, top, last):
+		self.top = top
+		self.last = last
+
+	def resolve(self, state):
+		top = resolve(self.top, state)
+		if top is None:
+			return resolve(self.last, state)
+		return top
+
+def resolve(value, state):
+	if isinstance(value, (Outer, Either)):
+		return value.resolve(state)
+	return value
+
+def resolve_message(message, state):
+	for key, value in message.items():
+		if isinstance(value, (Outer, Either)):
+			message[key] = value.resolve(state)
+	return message
+
+class ChunkStack(list):
+	"""
+	File stack of a chunk, which records how many of the files opened before the chunk were closed.
+	"""
+	def __init__(self):
+		list.__init__(self)
+		self.popped = 0
+
+	def __getitem__(self, index):
+		if not len(self):
+			return Outer('pos', self.popped)
+		return list.__getitem__(self, index)
+
+	def __delitem__(self, index):
+		if not len(self):
+			self.popped += 1
+		else:
+			list.__delitem__(self, index)
+
+class ChunkLogCheck(LogCheck):
+	"""
+	Parser for a chunk of log which starts right after a blank line.
+	"""
+	def initial_state(self):
+		state = LogCheck.initial_state(self)
+		state.update(last_file=Outer('last_file'), pos=ChunkStack(), page=Outer('page'))
+		return state
+
+	def current_file(self, stack, last):
+		top = stack[-1]
+		if isinstance(top, Outer):
+			return Either(top, last)
+		return LogCheck.current_file(self, stack, last)
+
+# lines of the log, in the worker processes
+_lines = None
+
+def _set_lines(lines):
+	global _lines
+	_lines = lines
+
+def parse_chunk(start, end, flags, filters, wide=False):
+	"""
+	Parse a chunk of the log, assuming that the parser is not in the middle of a message at its beginning.
+	This runs in a worker process.
+	"""
+	parser = ChunkLogCheck(wide)
+	state = parser.initial_state()
+	messages = list(parser.parse(filters=filters, lines=_lines[start:end], state=state, **flags))
+	pos = state['pos']
+	state['pos'] = list(pos)
+	state['popped'] = pos.popped
+	return messages, state
+
+class ChunkedLogCheck(LogCheck):
+	"""
+	Parse very large logs by splitting them at blank lines and parsing the chunks on a process pool.
+	Each chunk is parsed as if it started in a neutral state, with placeholders for the file stack,
+	the last file and the page inherited from the preceding chunks.
+	The results are then reconciled in order, so that they are identical to those of a sequential parse:
+	a chunk is parsed again sequentially if the preceding one did not actually end in a neutral state.
+	"""
+	neutral = {'parsing': False, 'skipping': False, 'prefix': None, 'accu': ''}
+
+	def __init__(self, jobs=None, chunk_lines=50000, min_lines=200000, wide=False):
+		LogCheck.__init__(self, wide)
+		self.jobs = jobs
+		self.chunk_lines = chunk_lines
+		self.min_lines = min_lines
+		self.executor = None
+		self.chunks = None
+
+	def split(self):
+		"""
+		Split the lines into chunks starting right after a blank line which is not a continuation.
+		"""
+		lines = self.lines
+		bounds = [0]
+		index = self.chunk_lines
+		while index < len(lines):
+			if index >= 2 and lines[index-1][:-1] == '' and (self.wide or not self.continued(lines[index-2][:-1])):
+				bounds.append(index)
+				index += self.chunk_lines
+			else:
+				index += 1
+		bounds.append(len(lines))
+		return list(zip(bounds[:-1], bounds[1:]))
+
+	def pool(self):
+		if self.executor is None:
+			self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_set_lines, initargs=(self.lines,))
+		return self.executor
+
+	def close(self):
+		if self.executor is not None:
+			self.executor.shutdown()
+			self.executor = None
+
+	def parse(self, errors=False, boxes=False, refs=False, warnings=False, filters=None):
+		flags = {'errors': errors, 'boxes': boxes, 'refs': refs, 'warnings': warnings}
+		if not self.lines or len(self.lines) < self.min_lines:
+			return LogCheck.parse(self, filters=filters, **flags)
+		kinds = [kind for kind, flag in [('box', boxes), ('ref', refs), ('warning', warnings)] if flag]
+		post_filters = None
+		if filters is not None and filters.uses_files():
+			# the files are only known after reconciliation
+			if len(kinds) != 1:
+				return LogCheck.parse(self, filters=filters, **flags)
+			post_filters, filters = filters, None
+		if self.chunks is None:
+			self.chunks = self.split()
+		futures = [self.pool().submit(parse_chunk, start, end, flags, filters, self.wide) for start, end in self.chunks]
+		results = self.reconcile(futures, flags, filters)
+		if post_filters is not None:
+			kind, = kinds
+			results = [message for message in results if message['kind'] == 'error' or not post_filters.suppressed(kind, message['text'], message.get('pkg'), message.get('file'))]
+		return iter(results)
+
+	def reconcile(self, futures, flags, filters):
+		state = self.initial_state()
+		results = []
+		for (start, end), future in zip(self.chunks, futures):
+			messages, end_state = future.result()
+			if all(state[key] == value for key, value in self.neutral.items()):
+				try:
+					resolved = [resolve_message(message, state) for message in messages]
+					state = self.resolve_state(state, end_state)
+				except IndexError:
+					pass
+				else:
+					results.extend(resolved)
+					continue
+			# the chunk does not start in a neutral state: parse it again
+			state = copy.deepcopy(state)
+			results.extend(LogCheck.parse(self, filters=filters, lines=self.lines[start:end], state=state, **flags))
+		return results
+
+	def resolve_state(self, state, end_state):
+		"""
+		The state at the end of a chunk, from the state at its beginning.
+		"""
+		popped = end_state.pop('popped')
+		if popped > len(state['pos']):
+			raise IndexError("File stack underflow")
+		pos = state['pos'][:len(state['pos'])-popped] + end_state['pos']
+		new_state = dict(end_state)
+		new_state.update(pos=pos, last_file=resolve(end_state['last_file'], state), page=resolve(end_state['page'], state))
+		if new_state['info'] is not None:
+			new_state['info'] = resolve_message(dict(new_state['info']), state)
+		return new_state
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import io
+import gzip
+import shutil
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from .processor import LaTeXError
+from .files import atomic_write
+
+# the supported compression methods, by extension
+methods = ('gz', 'zst')
+
+def method(path):
+	"""
+	The compression method of a file, from its extension, or None.
+	"""
+	extension = os.path.splitext(path)[1][1:]
+	if extension in methods:
+		return extension
+	return None
+
+def require(method):
+	if method == 'zst' and zstandard is None:
+		raise LaTeXError('The zstandard module is needed for .zst logs')
+	if method not in methods:
+		raise LaTeXError('Unknown compression method: {0}'.format(method))
+
+def open_binary(path, mode='rb', compression=None):
+	"""
+	Open a file, compressed with the given method, or with that of its extension.
+	The file may also be given as a binary file object, with the compression method.
+	"""
+	if compression is None and hasattr(path, 'write'):
+		return path
+	compression = compression or method(path)
+	if compression is None:
+		return io.open(path, mode)
+	require(compression)
+	if compression == 'gz':
+		return gzip.open(path, mode)
+	return zstandard.open(path, mode)
+
+def open_text(path):
+	"""
+	Open a log for reading, decompressing it on the fly if needed.
+	"""
+	return io.TextIOWrapper(open_binary(path), encoding='utf-8', errors='replace')
+
+def find_log(log_file_path, compressed=True):
+	"""
+	The log itself if it exists, otherwise its compressed version, if any and if `compressed` is true.
+	"""
+	if os.path.exists(log_file_path) or not compressed:
+		return log_file_path
+	for compression in methods:
+		compressed = log_file_path + os.path.extsep + compression
+		if os.path.exists(compressed):
+			return compressed
+	return log_file_path
+
+def compress(path, compression):
+	"""
+	Replace a file by its compressed version, and return the path of the latter.
+	"""
+	require(compression)
+	compressed = path + os.path.extsep + compression
+	with io.open(path, 'rb') as source:
+		with atomic_write(compressed, 'wb') as output:
+			with open_binary(output, 'wb', compression) as target:
+				shutil.copyfileobj(source, target)
+	os.remove(path)
+	return compressed
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from .result import to_int
+
+class LineIndex(object):
+	"""
+	The offsets of the lines of one version of a source file.
+	The offsets are only searched as far as the lines asked for.
+	The file is read at once rather than memory-mapped, since it may be truncated while it is indexed.
+	"""
+	def __init__(self, path):
+		with open(path, 'rb') as source:
+			self.data = source.read()
+		# start of each line found so far
+		self.offsets = [0]
+		self.complete = not self.data
+
+	def extend(self, number):
+		"""
+		Find the lines up to the given one.
+		"""
+		offsets = self.offsets
+		find = self.data.find
+		while len(offsets) <= number and not self.complete:
+			position = find(b'\n', offsets[-1])
+			if position == -1 or position + 1 == len(self.data):
+				self.complete = True
+			else:
+				offsets.append(position + 1)
+
+	def lines(self, first, last):
+		"""
+		The lines from `first` to `last` (numbered from one) which exist, as a list of [number, text] pairs.
+		"""
+		self.extend(last)
+		lines = []
+		for number in range(max(first, 1), min(last, len(self.offsets)) + 1):
+			start = self.offsets[number - 1]
+			end = self.offsets[number] if number < len(self.offsets) else len(self.data)
+			lines.append([number, self.data[start:end].decode('utf-8', 'replace').rstrip('\r\n')])
+		return lines
+
+class SourceIndex(object):
+	"""
+	Line indexes of the source files, kept for the most recently used files,
+	and rebuilt when a file changes, so that they may be reused by the messages of several builds.
+	"""
+	def __init__(self, size=64):
+		self.size = size
+		self.indexes = OrderedDict()
+		self.lock = threading.Lock()
+
+	def index(self, path, versions=None):
+		"""
+		The `LineIndex` of the current version of a file, or None if it cannot be read.
+		The versions of the files, by path, are taken from the dictionary `versions`, if given, and stored in it,
+		so that each file is only checked once, e.g., during a build.
+		"""
+		key = os.path.abspath(path)
+		if versions is not None and key in versions:
+			version = versions[key]
+		else:
+			try:
+				info = os.stat(path)
+			except OSError:
+				info = None
+			version = (info.st_mtime, info.st_size) if info is not None and stat.S_ISREG(info.st_mode) else None
+			if versions is not None:
+				versions[key] = version
+		if version is None:
+			return None
+		cached = self.indexes.pop(key, None)
+		if cached is None or cached[0] != version:
+			try:
+				cached = (version, LineIndex(path))
+			except (IOError, OSError, ValueError):
+				return None
+		self.indexes[key] = cached
+		while len(self.indexes) > self.size:
+			self.indexes.popitem(last=False)
+		return cached[1]
+
+	def context(self, path, line, lines=2, versions=None):
+		"""
+		The source lines from `lines` lines before `line` to `lines` lines after it, or None if unknown.
+		See `index` for `versions`.
+		"""
+		line = to_int(line)
+		if not path or line is None:
+			return None
+		with self.lock:
+			index = self.index(path, versions)
+			if index is None:
+				return None
+			return index.lines(line - lines, line + lines) or None
+
+# shared by all the builds of the process
+source_index = SourceIndex()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import json
+import time
+import base64
+import shutil
+import socket
+import struct
+import hmac
+import fnmatch
+import hashlib
+import tempfile
+import threading
+try:
+	import queue
+except ImportError: # Python 2
+	import Queue as queue
+
+from .processor import Processor, LaTeXError
+from .runner import Runner
+from .result import BuildResult, Message
+from .manifest import local_inputs, source_digest
+from .files import atomic_write
+
+# Protocol: each message is a JSON object, preceded by its length as a 4 byte big endian integer.
+# worker -> coordinator: {'type': 'challenge', 'nonce'}
+# coordinator -> worker: {'type': 'auth', 'digest': HMAC-SHA256 of the nonce with the shared secret}
+# coordinator -> worker: {'type': 'job', 'tex_path', 'tree': {path: hash}, 'options'}
+# worker -> coordinator: {'type': 'need', 'hashes': [hash, ...]}
+# coordinator -> worker: {'type': 'blobs', 'blobs': {hash: base64 content}}
+# worker -> coordinator: {'type': 'result', 'result': BuildResult.to_dict(), 'pdf': base64 content or None}
+
+header = struct.Struct('>I')
+
+def send(sock, message):
+	data = json.dumps(message).encode('utf-8')
+	sock.sendall(header.pack(len(data)) + data)
+
+def receive_exactly(sock, size):
+	chunks = []
+	while size:
+		chunk = sock.recv(min(size, 1 << 20))
+		if not chunk:
+			raise EOFError('Connection closed')
+		chunks.append(chunk)
+		size -= len(chunk)
+	return b''.join(chunks)
+
+def receive(sock):
+	size, = header.unpack(receive_exactly(sock, header.size))
+	return json.loads(receive_exactly(sock, size).decode('utf-8'))
+
+def encode(data):
+	return base64.b64encode(data).decode('ascii')
+
+def decode(text):
+	return base64.b64decode(text.encode('ascii'))
+
+def content_hash(data):
+	return hashlib.sha256(data).hexdigest()
+
+def safe_path(directory, relative):
+	"""
+	The path of a file of a job in `directory`: the relative path must not lead out of it.
+	"""
+	if not relative or os.path.isabs(relative) or '\\' in relative:
+		raise ValueError('Invalid path {0!r}'.format(relative))
+	path = os.path.normpath(os.path.join(directory, *relative.split('/')))
+	if os.path.commonprefix([path, os.path.normpath(directory) + os.path.sep]) != os.path.normpath(directory) + os.path.sep:
+		raise ValueError('Invalid path {0!r}'.format(relative))
+	return path
+
+def authentication(secret, nonce):
+	return hmac.new(secret.encode('utf-8'), nonce.encode('ascii'), hashlib.sha256).hexdigest()
+
+def default_secret():
+	return os.environ.get('PYDFLATEX_SECRET', '')
+
+# the files written by pydflatex, which are not sources
+output_patterns = ['*.pdf', '*.log', '*.log.*', '*.fls', '*.includes', '*.fingerprints']
+
+def cached_digest(path, hashes):
+	"""
+	The content hash of a file, kept in the dictionary `hashes`.
+	"""
+	path = os.path.abspath(path)
+	if path not in hashes:
+		hashes[path] = source_digest(path)
+	return hashes[path]
+
+def source_tree(base, excluded=(), hashes=None):
+	"""
+	The files of the directory `base`, except the hidden ones and those matching the patterns `excluded`,
+	as a dictionary mapping their relative path to their content hash.
+	The hashes are kept in the dictionary `hashes`, if given.
+	"""
+	hashes = {} if hashes is None else hashes
+	tree = {}
+	for directory, directories, files in os.walk(base or os.curdir):
+		directories[:] = [name for name in directories if not name.startswith('.')]
+		for name in files:
+			if name.startswith('.') or any(fnmatch.fnmatch(name, pattern) for pattern in excluded):
+				continue
+			path = os.path.join(directory, name)
+			digest = cached_digest(path, hashes)
+			if digest is not None:
+				tree[os.path.relpath(path, base or os.curdir).replace(os.path.sep, '/')] = digest
+	return tree
+
+def recorded_tree(tex_path, fls_file, hashes=None):
+	"""
+	The sources of a document recorded in the .fls file of its last build (see `pydflatex.manifest.local_inputs`),
+	in the directory of the document, as a dictionary mapping their relative path to their content hash.
+	"""
+	hashes = {} if hashes is None else hashes
+	tree = {}
+	for relative, path in local_inputs(tex_path, fls_file):
+		if relative.split(os.path.sep)[0] == os.path.pardir:
+			continue
+		digest = cached_digest(path, hashes)
+		if digest is not None:
+			tree[relative.replace(os.path.sep, '/')] = digest
+	return tree
+
+class BlobStore(object):
+	"""
+	Files stored by content hash, so that the files shared by several documents are only transferred once.
+	"""
+	def __init__(self, directory):
+		self.directory = directory
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+	def path(self, digest):
+		return os.path.join(self.directory, digest)
+
+	def missing(self, hashes):
+		return sorted(set(digest for digest in hashes if not os.path.exists(self.path(digest))))
+
+	def put(self, digest, data):
+		if content_hash(data) != digest:
+			raise ValueError('Corrupted blob {0}'.format(digest))
+		with atomic_write(self.path(digest), 'wb') as blob:
+			blob.write(data)
+
+	def materialize(self, tree, directory):
+		"""
+		Copy the files of a source tree into `directory`.
+		"""
+		for relative, digest in tree.items():
+			path = safe_path(directory, relative)
+			if not os.path.isdir(os.path.dirname(path)):
+				os.makedirs(os.path.dirname(path))
+			shutil.copyfile(self.path(digest), path)
+
+class Worker(Processor):
+	"""
+	Build the documents sent by a coordinator with `Runner`, one at a time.
+	The coordinators must know the shared secret, and the jobs may only set the options of `job_options`.
+	Options:
+		- store: directory of the blob store (a temporary directory by default)
+		- secret: shared secret of the workers and coordinators (by default, the environment variable PYDFLATEX_SECRET)
+	"""
+
+	defaults = Processor.defaults.copy()
+	defaults.update({
+		'store': None,
+		'secret': None,
+	})
+
+	# the options of `Runner` which a job may set: none of them names a file or a command of the worker
+	job_options = frozenset([
+		'halt_on_errors', 'xetex', 'wide_lines', 'timeout', 'cpu_limit', 'memory_limit', 'file_size_limit',
+		'max_passes', 'suppress_box_warning', 'warning_filters', 'aggregate_warnings', 'parse_jobs',
+		'quick_errors', 'source_context', 'fast_preview', 'externalize', 'convert_graphics',
+		])
+
+	def __init__(self, logger=None, options=None):
+		Processor.__init__(self, logger, options)
+		self.store = BlobStore(self.options['store'] or tempfile.mkdtemp(prefix='pydflatex-store-'))
+
+	def build(self, job):
+		"""
+		Build a job whose sources are all in the store, in a fresh directory.
+		"""
+		directory = tempfile.mkdtemp(prefix='pydflatex-job-')
+		cwd = os.getcwd()
+		try:
+			tex_path = job['tex_path']
+			safe_path(directory, tex_path)
+			self.store.materialize(job['tree'], directory)
+			# the engine writes its output in the current directory
+			os.chdir(directory)
+			runner = Runner(logger=self.logger, options=self.options_of(job))
+			try:
+				result = runner.build(tex_path)
+			except Exception as e:
+				result = BuildResult(tex_path, messages=[Message('abort', '{0}: {1}'.format(type(e).__name__, e))])
+			pdf = None
+			if result.pdf_path is not None and os.path.exists(result.pdf_path):
+				with open(result.pdf_path, 'rb') as pdf_file:
+					pdf = encode(pdf_file.read())
+			message = {'type': 'result', 'result': result.to_dict(), 'pdf': pdf}
+		finally:
+			os.chdir(cwd)
+			shutil.rmtree(directory, ignore_errors=True)
+		return message
+
+	def options_of(self, job):
+		"""
+		The options of the job which it may set.
+		"""
+		options = job.get('options') or {}
+		ignored = sorted(key for key in options if key not in self.job_options)
+		if ignored:
+			self.logger.debug('Ignored options: {0}'.format(', '.join(ignored)))
+		return dict((key, value) for key, value in options.items() if key in self.job_options)
+
+	def secret(self):
+		return self.options['secret'] if self.options['secret'] is not None else default_secret()
+
+	def authenticate(self, connection):
+		"""
+		Check that the coordinator knows the secret.
+		"""
+		nonce = encode(os.urandom(32))
+		send(connection, {'type': 'challenge', 'nonce': nonce})
+		answer = receive(connection)
+		if answer.get('type') != 'auth' or not hmac.compare_digest(str(answer.get('digest', '')), authentication(self.secret(), nonce)):
+			raise ValueError('Authentication failed')
+
+	def handle(self, connection):
+		self.authenticate(connection)
+		while True:
+			try:
+				job = receive(connection)
+			except EOFError:
+				return
+			send(connection, {'type': 'need', 'hashes': self.store.missing(job['tree'].values())})
+			blobs = receive(connection)
+			for digest, data in blobs['blobs'].items():
+				self.store.put(digest, decode(data))
+			self.logger.message('Building {0}'.format(job['tex_path']))
+			send(connection, self.build(job))
+
+	def serve(self, port=0, host='127.0.0.1', ready=None):
+		"""
+		Serve the coordinators one after the other.
+		Only local coordinators are served unless another `host` is given, which requires a secret.
+		`ready` is called with the port, once the worker listens.
+		"""
+		if host not in ('127.0.0.1', 'localhost') and not self.secret():
+			raise LaTeXError('A secret is needed to serve on {0}'.format(host or 'all interfaces'))
+		server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		server.bind((host, port))
+		server.listen(5)
+		port = server.getsockname()[1]
+		self.logger.message('Worker listening on port {0}'.format(port))
+		if ready is not None:
+			ready(port)
+		try:
+			while True:
+				connection, address = server.accept()
+				try:
+					self.handle(connection)
+				except (socket.error, EOFError, ValueError) as e:
+					self.logger.error('{0}: {1}'.format(address, e))
+				finally:
+					connection.close()
+		finally:
+			server.close()
+
+class Coordinator(Processor):
+	"""
+	Build several documents on remote workers, each building one document at a time.
+	The sources are shipped by content hash, and the pdf files and diagnostics are sent back.
+	Options (besides those of `Runner`, which are sent to the workers):
+		- workers: list of 'host:port' addresses of the workers
+		- secret: shared secret of the workers and coordinators (by default, the environment variable PYDFLATEX_SECRET)
+	"""
+
+	defaults = Runner.defaults.copy()
+	defaults.update({
+		'workers': [],
+		'secret': None,
+	})
+
+	def __init__(self, logger=None, options=None):
+		Processor.__init__(self, logger, options)
+		self.lock = threading.Lock()
+		# content hashes of the files, and trees of the directories, during a run
+		self.hashes = {}
+		self.trees = {}
+
+	def excluded(self):
+		"""
+		The patterns of the files which are not sent: the outputs of pydflatex, and its history.
+		"""
+		return output_patterns + [os.path.basename(self.options[name]) for name in ['history', 'metrics_file'] if self.options[name]]
+
+	def tree(self, paths):
+		"""
+		The sources of a document: those recorded by its last build, or else the files of its directory.
+		"""
+		base = paths['base'] or os.curdir
+		fls_file = paths['root'] + os.path.extsep + 'fls'
+		with self.lock:
+			if os.path.exists(fls_file):
+				return recorded_tree(paths['full_path'], fls_file, self.hashes)
+			key = os.path.abspath(base)
+			if key not in self.trees:
+				self.trees[key] = source_tree(base, self.excluded(), self.hashes)
+			return self.trees[key]
+
+	def job(self, tex_path):
+		paths = Runner.paths(tex_path)
+		tree = self.tree(paths)
+		options = dict((key, value) for key, value in self.options.items() if key in Worker.job_options)
+		return {'type': 'job', 'tex_path': os.path.basename(paths['full_path']), 'tree': tree, 'options': options}
+
+	def authenticate(self, connection):
+		challenge = receive(connection)
+		if challenge.get('type') != 'challenge':
+			raise ValueError('Unexpected message {0}'.format(challenge.get('type')))
+		secret = self.options['secret'] if self.options['secret'] is not None else default_secret()
+		send(connection, {'type': 'auth', 'digest': authentication(secret, challenge['nonce'])})
+
+	def send_job(self, connection, tex_path):
+		"""
+		Build one document on a worker, and return its `BuildResult`.
+		"""
+		job = self.job(tex_path)
+		send(connection, job)
+		need = receive(connection)
+		paths = Runner.paths(tex_path)
+		base = paths['base'] or os.curdir
+		hashes = set(need['hashes'])
+		blobs = {}
+		for relative, digest in job['tree'].items():
+			if digest in hashes and digest not in blobs:
+				with open(os.path.join(base, *relative.split('/')), 'rb') as source:
+					blobs[digest] = encode(source.read())
+		send(connection, {'type': 'blobs', 'blobs': blobs})
+		answer = receive(connection)
+		result = BuildResult.from_dict(answer['result'])
+		result.tex_path = paths['full_path']
+		result.pdf_path = None
+		if answer['pdf'] is not None:
+			result.pdf_path = paths['root'] + os.path.extsep + 'pdf'
+			with open(result.pdf_path, 'wb') as pdf_file:
+				pdf_file.write(decode(answer['pdf']))
+		return result
+
+	def serve_worker(self, address, jobs, results):
+		"""
+		Send jobs to one worker until there are none left, or the worker fails.
+		"""
+		host, port = address.rsplit(':', 1)
+		try:
+			connection = socket.create_connection((host, int(port)))
+		except socket.error as e:
+			self.logger.error('Worker {0}: {1}'.format(address, e))
+			return
+		try:
+			try:
+				self.authenticate(connection)
+			except (socket.error, EOFError, ValueError) as e:
+				self.logger.error('Worker {0}: {1}'.format(address, e))
+				return
+			while True:
+				try:
+					tex_path = jobs.get_nowait()
+				except queue.Empty:
+					return
+				time_start = time.time()
+				try:
+					result = self.send_job(connection, tex_path)
+				except (socket.error, EOFError, ValueError) as e:
+					# another worker will build it
+					jobs.put(tex_path)
+					self.logger.error('Worker {0}: {1}'.format(address, e))
+					return
+				results.put((address, result, time.time() - time_start))
+		finally:
+			connection.close()
+
+	def report(self, address, result, duration):
+		if result.success:
+			self.logger.success('{0}: built in {1:.1f}s on {2}'.format(result.tex_path, duration, address))
+		else:
+			self.logger.error('{0}: failed on {1}'.format(result.tex_path, address))
+			for message in result.errors:
+				message.render(self.logger)
+
+	def run(self, tex_paths):
+		"""
+		Build all the documents on the workers, and raise an error if some of them failed.
+		Return the list of `BuildResult`.
+		"""
+		if not self.options['workers']:
+			raise LaTeXError('No worker given')
+		self.hashes = {}
+		self.trees = {}
+		jobs = queue.Queue()
+		for tex_path in tex_paths:
+			jobs.put(tex_path)
+		results = queue.Queue()
+		threads = [threading.Thread(target=self.serve_worker, args=(address, jobs, results)) for address in self.options['workers']]
+		for thread in threads:
+			thread.start()
+		built = []
+		while len(built) < len(tex_paths) and (any(thread.is_alive() for thread in threads) or not results.empty()):
+			try:
+				address, result, duration = results.get(timeout=.1)
+			except queue.Empty:
+				continue
+			self.report(address, result, duration)
+			built.append(result)
+		for thread in threads:
+			thread.join()
+		if len(built) < len(tex_paths):
+			raise LaTeXError('{0} documents could not be sent to any worker'.format(len(tex_paths) - len(built)))
+		failed = [result for result in built if not result.success]
+		if failed:
+			raise LaTeXError('{0} of {1} documents failed'.format(len(failed), len(built)))
+		return built
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .processor import Processor
+from .typesetter import Typesetter
+from .log_processor import LogProcessor
+from .result import Message
+from . import latex_logger
+
+def figure_list(file_base):
+	"""
+	The names of the figures listed by the TikZ external library in `list and make` mode.
+	"""
+	try:
+		with open(file_base + os.path.extsep + 'figlist') as figlist:
+			return [line.strip() for line in figlist if line.strip()]
+	except (IOError, OSError):
+		return []
+
+def stale(name):
+	"""
+	True if the pdf of the figure is missing, or older than the checksum of its code.
+	"""
+	try:
+		pdf_time = os.path.getmtime(name + os.path.extsep + 'pdf')
+	except OSError:
+		return True
+	try:
+		return os.path.getmtime(name + os.path.extsep + 'md5') > pdf_time
+	except OSError:
+		return False
+
+def build_figure(name, full_path, file_base, preamble, options):
+	"""
+	Typeset one figure, and return the violation of a resource limit, if any, and the errors in its log.
+	This runs in a worker process.
+	"""
+	logger = latex_logger.silent_logger()
+	typesetter = Typesetter(logger=logger, options=options)
+	preamble = (preamble or '') + '\\def\\tikzexternalrealjob{{{0}}}'.format(file_base)
+	violation = typesetter.typeset(full_path, preamble, jobname=name)
+	log_processor = LogProcessor(logger=logger, options=options)
+	try:
+		messages = log_processor.collect_log(name + os.path.extsep + 'log')
+	except (IOError, OSError, ValueError) as e:
+		messages = [Message('error', str(e), file=name)]
+	errors = [message.to_dict() for message in messages if message.kind in ('error', 'abort')]
+	return violation, errors
+
+class FigureBuilder(Processor):
+	"""
+	Compile the externalized TikZ figures of a document on a pool of worker processes,
+	with the same engine arguments as the document.
+	The errors of the figures are reported, and kept in `messages`.
+	Options:
+		- figure_jobs: number of worker processes (defaults to the number of processors)
+	"""
+
+	defaults = Processor.defaults.copy()
+	defaults.update({
+		'figure_jobs': None,
+	})
+
+	# the options of the log processing which apply to the figures, besides those of the engine
+	log_options = frozenset(['wide_lines', 'parse_jobs', 'source_context'])
+
+	def figure_options(self):
+		"""
+		The options of the figure builds: those of the engine and of the parsing of the errors,
+		but not those updating the files of the document build (fingerprints, history, metrics).
+		"""
+		options = dict((key, value) for key, value in self.options.items() if key in Typesetter.defaults or key in self.log_options)
+		# a missing log is that of a failed figure, not of a previous build
+		options['compressed_fallback'] = False
+		return options
+
+	def build(self, full_path, file_base, preamble=None):
+		"""
+		Compile the stale figures, report their errors, and return the number of figures compiled.
+		"""
+		self.messages = []
+		names = [name for name in figure_list(file_base) if stale(name)]
+		if not names:
+			return 0
+		self.logger.message('Compiling {0} figures'.format(len(names)))
+		typesetter = Typesetter(logger=self.logger, options=self.options)
+		options = self.figure_options()
+		with ProcessPoolExecutor(max_workers=self.options['figure_jobs']) as executor:
+			futures = [(name, executor.submit(build_figure, name, full_path, file_base, preamble, options)) for name in names]
+			for name, future in futures:
+				violation, errors = future.result()
+				if violation is not None:
+					message = Message('error', 'Figure {0}: {1}'.format(name, typesetter.violation_message(violation)), file=name)
+					message.render(self.logger)
+					self.messages.append(message)
+				elif errors:
+					self.logger.error('Figure {0} failed'.format(name))
+				for error in errors:
+					message = Message.from_dict(error)
+					message.render(self.logger)
+					self.messages.append(message)
+		return len(names)
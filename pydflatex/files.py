@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Helpers for the files shared by concurrent builds: locks, atomic writes and content hashes.
+"""
+from __future__ import division
+
+import os
+import hashlib
+import tempfile
+from contextlib import contextmanager
+try:
+	import fcntl
+except ImportError: # not available on Windows
+	fcntl = None
+
+@contextmanager
+def file_lock(path):
+	"""
+	Hold an exclusive lock on a file: only one process, or thread, holds it at a time.
+	"""
+	with open(path, 'a') as lock_file:
+		if fcntl is not None:
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			if fcntl is not None:
+				fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def atomic_write(path, mode='w'):
+	"""
+	Open a temporary file, which replaces the file `path` once written, so that it is never read partially written.
+	The temporary file is unique, so that concurrent writers do not mix their contents, and removed on failure.
+	"""
+	descriptor, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + os.path.extsep, suffix=os.path.extsep + 'tmp', dir=os.path.dirname(path) or os.curdir)
+	try:
+		# readable by others, as a file created by open
+		os.chmod(tmp_path, 0o644)
+		with os.fdopen(descriptor, mode) as output:
+			yield output
+		os.rename(tmp_path, path)
+	except BaseException:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+def file_digest(path):
+	"""
+	The SHA-256 digest of the content of a file, in hexadecimal.
+	"""
+	digest = hashlib.sha256()
+	with open(path, 'rb') as source:
+		for block in iter(lambda: source.read(1 << 16), b''):
+			digest.update(block)
+	return digest.hexdigest()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import re
+import fnmatch
+
+# the kinds of messages that may be filtered out
+kinds = ('box', 'ref', 'warning')
+
+# warnings that we never want to see
+default_rules = [
+	# I hate those hyperref warnings
+	{'kind': 'warning', 'pkg': 'hyperref', 'text': 'Token'},
+	# warning from the nag package
+	{'kind': 'warning', 'text': r'^Command \\centerline is TeX\.  Use \\centering or center environment instead\.$'},
+	]
+
+class FilterRule(object):
+	"""
+	A rule matching some of the messages found by the log parser.
+	A message matches if it matches all the given criteria:
+		- kind: 'box', 'ref' or 'warning'
+		- pkg: the package issuing the warning
+		- text: a regular expression searched for in the text
+		- file: a glob pattern matched against the file (or its base name)
+	"""
+	def __init__(self, kind=None, pkg=None, text=None, file=None):
+		if kind is not None and kind not in kinds:
+			raise ValueError("Unknown message kind: {0}".format(kind))
+		self.kind = kind
+		self.pkg = pkg
+		self.text = None
+		if text is not None:
+			self.text = re.compile(text)
+		self.file = None
+		if file is not None:
+			self.file = re.compile(fnmatch.translate(file))
+
+	def general(self):
+		"""
+		True if the rule matches every message of its kind.
+		"""
+		return self.pkg is None and self.text is None and self.file is None
+
+	def matches(self, text, pkg=None, file=None):
+		"""
+		Check the criteria other than the kind.
+		"""
+		if self.pkg is not None and pkg != self.pkg:
+			return False
+		if self.file is not None:
+			if file is None:
+				return False
+			if not (self.file.match(file) or self.file.match(os.path.basename(file))):
+				return False
+		if self.text is not None and not self.text.search(text):
+			return False
+		return True
+
+class MessageFilter(object):
+	"""
+	A set of filter rules, compiled once and evaluated by the log parser before the messages are built.
+	Rules are either `FilterRule` instances or dictionaries of arguments to `FilterRule`.
+	"""
+	def __init__(self, rules=()):
+		self.rules = [rule if isinstance(rule, FilterRule) else FilterRule(**rule) for rule in rules]
+		self.rules_by_kind = dict((kind, [rule for rule in self.rules if rule.kind in (None, kind)]) for kind in kinds)
+
+	def uses_files(self):
+		"""
+		True if some rule depends on the file of the message.
+		"""
+		return any(rule.file is not None for rule in self.rules)
+
+	def suppresses_all(self, kind):
+		"""
+		True if all the messages of that kind are suppressed.
+		"""
+		return any(rule.general() for rule in self.rules_by_kind.get(kind, []))
+
+	def suppressed(self, kind, text, pkg=None, file=None):
+		"""
+		True if the message described by the arguments should be dropped.
+		"""
+		for rule in self.rules_by_kind.get(kind, ()):
+			if rule.matches(text, pkg, file):
+				return True
+		return False
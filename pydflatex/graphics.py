@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .processor import Processor
+from .cleaner import Cleaner
+from .recorder import Recording
+from .files import file_digest
+
+re_includegraphics = re.compile(r"\\includegraphics\*?\s*(\[[^\]]*\])?\s*\{(?P<name>[^}]*)\}")
+re_converted = re.compile(r"^(?P<root>.*)-(?P<ext>[a-z]+)-converted-to\.pdf$")
+
+def converted_path(source):
+	"""
+	Path of the pdf converted from a graphics file, as named by the epstopdf package.
+	"""
+	root, ext = os.path.splitext(source)
+	return '{0}-{1}-converted-to.pdf'.format(root, ext[1:])
+
+class GraphicsConverter(Processor):
+	"""
+	Convert the EPS and SVG figures of a document to pdf before typesetting, in parallel,
+	so that the engine finds ready-made pdf files instead of converting them itself.
+	The converted files are cached by the hash of their source.
+	Options:
+		- graphics_cache: directory of the cache of converted files
+		- graphics_jobs: number of conversions run in parallel
+	"""
+
+	defaults = Processor.defaults.copy()
+	defaults.update({
+		'graphics_cache': os.path.join(os.path.expanduser('~'), '.cache', 'pydflatex', 'graphics'),
+		'graphics_jobs': None,
+	})
+
+	# conversion command for each extension
+	converters = {
+		'eps': ['epstopdf', '--outfile={output}', '{source}'],
+		'svg': ['inkscape', '--export-type=pdf', '--export-filename={output}', '{source}'],
+		}
+
+	def __init__(self, logger=None, options=None):
+		Processor.__init__(self, logger, options)
+		# number of cache lookups, by result
+		self.lookups = Counter()
+		self.lock = threading.Lock()
+
+	def sources(self, full_path, file_base):
+		"""
+		Generate the paths of the .tex files of the document: the file itself,
+		and the .tex files read during the previous build.
+		"""
+		yield full_path
+		try:
+			recording = Recording(Cleaner.fls_file(file_base))
+		except (IOError, OSError):
+			return
+		for path in recording.inputs:
+			if not os.path.isabs(path) and os.path.splitext(path)[1] == os.path.extsep + 'tex':
+				yield recording.path(path)
+
+	def resolve(self, name, base):
+		"""
+		The graphics file to convert for the name given to \\includegraphics, if any.
+		"""
+		root, ext = os.path.splitext(name)
+		candidates = [name] if ext else [root + os.path.extsep + extension for extension in sorted(self.converters)]
+		for candidate in candidates:
+			if os.path.splitext(candidate)[1][1:] not in self.converters:
+				continue
+			for directory in [base, os.curdir]:
+				path = os.path.normpath(os.path.join(directory, candidate))
+				if os.path.exists(path):
+					return path
+		return None
+
+	def graphics(self, full_path, file_base):
+		"""
+		The graphics files needed by the document which have to be converted:
+		those named in \\includegraphics commands, and those which were converted during the previous build.
+		"""
+		base = os.path.dirname(full_path)
+		found = []
+		for source in self.sources(full_path, file_base):
+			try:
+				with open(source) as tex_file:
+					text = tex_file.read()
+			except (IOError, OSError):
+				continue
+			for m in re_includegraphics.finditer(text):
+				found.append(self.resolve(m.group('name').strip(), base))
+		try:
+			recording = Recording(Cleaner.fls_file(file_base))
+		except (IOError, OSError):
+			recording = None
+		if recording is not None:
+			for path in recording.inputs + recording.outputs:
+				m = re_converted.match(path)
+				if m and m.group('ext') in self.converters:
+					found.append(self.resolve(m.group('root') + os.path.extsep + m.group('ext'), os.curdir))
+		unique = []
+		for path in found:
+			if path is not None and path not in unique:
+				unique.append(path)
+		return unique
+
+	@classmethod
+	def stale(self, source):
+		output = converted_path(source)
+		try:
+			return os.path.getmtime(output) < os.path.getmtime(source)
+		except OSError:
+			return True
+
+	def convert(self, source):
+		"""
+		Convert one file, or copy the result of a previous conversion from the cache.
+		"""
+		output = converted_path(source)
+		cached = os.path.join(self.options['graphics_cache'], file_digest(source) + os.path.extsep + 'pdf')
+		hit = os.path.exists(cached)
+		with self.lock:
+			self.lookups['hit' if hit else 'miss'] += 1
+		if not hit:
+			tmp_path = cached + '.{0}.{1}.tmp.pdf'.format(os.getpid(), threading.current_thread().ident)
+			command = [argument.format(source=source, output=tmp_path) for argument in self.converters[os.path.splitext(source)[1][1:]]]
+			self.logger.debug(' '.join(command))
+			process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+			output_text = process.communicate()[0]
+			if process.returncode != 0 or not os.path.exists(tmp_path):
+				raise OSError('{0} failed: {1}'.format(command[0], output_text.decode('utf8', 'replace').strip()))
+			os.rename(tmp_path, cached)
+		shutil.copyfile(cached, output)
+
+	def convert_all(self, full_path, file_base):
+		"""
+		Convert the stale graphics files of the document in parallel.
+		Conversion errors are reported, but the engine may still convert the files itself.
+		"""
+		stale = [source for source in self.graphics(full_path, file_base) if self.stale(source)]
+		if not stale:
+			return
+		if not os.path.isdir(self.options['graphics_cache']):
+			os.makedirs(self.options['graphics_cache'])
+		self.logger.message('Converting {0} graphics files'.format(len(stale)))
+		with ThreadPoolExecutor(max_workers=self.options['graphics_jobs']) as executor:
+			futures = [(source, executor.submit(self.convert, source)) for source in stale]
+			for source, future in futures:
+				try:
+					future.result()
+				except OSError as e:
+					self.logger.error('{0}: {1}'.format(source, e))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import time
+import sqlite3
+
+schema = """
+CREATE TABLE IF NOT EXISTS builds (
+	id INTEGER PRIMARY KEY,
+	document TEXT NOT NULL,
+	started REAL NOT NULL,
+	success INTEGER NOT NULL,
+	passes INTEGER,
+	typesetting REAL,
+	log_parsing REAL,
+	cleaning REAL,
+	total REAL,
+	warnings INTEGER,
+	errors INTEGER,
+	log_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS builds_document ON builds (document, started);
+"""
+
+fields = ['document', 'started', 'success', 'passes', 'typesetting', 'log_parsing', 'cleaning', 'total', 'warnings', 'errors', 'log_size']
+
+def median(values):
+	values = sorted(values)
+	middle = len(values) // 2
+	if len(values) % 2:
+		return values[middle]
+	return (values[middle-1] + values[middle]) / 2
+
+class BuildHistory(object):
+	"""
+	Local SQLite store of the statistics of previous builds.
+	"""
+	# number of previous builds taken into account
+	window = 20
+	# minimal number of previous builds needed to detect a regression
+	min_builds = 5
+	# a build is a regression if it is slower than the median by that factor...
+	slowdown = 1.5
+	# ...and by that many median absolute deviations
+	deviations = 3
+
+	def __init__(self, path):
+		self.path = path
+
+	def connect(self):
+		connection = sqlite3.connect(self.path, timeout=30)
+		connection.executescript(schema)
+		return connection
+
+	@classmethod
+	def document(self, tex_path):
+		return os.path.realpath(tex_path)
+
+	def record(self, tex_path, **stats):
+		"""
+		Record the statistics of one build.
+		"""
+		stats['document'] = self.document(tex_path)
+		stats.setdefault('started', time.time())
+		stats['success'] = int(stats.get('success', True))
+		values = [stats.get(field) for field in fields]
+		connection = self.connect()
+		try:
+			with connection:
+				connection.execute('INSERT INTO builds ({0}) VALUES ({1})'.format(', '.join(fields), ', '.join('?'*len(fields))), values)
+		finally:
+			connection.close()
+
+	def builds(self, tex_path, limit=None):
+		"""
+		The latest builds of that document, most recent first, as dictionaries.
+		"""
+		connection = self.connect()
+		try:
+			cursor = connection.execute('SELECT {0} FROM builds WHERE document = ? ORDER BY started DESC LIMIT ?'.format(', '.join(fields)), (self.document(tex_path), limit or -1))
+			return [dict(zip(fields, row)) for row in cursor]
+		finally:
+			connection.close()
+
+	def durations(self, tex_path, exclude_latest=False):
+		"""
+		Total durations of the latest successful builds.
+		"""
+		durations = [build['total'] for build in self.builds(tex_path, self.window + 1) if build['success'] and build['total'] is not None]
+		if exclude_latest:
+			durations = durations[1:]
+		return durations[:self.window]
+
+	def expected_duration(self, tex_path):
+		"""
+		Median duration of the latest successful builds, or None if the document was never built.
+		"""
+		durations = self.durations(tex_path)
+		if not durations:
+			return None
+		return median(durations)
+
+	def regression(self, tex_path, duration):
+		"""
+		If the given duration is an outlier compared to the previous builds, return their median duration.
+		"""
+		durations = self.durations(tex_path, exclude_latest=True)
+		if len(durations) < self.min_builds:
+			return None
+		usual = median(durations)
+		deviation = median([abs(d - usual) for d in durations])
+		if duration > usual * self.slowdown and duration > usual + self.deviations * deviation:
+			return usual
+		return None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+
+from .files import atomic_write
+
+# page and line numbers that may appear inside a message text
+re_position = re.compile(r"\b(lines?|page) [0-9]+(--[0-9]+)?")
+
+def fingerprint(kind, message):
+	"""
+	A digest of the message that does not change when it moves to another line or page.
+	"""
+	text = re_position.sub(r"\1 #", message.get('text') or '')
+	file_name = os.path.basename(message.get('file') or '')
+	key = u'\0'.join([kind, message.get('pkg') or '', file_name, text])
+	return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+class FingerprintStore(object):
+	"""
+	The fingerprints of the messages of the previous build, stored as a JSON file
+	mapping each fingerprint to its number of occurrences and text.
+	"""
+	def __init__(self, path):
+		self.path = path
+
+	def load(self):
+		"""
+		The stored fingerprints, or None if there are none.
+		"""
+		try:
+			with open(self.path) as store:
+				return json.load(store)
+		except (IOError, OSError, ValueError):
+			return None
+
+	def save(self, fingerprints):
+		with atomic_write(self.path) as store:
+			json.dump(fingerprints, store, sort_keys=True)
+
+class Novelty(object):
+	"""
+	Compare the messages of the current build with those of the previous one.
+	Without the fingerprints of a previous build (`previous` is None), no message is new.
+	"""
+	def __init__(self, previous):
+		self.baseline = previous is not None
+		self.previous = previous or {}
+		self.counts = Counter()
+		self.texts = {}
+		self.added = 0
+
+	def track(self, kind, messages, only_new=True):
+		"""
+		Count the messages which did not occur in the previous build,
+		and generate only those if `only_new` is true and there was a previous build.
+		"""
+		for message in messages:
+			key = fingerprint(kind, message)
+			occurrence = self.counts[key]
+			self.counts[key] += 1
+			self.texts[key] = message.get('text')
+			new = self.baseline and occurrence >= self.previous.get(key, [0])[0]
+			if new:
+				self.added += 1
+			if new or not (only_new and self.baseline):
+				yield message
+
+	def resolved(self):
+		"""
+		Generate the text and number of occurrences of the messages which disappeared since the previous build.
+		"""
+		for key, (count, text) in sorted(self.previous.items(), key=lambda item: item[1][1] or ''):
+			missing = count - self.counts[key]
+			if missing > 0:
+				yield text, missing
+
+	def fingerprints(self):
+		return dict((key, [count, self.texts[key]]) for key, count in self.counts.items())
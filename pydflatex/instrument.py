@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import timeit
+from collections import OrderedDict
+
+from .latexlogparser import LogCheck
+
+# the clock used to time the rules
+timer = timeit.default_timer
+
+class RuleStats(object):
+	"""
+	Number of lines tested and matched by a rule, and the time spent testing them.
+	"""
+	def __init__(self, name):
+		self.name = name
+		self.tested = 0
+		self.matched = 0
+		self.time = 0.
+
+class PassStats(object):
+	"""
+	Statistics of one pass of the parser over the log, labelled by the kinds of messages it searched.
+	"""
+	def __init__(self, label, names):
+		self.label = label
+		self.rules = OrderedDict((name, RuleStats(name)) for name in names)
+		self.lines_parsed = 0
+		self.accumulated = 0
+		self.skipped = 0
+		self.untested = 0
+
+	def report(self):
+		"""
+		The statistics, as a table with the slowest rules first.
+		"""
+		total = sum(stats.time for stats in self.rules.values()) or 1.
+		rows = ['Pass searching {0}:'.format(self.label)]
+		rows.append('{0:<20} {1:>10} {2:>10} {3:>10} {4:>6}'.format('rule', 'tested', 'matched', 'time (ms)', '%'))
+		for stats in sorted(self.rules.values(), key=lambda stats: -stats.time):
+			rows.append('{0:<20} {1:>10} {2:>10} {3:>10.3f} {4:>6.1f}'.format(stats.name, stats.tested, stats.matched, 1000*stats.time, 100*stats.time/total))
+		rows.append('{0} lines parsed, {1} accumulated as continued, {2} skipped after bad boxes, {3} otherwise not tested by any rule'.format(self.lines_parsed, self.accumulated, self.skipped, self.untested))
+		return '\n'.join(rows)
+
+class TimedPattern(object):
+	"""
+	A compiled regular expression recording its statistics in the current pass of the parser.
+	"""
+	def __init__(self, pattern, name, parser):
+		self.pattern = pattern
+		self.name = name
+		self.parser = parser
+
+	def timed(self, method, string):
+		stats = self.parser.stats[self.name]
+		self.parser.tested_line = True
+		time_start = timer()
+		m = method(string)
+		stats.time += timer() - time_start
+		stats.tested += 1
+		if m:
+			stats.matched += 1
+		return m
+
+	def match(self, string):
+		return self.timed(self.pattern.match, string)
+
+	def search(self, string):
+		return self.timed(self.pattern.search, string)
+
+class InstrumentedLogCheck(LogCheck):
+	"""
+	Log parser recording, for each pass over the log and each rule of `parse`, how many lines it tested and matched, and the time it took.
+	It also counts the lines accumulated because they were continued, the lines skipped after bad box messages,
+	and the other lines that no rule tested: blank lines, and lines of messages which are recognised without regular expressions.
+	The counts of the last pass are available as attributes (`stats`, `lines_parsed`, ...), and those of all the passes in `passes`.
+	The plain `LogCheck` is not affected.
+	"""
+	patterns = ['re_cseq', 're_line', 're_ignored', 're_online', 're_reference', 're_citation', 're_label', 're_missing_character', 're_warning', 're_badbox', 're_atline']
+	functions = ['continued', 'update_file', 'update_page']
+
+	def __init__(self, wide=False):
+		LogCheck.__init__(self, wide)
+		for name in self.patterns:
+			setattr(self, name, TimedPattern(getattr(LogCheck, name), name[3:], self))
+		self.passes = []
+		self.current = PassStats(None, self.rule_names())
+		self.tested_line = False
+
+	def rule_names(self):
+		return [name[3:] for name in self.patterns] + self.functions
+
+	@property
+	def stats(self):
+		return self.current.rules
+
+	@property
+	def lines_parsed(self):
+		return self.current.lines_parsed
+
+	@property
+	def accumulated(self):
+		return self.current.accumulated
+
+	@property
+	def skipped(self):
+		return self.current.skipped
+
+	@property
+	def untested(self):
+		return self.current.untested
+
+	def time_function(self, name, function, matched, *args):
+		stats = self.stats[name]
+		time_start = timer()
+		result = function(*args)
+		stats.time += timer() - time_start
+		stats.tested += 1
+		if matched(result, *args):
+			stats.matched += 1
+		return result
+
+	def continued(self, line):
+		result = self.time_function('continued', LogCheck.continued.__get__(self), lambda result, line: result, line)
+		if result:
+			self.current.accumulated += 1
+			# the line is tested once accumulated
+			self.tested_line = True
+		return result
+
+	def update_file(self, line, stack, last):
+		self.tested_line = True
+		depth = len(stack)
+		return self.time_function('update_file', LogCheck.update_file.__get__(self), lambda result, line, stack, last: len(stack) != depth or result != last, line, stack, last)
+
+	def update_page(self, line, before):
+		self.tested_line = True
+		return self.time_function('update_page', LogCheck.update_page.__get__(self), lambda result, line, before: result != before, line, before)
+
+	def counted(self, lines, current):
+		"""
+		Count the lines, those skipped after bad box messages, and the others that were not tested by any rule.
+		"""
+		badbox = current.rules['badbox']
+		# the lines after a bad box message are skipped up to a blank line
+		in_box = False
+		for line in lines:
+			current.lines_parsed += 1
+			self.tested_line = False
+			matched = badbox.matched
+			yield line
+			if badbox.matched != matched:
+				in_box = True
+			elif not self.tested_line:
+				if in_box and line.strip():
+					current.skipped += 1
+				else:
+					in_box = False
+					current.untested += 1
+
+	def parse(self, errors=False, boxes=False, refs=False, warnings=False, filters=None, lines=None, state=None):
+		if lines is None:
+			lines = self.lines
+		if not lines:
+			return iter(())
+		label = ', '.join(name for name, searched in [('errors', errors), ('boxes', boxes), ('references', refs), ('warnings', warnings)] if searched)
+		self.current = PassStats(label or 'nothing', self.rule_names())
+		self.passes.append(self.current)
+		return LogCheck.parse(self, errors=errors, boxes=boxes, refs=refs, warnings=warnings, filters=filters, lines=self.counted(lines, self.current), state=state)
+
+	def report(self):
+		"""
+		The statistics of each pass.
+		"""
+		return '\n\n'.join(current.report() for current in self.passes)
@@ -9,6 +9,7 @@ class LaTeXLogger(logging.Logger):
 	page_template = 'p.{0:4}'
 	package_template = '[{0}]'
 	head_template = '{package}{page}{line}: '
+	repeat_template = '{package}{message} ({count} times: {locations})'
 
 	def styled(self, msg, style):
 		return msg
@@ -21,6 +22,24 @@ class LaTeXLogger(logging.Logger):
 		msg = info['text']
 		self.info('{head}{message}'.format(head=head, message=self.styled(msg,'box')))
 
+	def repeated_warning(self, group):
+		"""
+		Warning occurring several times (see `pydflatex.aggregate.Group`).
+		"""
+		style = 'box' if group.kind == 'box' else 'warning'
+		package = group.message.get('pkg','')
+		package_str = self.package_template.format(package) + ' ' if package else ''
+		locations = []
+		if group.pages.ranges:
+			locations.append('p.{0}'.format(group.pages))
+		if group.lines.ranges:
+			locations.append('l.{0}'.format(group.lines))
+		msg = self.repeat_template.format(package=package_str, message=self.styled(group.message['text'], style), count=group.count, locations=' '.join(locations))
+		if group.kind == 'box':
+			self.info(msg)
+		else:
+			self.warning(msg)
+
 	def warning(self, msg):
 		"""
 		LaTeX warning
@@ -59,6 +78,9 @@ class LaTeXLogger(logging.Logger):
 		logging.Logger.error(self, "{file}:{line}: {error}".format(file=error['file'], line=error.get('line',''), error=self.styled(error['text'],'error')))
 		if error.get('code'): # if the code is available we print it:
 			self.message("{line}:\t {code}".format(line=self.line_template.format(error.get('line','')), code=error['code']))
+		for number, text in error.get('context') or []:
+			marker = '>' if str(number) == str(error.get('line')) else ' '
+			self.info("{marker}{line}| {text}".format(marker=marker, line=self.line_template.format(number), text=text))
 
 	def error(self, msg):
 		"""
@@ -72,6 +94,13 @@ class LaTeXLogger(logging.Logger):
 		"""
 		self.info(self.styled(msg,'success'))
 
+	def resolved_warning(self, text, count):
+		"""
+		Warning which disappeared since the previous build.
+		"""
+		times = ' ({0} times)'.format(count) if count > 1 else ''
+		self.info('{resolved}: {text}{times}'.format(resolved=self.styled('resolved', 'success'), text=text, times=times))
+
 	def ref_warning(self, ref):
 		"""
 		Special format for citation and reference warnings.
@@ -137,5 +166,40 @@ std_handler.setLevel(logging.INFO)
 debug_handler = logging.StreamHandler()
 debug_handler.setLevel(logging.DEBUG)
 
+class RecordingHandler(logging.Handler):
+	"""
+	Keep the records, to display them later with another logger.
+	"""
+	def __init__(self):
+		logging.Handler.__init__(self)
+		self.records = []
+
+	def emit(self, record):
+		self.records.append(record)
+
+	def replay(self, logger):
+		for record in self.records:
+			logger.handle(record)
+		self.records = []
+
+def buffered_logger(logger):
+	"""
+	Logger of the same class as `logger`, which keeps its records in the returned handler.
+	"""
+	buffered = type(logger)(logger.name)
+	buffered.setLevel(logger.getEffectiveLevel())
+	handler = RecordingHandler()
+	buffered.addHandler(handler)
+	return buffered, handler
+
+def silent_logger():
+	"""
+	Logger which discards everything without formatting it.
+	"""
+	logger = LaTeXLogger('pydflatex')
+	logger.setLevel(logging.CRITICAL + 1)
+	logger.addHandler(logging.NullHandler())
+	return logger
+
 ## formatter = logging.Formatter('%(message)s')
 ## handler.setFormatter(formatter)
@@ -4,7 +4,7 @@
 
 import re
 
-import codecs
+from .compression import open_text
 
 # The function `_' is defined here to prepare for internationalization.
 def _ (txt): return txt
@@ -34,19 +34,37 @@ class LogCheck (object):
 	For efficiency, the instances contain the whole file as a list of strings
 	so that it can be read several times with no disk access.
 	"""
+	# the rules used by `parse', as attributes so that they may be replaced
+	# (see `pydflatex.instrument')
+	re_cseq = re_cseq
+	re_line = re_line
+	re_ignored = re_ignored
+	re_online = re_online
+	re_reference = re_reference
+	re_citation = re_citation
+	re_label = re_label
+	re_missing_character = re_missing_character
+	re_warning = re_warning
+	re_badbox = re_badbox
+	re_atline = re_atline
+
 	#-- Initialization {{{2
 
-	def __init__ (self):
+	def __init__ (self, wide=False):
 		self.lines = None
+		# True if the log was written with a large max_print_line,
+		# so that the lines are never broken
+		self.wide = wide
 
 	def read (self, name):
 		"""
 		Read the specified log file, checking that it was produced by the
 		right compiler. Returns true if the log file is invalid or does not
-		exist.
+		exist. Logs compressed with gzip (.gz) or zstandard (.zst) are
+		decompressed while they are read.
 		"""
 		self.lines = None
-		with codecs.open(name, encoding='utf-8', errors='replace') as log_file:
+		with open_text(name) as log_file:
 			self.lines = log_file.readlines()
 			if not self.lines:
 				raise ValueError("Empty file")
@@ -99,7 +117,7 @@ class LogCheck (object):
 		"""
 		return len(line) == 79 and line[-3:] != '...'
 
-	def parse (self, errors=False, boxes=False, refs=False, warnings=False):
+	def parse (self, errors=False, boxes=False, refs=False, warnings=False, filters=None, lines=None, state=None):
 		"""
 		Parse the log file for relevant information. The named arguments are
 		booleans that indicate which information should be extracted:
@@ -107,34 +125,55 @@ class LogCheck (object):
 		- boxes: bad boxes
 		- refs: warnings about references
 		- warnings: all other warnings
+		The optional `filters' object (see `pydflatex.filters.MessageFilter')
+		is asked, through its method `suppressed', whether a box, reference or
+		warning should be dropped before the corresponding item is built.
 		The function returns a generator. Each generated item is a dictionary
 		that contains (some of) the following entries:
 		- kind: the kind of information ("error", "box", "ref", "warning")
 		- text: the text of the error or warning
 		- code: the piece of code that caused an error
 		- file, line, last, pkg: as used by Message.format_pos.
+		A part of the log may be parsed by giving its `lines' together with
+		the `state' of the parser at its beginning (as in `initial_state');
+		that dictionary is updated with the state at the end of the lines.
 		"""
-		if not self.lines:
+		if lines is None:
+			lines = self.lines
+		if not lines:
 			return
-		last_file = None
-		pos = [last_file]
-		page = 1
-		parsing = False   # True if we are parsing an error's text
-		skipping = False  # True if we are skipping text until an empty line
+		if state is None:
+			state = self.initial_state()
+		last_file = state["last_file"]
+		pos = state["pos"]
+		page = state["page"]
+		parsing = state["parsing"]   # True if we are parsing an error's text
+		skipping = state["skipping"] # True if we are skipping text until an empty line
 		something = False # True if some error was found
-		prefix = None  # the prefix for warning messages from packages
-		accu = ""      # accumulated text from the previous line
-		for line in self.lines:
+		prefix = state["prefix"]     # the prefix for warning messages from packages
+		accu = state["accu"]         # accumulated text from the previous line
+		error = state["error"]
+		text = state["text"]
+		info = state["info"]
+		wide = self.wide
+		# the rules are looked up once, rather than for every line
+		re_cseq, re_line, re_ignored, re_online = self.re_cseq, self.re_line, self.re_ignored, self.re_online
+		re_reference, re_citation, re_label = self.re_reference, self.re_citation, self.re_label
+		re_missing_character, re_warning, re_badbox, re_atline = self.re_missing_character, self.re_warning, self.re_badbox, self.re_atline
+		continued, update_file, update_page = self.continued, self.update_file, self.update_page
+		for line in lines:
 			line = line[:-1]  # remove the line feed
 
 			# TeX breaks messages at 79 characters, just to make parsing
 			# trickier...
 
-			if self.continued(line):
-				accu += line
-				continue
-			line = accu + line
-			accu = ""
+			if not wide:
+				if continued(line):
+					accu += line
+					continue
+				if accu:
+					line = accu + line
+					accu = ""
 
 			# Text that should be skipped (from bad box messages)
 
@@ -161,10 +200,13 @@ class LogCheck (object):
 					pdfTeX = "pdfTeX warning" in line
 					if (pdfTeX and warnings) or (errors and not pdfTeX):
 						if pdfTeX:
+							text = error[error.find(":")+2:]
+							if filters is not None and filters.suppressed("warning", text, "pdfTeX", pos[-1]):
+								continue
 							d = {
 								"kind": "warning",
 								"pkg": "pdfTeX",
-								"text": error[error.find(":")+2:]
+								"text": text
 							}
 						else:
 							d =	{
@@ -178,10 +220,8 @@ class LogCheck (object):
 							if "code" in d:
 								del d["code"]
 							d.update( m.groupdict() )
-						elif pos[-1] is None:
-							d["file"] = last_file
 						else:
-							d["file"] = pos[-1]
+							d["file"] = self.current_file(pos, last_file)
 						yield d
 				elif line[0] == "!":
 					error = line[2:]
@@ -227,7 +267,7 @@ class LogCheck (object):
 					if m:
 						info["line"] = m.group("line")
 						text = text[:m.start()] + text[m.end():]
-					if warnings:
+					if warnings and (filters is None or not filters.suppressed("warning", text, info.get("pkg"), info["file"])):
 						info["text"] = text
 						d = { "kind": "warning" }
 						d.update( info )
@@ -240,9 +280,12 @@ class LogCheck (object):
 			m = re_reference.match(line)
 			if m:
 				if refs:
+					text = _("Reference `%s' undefined.") % m.group("ref")
+					if filters is not None and filters.suppressed("ref", text, None, pos[-1]):
+						continue
 					d =	{
 						"kind": "warning",
-						"text": _("Reference `%s' undefined.") % m.group("ref"),
+						"text": text,
 						"file": pos[-1]
 						}
 					d.update( m.groupdict() )
@@ -252,9 +295,12 @@ class LogCheck (object):
 			m = re_citation.match(line)
 			if m:
 				if refs:
+					text = _("Citation `%s' undefined.") % m.group("cite")
+					if filters is not None and filters.suppressed("ref", text, None, pos[-1]):
+						continue
 					d =	{
 						"kind": "warning",
-						"text": _("Citation `%s' undefined.") % m.group("cite"),
+						"text": text,
 						"file": pos[-1]
 						}
 					d.update( m.groupdict() )
@@ -264,6 +310,8 @@ class LogCheck (object):
 			m = re_label.match(line)
 			if m:
 				if refs:
+					if filters is not None and filters.suppressed("ref", m.group("text"), None, pos[-1]):
+						continue
 					d =	{
 						"kind": "warning",
 						"file": pos[-1]
@@ -279,7 +327,10 @@ class LogCheck (object):
 					info = missing_char.groupdict()
 					missing_char = info['missing']
 					## raise Exception(info)
-					d = {'kind': 'warning', 'text': u'Missing character: "{}"'.format(missing_char)}
+					text = u'Missing character: "{}"'.format(missing_char)
+					if filters is not None and filters.suppressed("warning", text, None, pos[-1]):
+						continue
+					d = {'kind': 'warning', 'text': text}
 					d.update(mpos)
 					yield d
 				continue
@@ -306,13 +357,17 @@ class LogCheck (object):
 			m = re_badbox.match(line)
 			if m:
 				if boxes:
-					mpos = { "file": pos[-1], "page": page }
 					m = re_atline.search(line)
+					text = line if m is None else line[:m.start()]
+					if filters is not None and filters.suppressed("box", text, None, pos[-1]):
+						skipping = True
+						continue
+					mpos = { "file": pos[-1], "page": page }
 					if m:
 						md = m.groupdict()
 						for key in "line", "last":
 							if md[key]: mpos[key] = md[key]
-						line = line[:m.start()]
+						line = text
 					d =	{
 						"kind": "warning",
 						"text": line
@@ -324,17 +379,50 @@ class LogCheck (object):
 
 			# If there is no message, track source names and page numbers.
 
-			last_file = self.update_file(line, pos, last_file)
-			page = self.update_page(line, page)
+			last_file = update_file(line, pos, last_file)
+			page = update_page(line, page)
+
+		state.update(last_file=last_file, pos=pos, page=page, parsing=parsing, skipping=skipping, prefix=prefix, accu=accu, error=error, text=text, info=info)
+
+	def initial_state (self):
+		"""
+		The state of the parser at the beginning of the log file.
+		"""
+		return {
+			"last_file": None,
+			"pos": [None],
+			"page": 1,
+			"parsing": False,
+			"skipping": False,
+			"prefix": None,
+			"accu": "",
+			"error": None,
+			"text": None,
+			"info": None,
+			}
+
+	def current_file (self, stack, last):
+		"""
+		The file in which an error occurred: the top of the stack, or the last
+		file read if the stack contains no file.
+		"""
+		if stack[-1] is None:
+			return last
+		return stack[-1]
+
+	def close (self):
+		"""
+		Release the resources held by the parser.
+		"""
 
 	def get_errors (self):
 		return self.parse(errors=True)
-	def get_boxes (self):
-		return self.parse(boxes=True)
-	def get_references (self):
-		return self.parse(refs=True)
-	def get_warnings (self):
-		return self.parse(warnings=True)
+	def get_boxes (self, filters=None):
+		return self.parse(boxes=True, filters=filters)
+	def get_references (self, filters=None):
+		return self.parse(refs=True, filters=filters)
+	def get_warnings (self, filters=None):
+		return self.parse(warnings=True, filters=filters)
 
 	def update_file (self, line, stack, last):
 		"""
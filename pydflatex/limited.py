@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Run a command with resource limits, on behalf of `Typesetter`:
+
+	python -m pydflatex.limited [--cpu SECONDS] [--memory BYTES] [--file-size BYTES] -- command [arguments]
+
+The limits only apply to the command, not to this process.
+This process ends as the command did, except that a command killed for exceeding its CPU time
+ends this process with SIGXCPU, so that it is not mistaken for a command killed by someone else.
+"""
+from __future__ import division
+
+import os
+import sys
+import signal
+import resource
+import subprocess
+
+# the resource of each option
+resources = {
+	'--cpu': 'RLIMIT_CPU',
+	'--memory': 'RLIMIT_AS',
+	'--file-size': 'RLIMIT_FSIZE',
+}
+
+def main(arguments):
+	arguments = list(arguments)
+	limits = {}
+	while arguments and arguments[0] != '--':
+		option = arguments.pop(0)
+		limits[resources[option]] = int(arguments.pop(0))
+	command = arguments[1:]
+
+	def set_limits():
+		# this process has a single thread, so that this is safe after the fork
+		for name, value in limits.items():
+			# for the CPU time, the soft limit sends SIGXCPU, the hard limit SIGKILL
+			resource.setrlimit(getattr(resource, name), (value, value + (name == 'RLIMIT_CPU')))
+
+	process = subprocess.Popen(command, preexec_fn=set_limits)
+	# reaped here rather than by `wait`, for its resource usage
+	pid, status, usage = os.wait4(process.pid, 0)
+	process.returncode = status
+	if not os.WIFSIGNALED(status):
+		return os.WEXITSTATUS(status)
+	number = os.WTERMSIG(status)
+	if number == signal.SIGKILL and 'RLIMIT_CPU' in limits and usage.ru_utime + usage.ru_stime >= limits['RLIMIT_CPU']:
+		number = signal.SIGXCPU
+	if number not in (signal.SIGKILL, signal.SIGSTOP):
+		# Python ignores some signals, e.g., SIGXFSZ
+		signal.signal(number, signal.SIG_DFL)
+	# no core dump for the signals which produce one
+	resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+	os.kill(os.getpid(), number)
+	return 1
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -3,78 +3,315 @@
 from __future__ import division
 
 import os
+from collections import Counter
 
-from .processor import Processor
+from .processor import Processor, LaTeXError
 
 # loading the log parser
 from pydflatex.latexlogparser import LogCheck
+from .chunked import ChunkedLogCheck
+from .tail import TailCheck
+from .instrument import InstrumentedLogCheck
+from .filters import MessageFilter, default_rules
+from .aggregate import Aggregator
+from .incremental import FingerprintStore, Novelty
+from .result import Message
+from .context import source_index
+from . import compression
 
 class LogProcessor(Processor):
 	"""
 	Process a log file.
 	Options:
 		- suppress_box_warning
+		- warning_filters: list of filter rules (see `pydflatex.filters`)
+		- aggregate_warnings: report identical boxes and warnings once, with a count
+		- new_only: only report the warnings which are new since the previous build
+		- fingerprint_file: where the fingerprints of the previous build are stored
+		- fail_on_new_warnings: raise an error if there are new warnings
+		- parse_jobs: number of processes used to parse huge logs
+		- wide_lines: the log was written with unbroken lines (see `Typesetter`)
+		- compress_log: compression method ('gz' or 'zst') of the log once it is analysed
+		- compressed_fallback: parse the compressed log if the log itself is missing (not after a run of the engine, where it would be that of a previous build)
+		- quick_errors: look for an error at the end of the log first, and only report that error if there is one
+		- source_context: number of source lines attached to each error before and after its line (none if zero)
+		- profile_parser: report the number of lines tested and matched by each rule of the parser, and the time it took
 	"""
 
 	defaults = Processor.defaults.copy()
 	defaults.update({
 		'suppress_box_warning': True,
+		'warning_filters': default_rules,
+		'aggregate_warnings': False,
+		'new_only': False,
+		'fingerprint_file': None,
+		'fail_on_new_warnings': False,
+		'parse_jobs': 1,
+		'wide_lines': False,
+		'compress_log': None,
+		'compressed_fallback': True,
+		'quick_errors': False,
+		'profile_parser': False,
+		'source_context': 2,
 	})
 
+	def __init__(self, logger=None, options=None):
+		Processor.__init__(self, logger, options)
+		# number of new warnings found by the last call to `process_parser`
+		self.new_warnings = None
+		# number of messages of each kind reported by the last call to `process_parser`
+		self.counts = Counter()
+		self.novelty = None
+
 	@classmethod
 	def log_file_path(self, base, file_base):
 		return os.path.join(base, file_base + os.path.extsep + 'log')
 
+	def fingerprint_path(self, log_file_path):
+		"""
+		Path of the fingerprints of the previous build: by default next to the log file.
+		"""
+		if self.options['fingerprint_file']:
+			return self.options['fingerprint_file']
+		return os.path.splitext(log_file_path)[0] + os.path.extsep + 'fingerprints'
+
 	@classmethod
-	def parse_log(self, log_file_path):
+	def parse_log(self, log_file_path, jobs=1, wide=False, profile=False, compressed=True):
 		"""
-		Parse log file
+		Parse log file, in parallel if `jobs` is not one.
+		The log may have been compressed, if `compressed` is true.
+		If `profile` is true, the parser is instrumented, and does not run in parallel.
 		"""
-		parser = LogCheck()
+		log_file_path = compression.find_log(log_file_path, compressed)
+		if profile:
+			parser = InstrumentedLogCheck(wide)
+		elif jobs == 1:
+			parser = LogCheck(wide)
+		else:
+			parser = ChunkedLogCheck(jobs=jobs or None, wide=wide)
 		parser.read(log_file_path)
 		return parser
 
-	def process_log(self, log_file_path):
+	def fingerprint_store(self, log_file_path):
+		if self.options['new_only'] or self.options['fail_on_new_warnings']:
+			return FingerprintStore(self.fingerprint_path(log_file_path))
+		return None
+
+	def process_log(self, log_file_path, errors_known=None):
 		"""
-		Parse log and display corresponding info.
+		Parse log and display corresponding info, and return the first error, if any.
+		`errors_known` is called with the list of errors as soon as they are found, before the warnings are processed.
+		Raise an exception if there are new warnings, and `fail_on_new_warnings` is set.
 		"""
-		parser = self.parse_log(log_file_path)
+		error = self.display_log(log_file_path, errors_known)
+		if error is None and self.new_warnings_fail():
+			raise LaTeXError('{0} new warnings since the previous build'.format(self.new_warnings))
+		return error
+
+	def display_log(self, log_file_path, errors_known=None, collected=None):
+		"""
+		Parse log and display corresponding info, as `process_log`, without raising an exception for the new warnings.
+		The messages displayed are appended to the list `collected`, if given, as `pydflatex.result.Message`.
+		"""
+		if self.options['quick_errors']:
+			error = self.quick_error(log_file_path)
+			if error is not None:
+				error = list(self.with_context([error]))[0]
+				if errors_known is not None:
+					errors_known([error])
+				self.counts = Counter(error=1)
+				self.new_warnings = None
+				self.logger.latex_error(error)
+				if collected is not None:
+					collected.append(Message.from_parser('error', error))
+				return error
+		parser = self.parse_log(log_file_path, self.options['parse_jobs'], self.options['wide_lines'], self.options['profile_parser'], self.options['compressed_fallback'])
 
 		# Process info from parser
-		error = self.process_parser(parser)
+		try:
+			error = self.process_parser(parser, self.fingerprint_store(log_file_path), errors_known, collected)
+		finally:
+			parser.close()
+		if self.options['profile_parser']:
+			self.logger.message('Log parser profile:\n{0}'.format(parser.report()))
 		return error
 
-	def process_boxes(self, boxes):
+	def quick_error(self, log_file_path):
+		"""
+		The last error of the log, found by reading it backwards, or None.
+		"""
+		return TailCheck(self.options['wide_lines']).last_error(compression.find_log(log_file_path, self.options['compressed_fallback']))
+
+	def archive_log(self, log_file_path):
+		"""
+		Compress the log, if required and not already done.
+		"""
+		if self.options['compress_log'] and os.path.exists(log_file_path):
+			return compression.compress(log_file_path, self.options['compress_log'])
+
+	def collect_log(self, log_file_path, errors_known=None):
+		"""
+		Parse log and return its messages, without displaying anything.
+		"""
+		parser = self.parse_log(log_file_path, self.options['parse_jobs'], self.options['wide_lines'], compressed=self.options['compressed_fallback'])
+		try:
+			return self.collect(parser, self.fingerprint_store(log_file_path), errors_known)
+		finally:
+			parser.close()
+
+	def message_filter(self):
+		"""
+		Compile the filter rules given in the options.
+		"""
+		rules = list(self.options['warning_filters'])
+		if self.options['suppress_box_warning']:
+			rules.append({'kind': 'box'})
+		return MessageFilter(rules)
+
+	def trim_boxes(self, boxes):
 		for box in boxes:
 			has_occ = box['text'].find(r' has occurred while \output is active')
 			if has_occ != -1:
 				box['text'] = box['text'][:has_occ]
-			if not self.options['suppress_box_warning']:
-				self.logger.box_warning(box)
+			yield box
+
+	def process_boxes(self, boxes):
+		if self.options['aggregate_warnings']:
+			self.process_groups(Aggregator().extend('box', boxes))
+			return
+		for box in boxes:
+			self.logger.box_warning(box)
 
 	def process_references(self, references):
 		for ref in references:
 			self.logger.ref_warning(ref)
 
 	def process_warnings(self, warnings):
+		if self.options['aggregate_warnings']:
+			self.process_groups(Aggregator().extend('warning', warnings))
+			return
 		for warning in warnings:
-			# following should be filtered via the loggers filter!
-			if warning.get('pkg') == 'hyperref' and warning['text'].find('Token') != -1:
-				continue # I hate those hyperref warning
-			if warning.get('text') == r'Command \centerline is TeX.  Use \centering or center environment instead.':
-				continue # warning from the nag package
 			self.logger.latex_warning(warning)
 
-	def process_parser(self, parser):
+	def process_groups(self, aggregator):
+		"""
+		Display each group of identical messages once.
+		"""
+		for group in aggregator:
+			if group.count > 1:
+				self.logger.repeated_warning(group)
+			elif group.kind == 'box':
+				self.logger.box_warning(group.message)
+			else:
+				self.logger.latex_warning(group.message)
+		if aggregator.dropped:
+			self.logger.message('{0} more messages not shown'.format(aggregator.dropped))
+
+	def select(self, novelty, kind, messages):
+		"""
+		Compare the messages with the previous build, and keep only the new ones if required.
+		"""
+		if novelty is None:
+			return messages
+		return novelty.track(kind, messages, only_new=self.options['new_only'])
+
+	def counted(self, kind, messages):
+		for message in messages:
+			self.counts[kind] += 1
+			yield message
+
+	def process_resolved(self, novelty):
+		for text, count in novelty.resolved():
+			self.logger.resolved_warning(text, count)
+
+	def with_context(self, errors):
+		"""
+		Attach the surrounding source lines to the errors, if required.
+		Only the errors are displayed with their context, so that the warnings, which may be many, are not looked up.
+		"""
+		lines = self.options['source_context']
+		# each source file is checked once
+		versions = {}
+		for message in errors:
+			if lines:
+				context = source_index.context(message.get('file'), message.get('line'), lines, versions)
+				if context is not None:
+					message['context'] = context
+			yield message
+
+	def parsed(self, parser, store=None, errors_known=None):
 		"""
-		Process information from the parser and print out the gist of it.
+		Generate the kind ('box', 'ref', 'warning' or 'error') and the messages of each kind,
+		filtered, compared with the previous build and counted.
+		The messages of each kind must be consumed before the next kind is generated.
+		The errors are searched first, and passed to `errors_known`, if given.
 		"""
-		self.process_boxes(parser.get_boxes())
-		self.process_references(parser.get_references())
-		self.process_warnings(parser.get_warnings())
-		errors = list(parser.get_errors())
+		errors = list(self.with_context(parser.get_errors()))
+		if errors_known is not None:
+			errors_known(errors)
+		filters = self.message_filter()
+		self.counts = Counter()
+		self.new_warnings = None
+		self.novelty = None
+		if store is not None:
+			self.novelty = Novelty(store.load())
+		for kind, get in [('box', parser.get_boxes), ('ref', parser.get_references), ('warning', parser.get_warnings)]:
+			if not filters.suppresses_all(kind):
+				messages = self.counted(kind, self.select(self.novelty, kind, get(filters)))
+				if kind == 'box':
+					messages = self.trim_boxes(messages)
+				yield kind, messages
+		if self.novelty is not None:
+			self.new_warnings = self.novelty.added
+		self.counts['error'] = len(errors)
+		yield 'error', errors
+
+	def collect(self, parser, store=None, errors_known=None):
+		"""
+		Return the list of messages (see `pydflatex.result.Message`) of the parser.
+		"""
+		collected = []
+		for kind, messages in self.parsed(parser, store, errors_known):
+			collected.extend(Message.from_parser(kind, message) for message in messages)
+		self.update_fingerprints(store)
+		return collected
+
+	def new_warnings_fail(self):
+		return bool(self.new_warnings) and self.options['fail_on_new_warnings']
+
+	def update_fingerprints(self, store):
+		"""
+		Store the fingerprints of the messages, as the previous build of the next one.
+		They are not stored if the new warnings make the build fail, so that they remain new until they are fixed.
+		"""
+		if self.novelty is not None and not self.new_warnings_fail():
+			store.save(self.novelty.fingerprints())
+
+	def collecting(self, kind, messages, collected):
+		for message in messages:
+			collected.append(Message.from_parser(kind, message))
+			yield message
+
+	def process_parser(self, parser, store=None, errors_known=None, collected=None):
+		"""
+		Process information from the parser and print out the gist of it, and return the first error, if any.
+		If a `FingerprintStore` is given, the messages are compared with those of the previous build.
+		The messages are appended to the list `collected`, if given.
+		"""
+		processors = {'box': self.process_boxes, 'ref': self.process_references, 'warning': self.process_warnings}
+		for kind, messages in self.parsed(parser, store, errors_known):
+			if collected is not None:
+				messages = self.collecting(kind, messages, collected)
+			if kind in processors:
+				processors[kind](messages)
+			else:
+				errors = messages
+		self.update_fingerprints(store)
+		if self.novelty is not None and self.options['new_only']:
+			self.process_resolved(self.novelty)
+		errors = list(errors)
 		if errors:
 			for error in errors:
 				self.logger.latex_error(error)
 			return errors[0]
-
+		return None
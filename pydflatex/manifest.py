@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import json
+import hashlib
+
+from .cleaner import Cleaner
+from .recorder import Recording
+from .files import atomic_write, file_digest
+
+def local_inputs(tex_path, fls_file=None):
+	"""
+	The source files of a document: the file itself, and the files it read by a relative path
+	according to the .fls file of its last build, except those it also wrote (.aux, .toc, ...).
+	Generate their paths relative to the directory of the document, which do not depend on the directory
+	of the build, and their paths relative to the current directory.
+	The .fls file is that of the current directory, unless `fls_file` is given.
+	"""
+	base = os.path.abspath(os.path.dirname(tex_path))
+	file_base = os.path.splitext(os.path.basename(tex_path))[0]
+	paths = [os.path.abspath(tex_path)]
+	try:
+		recording = Recording(fls_file or Cleaner.fls_file(file_base))
+	except (IOError, OSError):
+		recording = None
+	if recording is not None:
+		outputs = set(os.path.normpath(output) for output in recording.outputs)
+		for path in recording.inputs:
+			if not os.path.isabs(path) and os.path.normpath(path) not in outputs:
+				paths.append(os.path.abspath(recording.path(path)))
+	names = set()
+	for path in paths:
+		name = os.path.relpath(path, base)
+		if name not in names:
+			names.add(name)
+			yield name, path
+
+def source_digest(path):
+	"""
+	The digest of the content of a source file, or None if it cannot be read.
+	"""
+	try:
+		return file_digest(path)
+	except (IOError, OSError):
+		return None
+
+def input_hashes(tex_path):
+	"""
+	The digests of the contents of the source files of a document, by path relative to its directory.
+	"""
+	return dict((name, source_digest(path)) for name, path in local_inputs(tex_path))
+
+def input_digest(tex_path, hashes=None):
+	"""
+	A digest of the contents of the source files of a document.
+	The digests of `hashes`, as returned by `input_hashes`, are used for the files they contain,
+	e.g., to describe the sources of a build as they were before it started.
+	"""
+	hashes = hashes or {}
+	digest = hashlib.sha256()
+	for name, path in sorted(local_inputs(tex_path)):
+		content = hashes[name] if name in hashes else source_digest(path)
+		digest.update('{0}\0{1}\0'.format(name, content or 'missing').encode('utf-8'))
+	return digest.hexdigest()
+
+class Manifest(object):
+	"""
+	Checkpoint of a batch build, stored as a JSON file mapping each document to:
+		- status: 'pending', 'built' or 'failed'
+		- digest: the digest of its sources when it was last built
+		- attempts: the number of times it was built in the last batch
+		- error, duration: the result of the last attempt
+	The file is rewritten after each document, so that an interrupted batch may be resumed.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.entries = self.load()
+
+	def load(self):
+		try:
+			with open(self.path) as manifest:
+				return json.load(manifest)
+		except (IOError, OSError, ValueError):
+			return {}
+
+	def save(self):
+		with atomic_write(self.path) as manifest:
+			json.dump(self.entries, manifest, sort_keys=True, indent=1)
+
+	def up_to_date(self, tex_path, digest):
+		"""
+		True if the document was successfully built from sources with the given digest.
+		"""
+		entry = self.entries.get(tex_path)
+		return entry is not None and entry['status'] == 'built' and entry.get('digest') == digest
+
+	def pending(self, tex_paths):
+		for tex_path in tex_paths:
+			self.entries[tex_path] = dict(self.entries.get(tex_path, {}), status='pending', attempts=0)
+		self.save()
+
+	def update(self, result):
+		entry = self.entries.setdefault(result['tex_path'], {'attempts': 0})
+		entry.update(status='built' if result['success'] else 'failed', digest=result.get('digest'), error=result['error'], duration=result['duration'])
+		entry['attempts'] = entry.get('attempts', 0) + 1
+		self.save()
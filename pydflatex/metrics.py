@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from .files import file_lock, atomic_write
+
+try:
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError: # Python 2
+	from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+# the metrics, with their type, help text and histogram buckets
+families = OrderedDict([
+	('pydflatex_builds_total', ('counter', 'Number of builds, by result.', None)),
+	('pydflatex_phase_duration_seconds', ('histogram', 'Duration of the phases of the builds.', (.1, .25, .5, 1, 2.5, 5, 10, 25, 50, 100, 250))),
+	('pydflatex_passes', ('histogram', 'Number of runs of the engine per build.', (1, 2, 3, 4, 5, 10))),
+	('pydflatex_limit_violations_total', ('counter', 'Number of engine runs stopped by a resource limit, by kind of limit.', None)),
+	('pydflatex_cache_requests_total', ('counter', 'Number of cache lookups, by cache and result (requested or skipped for the inputs read ahead).', None)),
+	('pydflatex_log_bytes_total', ('counter', 'Number of bytes of log parsed.', None)),
+	('pydflatex_parse_throughput_bytes_per_second', ('histogram', 'Log parsing throughput.', (1e5, 1e6, 1e7, 1e8, 1e9))),
+	('pydflatex_messages_total', ('counter', 'Number of messages found in the logs, by kind.', None)),
+	])
+
+re_sample = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?P<labels>.*)\})?\s+(?P<value>\S+)$')
+re_label = re.compile(r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)"')
+
+def escape(value):
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def unescape(value):
+	return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+def format_value(value):
+	if float(value).is_integer():
+		return str(int(value))
+	return repr(float(value))
+
+def format_bound(bound):
+	if bound == float('inf'):
+		return '+Inf'
+	return format_value(bound)
+
+class Metrics(object):
+	"""
+	Counters and histograms in the Prometheus text format.
+	The samples are indexed by their name and labels; they are all cumulative,
+	so that the metrics of several builds are merged by adding them.
+	"""
+	def __init__(self):
+		self.samples = OrderedDict()
+		self.lock = threading.Lock()
+
+	def inc(self, name, value=1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			self.samples[key] = self.samples.get(key, 0) + value
+
+	def observe(self, name, value, **labels):
+		buckets = families[name][2]
+		for bound in list(buckets) + [float('inf')]:
+			self.inc(name + '_bucket', int(value <= bound), le=format_bound(bound), **labels)
+		self.inc(name + '_sum', value, **labels)
+		self.inc(name + '_count', 1, **labels)
+
+	def merge(self, samples):
+		"""
+		Add samples, as given by `items`.
+		"""
+		for (name, labels), value in samples:
+			self.inc(name, value, **dict(labels))
+
+	def items(self):
+		with self.lock:
+			return list(self.samples.items())
+
+	@classmethod
+	def family(self, name):
+		for suffix in ['_bucket', '_sum', '_count']:
+			if name.endswith(suffix) and name[:-len(suffix)] in families and families[name[:-len(suffix)]][0] == 'histogram':
+				return name[:-len(suffix)]
+		return name
+
+	def render(self):
+		"""
+		The metrics in the Prometheus text exposition format.
+		"""
+		by_family = OrderedDict()
+		for (name, labels), value in self.items():
+			by_family.setdefault(self.family(name), []).append((name, labels, value))
+		lines = []
+		for family, samples in by_family.items():
+			if family in families:
+				kind, text, buckets = families[family]
+				lines.append('# HELP {0} {1}'.format(family, text))
+				lines.append('# TYPE {0} {1}'.format(family, kind))
+			for name, labels, value in samples:
+				if labels:
+					name += '{' + ','.join('{0}="{1}"'.format(label, escape(str(label_value))) for label, label_value in labels) + '}'
+				lines.append('{0} {1}'.format(name, format_value(value)))
+		return ''.join(line + '\n' for line in lines)
+
+	@classmethod
+	def parse(self, text):
+		metrics = self()
+		for line in text.splitlines():
+			m = re_sample.match(line)
+			if line.startswith('#') or not m:
+				continue
+			labels = dict((label.group('name'), unescape(label.group('value'))) for label in re_label.finditer(m.group('labels') or ''))
+			metrics.inc(m.group('name'), float(m.group('value')), **labels)
+		return metrics
+
+	@classmethod
+	def load(self, path):
+		"""
+		The metrics of a textfile, or no metric if it does not exist.
+		"""
+		try:
+			with open(path) as textfile:
+				return self.parse(textfile.read())
+		except (IOError, OSError):
+			return self()
+
+	def write(self, path):
+		"""
+		Write the metrics atomically, e.g., for the textfile collector of the node exporter.
+		"""
+		with atomic_write(path) as textfile:
+			textfile.write(self.render())
+
+	def export(self, path):
+		"""
+		Add the metrics to a textfile, which may be shared by concurrent builds.
+		"""
+		with file_lock(path + os.path.extsep + 'lock'):
+			metrics = self.load(path)
+			metrics.merge(self.items())
+			metrics.write(path)
+
+	def serve(self, port, address=''):
+		"""
+		Serve the metrics over HTTP on a background thread, and return the server.
+		"""
+		metrics = self
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				body = metrics.render().encode('utf8')
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass
+		server = HTTPServer((address, port), Handler)
+		thread = threading.Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+		return server
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .processor import Processor
+from .cleaner import Cleaner
+from .recorder import Recording
+
+def readahead(path, block_size=1 << 20):
+	"""
+	Bring a file into the page cache, and return its size.
+	The kernel is asked to read the file ahead when possible, otherwise it is read and discarded.
+	"""
+	with open(path, 'rb') as input_file:
+		size = os.fstat(input_file.fileno()).st_size
+		if hasattr(os, 'posix_fadvise'):
+			os.posix_fadvise(input_file.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+		else:
+			while input_file.read(block_size):
+				pass
+	return size
+
+class Prefetcher(Processor):
+	"""
+	Warm the cache with the files read by the previous run of the engine, as listed in its .fls file,
+	concurrently with the engine, which reads them one at a time.
+	Options:
+		- prefetch_jobs: number of files read ahead in parallel
+	"""
+
+	defaults = Processor.defaults.copy()
+	defaults.update({
+		'prefetch_jobs': 16,
+	})
+
+	def __init__(self, logger=None, options=None):
+		Processor.__init__(self, logger, options)
+		self.executor = None
+		self.lock = threading.Lock()
+		self.stopped = False
+		# number of listed files, of files whose reading ahead was requested, and their size
+		# (whether they were already cached, or read by the kernel before the engine, is not known)
+		self.listed = 0
+		self.requested = 0
+		self.size = 0
+
+	@classmethod
+	def inputs(self, file_base):
+		"""
+		The files read during the previous run: an empty list if unknown.
+		"""
+		try:
+			recording = Recording(Cleaner.fls_file(file_base))
+		except (IOError, OSError):
+			return []
+		return [recording.path(path) for path in recording.inputs]
+
+	def fetch(self, path):
+		if self.stopped:
+			return
+		try:
+			size = readahead(path)
+		except (IOError, OSError):
+			return
+		with self.lock:
+			self.requested += 1
+			self.size += size
+
+	def start(self, file_base):
+		"""
+		Start reading the inputs ahead in the background.
+		"""
+		paths = [path for path in self.inputs(file_base) if not os.path.isdir(path)]
+		self.listed = len(paths)
+		if not paths:
+			return
+		self.executor = ThreadPoolExecutor(max_workers=self.options['prefetch_jobs'])
+		for path in paths:
+			self.executor.submit(self.fetch, path)
+
+	def stop(self):
+		"""
+		Skip the files which are not read yet, since the engine has read them by now, and report.
+		"""
+		if self.executor is not None:
+			self.stopped = True
+			self.executor.shutdown(wait=True)
+			self.executor = None
+		if self.listed:
+			self.logger.message('Read ahead {0} of {1} input files ({2:.1f} MB)'.format(self.requested, self.listed, self.size / (1 << 20)))
@@ -10,6 +10,15 @@ class LaTeXError(Exception):
 	LaTeX Error
 	"""
 
+class ResourceLimitExceeded(LaTeXError):
+	"""
+	The engine was stopped because it exceeded a resource limit.
+	The kind of limit is one of 'timeout', 'cpu', 'memory' or 'file_size'.
+	"""
+	def __init__(self, kind, message):
+		LaTeXError.__init__(self, message)
+		self.kind = kind
+
 class Processor(object):
 	"""
 	Models an object with a logger and some options.
@@ -28,7 +37,7 @@ class Processor(object):
 			self.logger = logger
 		else:
 			self.logger = self.setup_logger()
-		self.logger.debug("%s\ninitialized with\n%s\n" % (type(self), options))
+		self.logger.debug("%s\ninitialized with\n%s\n", type(self), options)
 
 	defaults={
 			'colour': True,
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+
+class Recording(object):
+	"""
+	The files read and written by the engine, as recorded in the .fls file produced with the -recorder option.
+	The paths are listed once, in the order in which they first appear.
+	"""
+	def __init__(self, fls_file):
+		self.pwd = None
+		self.inputs = []
+		self.outputs = []
+		seen = set()
+		with open(fls_file) as lines:
+			for line in lines:
+				kind, _, path = line.rstrip('\n').partition(' ')
+				if kind == 'PWD':
+					self.pwd = path
+				elif kind in ('INPUT', 'OUTPUT') and (kind, path) not in seen:
+					seen.add((kind, path))
+					(self.inputs if kind == 'INPUT' else self.outputs).append(path)
+
+	def path(self, path):
+		"""
+		Path of a recorded file relative to the current directory.
+		"""
+		if self.pwd is None or os.path.isabs(path):
+			return path
+		return os.path.join(self.pwd, path)
+
+	def included_files(self, file_base):
+		"""
+		The files included with \\include: those with their own .aux file.
+		Generate the name given to \\include, the path of the .tex file and the path of its .aux file.
+		"""
+		sources = {}
+		for path in self.inputs:
+			root, ext = os.path.splitext(os.path.normpath(path))
+			if ext == os.path.extsep + 'tex':
+				sources[root] = path
+		for output in self.outputs:
+			name, ext = os.path.splitext(os.path.normpath(output))
+			if ext != os.path.extsep + 'aux' or name == file_base:
+				continue
+			for root, path in sources.items():
+				if root == name or root.endswith(os.path.sep + name):
+					yield name, self.path(path), self.path(output)
+					break
+
+def newer(path, reference):
+	"""
+	True if `path` was modified after `reference`, or if `reference` does not exist.
+	"""
+	try:
+		return os.path.getmtime(path) > os.path.getmtime(reference)
+	except OSError:
+		return True
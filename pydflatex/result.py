@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+def to_int(value):
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+class Message(object):
+	"""
+	A message found in the log.
+	Its kind is one of 'box', 'ref', 'warning', 'error' or 'abort'.
+	"""
+	fields = ['kind', 'text', 'file', 'line', 'last', 'page', 'pkg', 'code', 'ref', 'cite', 'why', 'context']
+
+	def __init__(self, kind, text, file=None, line=None, last=None, page=None, pkg=None, code=None, ref=None, cite=None, why=None, context=None):
+		self.kind = kind
+		self.text = text
+		self.file = file
+		self.line = to_int(line)
+		self.last = to_int(last)
+		self.page = to_int(page)
+		self.pkg = pkg
+		self.code = code
+		self.ref = ref
+		self.cite = cite
+		self.why = why
+		# the source lines around the line of the message, as [number, text] pairs
+		self.context = context
+
+	@classmethod
+	def from_parser(self, kind, info):
+		"""
+		Message from a dictionary generated by the log parser, for a message of the given kind.
+		"""
+		if kind == 'error':
+			kind = info.get('kind', kind)
+		return self(kind, **dict((field, info.get(field)) for field in self.fields[1:]))
+
+	def to_dict(self):
+		"""
+		Dictionary in the format of the log parser, without the missing entries.
+		"""
+		info = {}
+		for field in self.fields:
+			value = getattr(self, field)
+			if value is not None:
+				info[field] = value
+		for field in ['line', 'last']:
+			if field in info:
+				info[field] = str(info[field])
+		return info
+
+	@classmethod
+	def from_dict(self, info):
+		return self(**info)
+
+	def __repr__(self):
+		return '<{0} {1!r} {2}:{3}>'.format(self.kind, self.text, self.file, self.line)
+
+	def render(self, logger):
+		"""
+		Display the message with a `LaTeXLogger`.
+		"""
+		info = self.to_dict()
+		if self.kind == 'box':
+			logger.box_warning(info)
+		elif self.kind == 'ref':
+			logger.ref_warning(info)
+		elif self.kind == 'warning':
+			logger.latex_warning(info)
+		else:
+			info.setdefault('file', None)
+			logger.latex_error(info)
+
+class BuildResult(object):
+	"""
+	The outcome of a build:
+		- tex_path: path of the typeset file
+		- success: True if there was neither error nor exceeded resource limit
+		- messages: list of `Message`, in the order boxes, references, warnings, errors
+		- passes: number of runs of the engine
+		- timings: duration of each phase, in seconds
+		- pdf_path: path of the produced pdf file
+		- inputs, outputs: files read and written by the engine, from the .fls file
+		- violation: kind of resource limit exceeded by the engine, if any
+	"""
+	def __init__(self, tex_path, success=False, messages=(), passes=0, timings=None, pdf_path=None, inputs=(), outputs=(), violation=None):
+		self.tex_path = tex_path
+		self.success = success
+		self.messages = list(messages)
+		self.passes = passes
+		self.timings = timings or {}
+		self.pdf_path = pdf_path
+		self.inputs = list(inputs)
+		self.outputs = list(outputs)
+		self.violation = violation
+
+	@property
+	def errors(self):
+		return [message for message in self.messages if message.kind in ('error', 'abort')]
+
+	@property
+	def warnings(self):
+		return [message for message in self.messages if message.kind not in ('error', 'abort')]
+
+	def render(self, logger):
+		for message in self.messages:
+			message.render(logger)
+
+	def to_dict(self):
+		"""
+		Representation made of basic types, e.g., to be serialized as JSON.
+		"""
+		return {
+			'tex_path': self.tex_path,
+			'success': self.success,
+			'messages': [message.to_dict() for message in self.messages],
+			'passes': self.passes,
+			'timings': self.timings,
+			'pdf_path': self.pdf_path,
+			'inputs': self.inputs,
+			'outputs': self.outputs,
+			'violation': self.violation,
+			}
+
+	@classmethod
+	def from_dict(self, info):
+		info = dict(info)
+		info['messages'] = [Message.from_dict(message) for message in info.get('messages', [])]
+		return self(**info)
@@ -3,21 +3,74 @@
 from __future__ import division
 
 import os
+import json
 import time
+from collections import Counter
 
-from .processor import Processor, LaTeXError
+from .processor import Processor, LaTeXError, ResourceLimitExceeded
 from .typesetter import Typesetter
 from .open_pdf import OpenPdf
 from .log_processor import LogProcessor
 from .cleaner import Cleaner
+from .graphics import GraphicsConverter
+from .externalize import FigureBuilder
+from .prefetch import Prefetcher
+from .singleflight import SingleFlight
+from .history import BuildHistory
+from .metrics import Metrics
+from .recorder import Recording, newer
+from .result import BuildResult
+from . import latex_logger
+from .stages import Stages
 
 class Runner(Processor):
+	"""
+	Typeset a file, process its log, and post process.
+	Options (besides those of the other processors):
+		- typesetting
+		- log_parsing
+		- open_after
+		- max_passes: rerun the engine when LaTeX asks for it, at most that many times
+		- history: path of the SQLite database in which build statistics are recorded
+		- fast_preview: only typeset the \\include'd files which changed since the previous build
+		- overlap_stages: clean and open the pdf while the log is being processed (not with `fail_on_new_warnings`)
+		- metrics_file: Prometheus textfile in which the metrics of the builds are accumulated
+		- convert_graphics: convert the EPS and SVG figures in parallel before typesetting (see `GraphicsConverter`)
+		- externalize: compile the figures listed by the TikZ external library in parallel after the first pass (see `FigureBuilder`)
+		- prefetch_inputs: read the inputs of the previous run ahead, while the engine starts (see `Prefetcher`)
+		- jobname: name of the output files, instead of that of the tex file
+		- single_flight: build a document once at a time, across processes, and coalesce the builds requested concurrently (see `SingleFlight`)
+	"""
 
-	defaults = {
+	defaults = Processor.defaults.copy()
+	defaults.update(Typesetter.defaults)
+	defaults.update(LogProcessor.defaults)
+	defaults.update(GraphicsConverter.defaults)
+	defaults.update(FigureBuilder.defaults)
+	defaults.update(Prefetcher.defaults)
+	defaults.update({
 		'typesetting': True,
 		'log_parsing': True,
 		'open_after': False,
-	}
+		'max_passes': 1,
+		'history': None,
+		'fast_preview': False,
+		'overlap_stages': True,
+		'metrics_file': None,
+		'convert_graphics': False,
+		'externalize': False,
+		'prefetch_inputs': False,
+		'single_flight': False,
+		'jobname': None,
+	})
+
+	# metrics of the last build
+	build_metrics = None
+
+	def __init__(self, logger=None, options=None):
+		Processor.__init__(self, logger, options)
+		# number of lookups of each cache during the last build, by (cache, result)
+		self.cache_lookups = Counter()
 
 	@classmethod
 	def paths(self, tex_path):
@@ -49,53 +102,384 @@ class Runner(Processor):
 		if tex_path is None:
 			tex_path = self.tex_path
 		paths = self.paths(tex_path)
+		if self.options['jobname']:
+			# the output files are named after the job
+			paths['file_base'] = self.options['jobname']
+			paths['root'] = os.path.join(paths['base'], self.options['jobname'])
 		return tex_path, paths
 
-	def typeset(self, full_path):
+	def job_name(self, full_path):
+		"""
+		The name of the output files of the given tex file.
+		"""
+		return self.options['jobname'] or os.path.splitext(os.path.basename(full_path))[0]
+
+	def rerun_needed(self, log_file_path):
+		try:
+			parser = LogProcessor.parse_log(log_file_path, wide=self.options['wide_lines'], compressed=False)
+		except (IOError, OSError, ValueError):
+			return False
+		return parser.run_needed()
+
+	def included_files(self, fls_file, file_base):
+		"""
+		The \\include'd files of the previous build, as generated by `Recording.included_files`.
+		The .fls file of a fast preview only lists the files it included,
+		so that the others are kept in a .includes file next to it, until the next full build.
+		"""
+		try:
+			recording = Recording(fls_file)
+		except (IOError, OSError):
+			return []
+		included = [list(include) for include in recording.included_files(file_base)]
+		try:
+			with open(os.path.splitext(fls_file)[0] + os.path.extsep + 'includes') as includes:
+				previous = json.load(includes)
+		except (IOError, OSError, ValueError):
+			return included
+		if previous['full']:
+			return included
+		names = set(name for name, tex_path, aux_path in included)
+		kept = [include for include in previous['included'] if include[0] not in names and os.path.exists(include[1])]
+		return kept + included
+
+	def changed_includes(self, fls_file, file_base):
+		"""
+		The names of the \\include'd files which changed since their .aux file was written,
+		according to the previous builds (see `included_files`).
+		Return None if a full build is needed: no previous build, no included files, or none of them changed.
+		"""
+		included = self.included_files(fls_file, file_base)
+		changed = [name for name, tex_path, aux_path in included if newer(tex_path, aux_path)]
+		if included:
+			with open(os.path.splitext(fls_file)[0] + os.path.extsep + 'includes', 'w') as includes:
+				json.dump({'full': not changed, 'included': included}, includes)
+		if not changed:
+			return None
+		self.cache_lookups['preview', 'hit'] += len(included) - len(changed)
+		self.cache_lookups['preview', 'miss'] += len(changed)
+		return changed
+
+	def convert_graphics(self, paths, logger=None):
+		"""
+		Convert the graphics files ahead of the engine, if required.
+		"""
+		if not self.options['convert_graphics']:
+			return
+		converter = GraphicsConverter(logger=logger or self.logger, options=self.options)
+		try:
+			self.timed('graphics', converter.convert_all, paths['full_path'], paths['file_base'])
+		finally:
+			for result, count in converter.lookups.items():
+				self.cache_lookups['graphics', result] += count
+
+	def preamble(self, paths, logger=None):
+		"""
+		TeX code to execute before the document: restrict the build to the changed included files in fast preview mode.
+		"""
+		if not self.options['fast_preview']:
+			return None
+		logger = logger or self.logger
+		changed = self.changed_includes(Cleaner.fls_file(paths['file_base']), paths['file_base'])
+		if changed is None:
+			logger.message('Full build')
+			return None
+		logger.message('Fast preview of {0}'.format(', '.join(changed)))
+		return '\\includeonly{{{0}}}'.format(','.join(changed))
+
+	def typeset(self, full_path, log_file_path=None, preamble=None, logger=None):
+		"""
+		Typeset, rerunning as long as needed but at most `max_passes` times.
+		"""
+		logger = logger or self.logger
 		time_start = time.time()
-		typesetter = Typesetter(logger=self.logger, options=self.options)
-		typesetter.typeset(full_path)
+		typesetter = Typesetter(logger=logger, options=self.options)
+		self.passes = 0
+		externalized = not self.options['externalize']
+		prefetcher = self.prefetch(full_path, logger)
+		while True:
+			try:
+				violation = typesetter.typeset(full_path, preamble, self.options['jobname'])
+			finally:
+				if prefetcher is not None:
+					self.prefetched(prefetcher)
+					prefetcher = None
+			self.passes += 1
+			if violation is not None:
+				self.violation = ResourceLimitExceeded(violation, typesetter.violation_message(violation))
+				break
+			if not externalized:
+				# the figures are only listed during the first pass
+				externalized = True
+				if self.build_figures(full_path, preamble, logger):
+					logger.message('Final pass')
+					continue
+			if self.passes >= self.options['max_passes'] or log_file_path is None:
+				break
+			if not self.rerun_needed(log_file_path):
+				break
+			logger.message('Rerun needed')
 		time_end = time.time()
 		return time_end - time_start
 
-	def process_log(self, base, file_base):
-		log_processor = LogProcessor(logger=self.logger, options=self.options)
-		log_file_path = log_processor.log_file_path(base, file_base)
-		error = log_processor.process_log(log_file_path)
-		return error
+	def prefetch(self, full_path, logger=None):
+		"""
+		Start reading the inputs of the previous run ahead, if required, and return the `Prefetcher`.
+		"""
+		if not self.options['prefetch_inputs']:
+			return None
+		prefetcher = Prefetcher(logger=logger or self.logger, options=self.options)
+		prefetcher.start(self.job_name(full_path))
+		return prefetcher
+
+	def prefetched(self, prefetcher):
+		"""
+		Stop the prefetching once the first pass is over, and count the files read ahead,
+		and those skipped: missing, or not reached before the end of the pass.
+		"""
+		prefetcher.stop()
+		self.cache_lookups['prefetch', 'requested'] += prefetcher.requested
+		self.cache_lookups['prefetch', 'skipped'] += prefetcher.listed - prefetcher.requested
+
+	def build_figures(self, full_path, preamble=None, logger=None):
+		"""
+		Compile the stale externalized figures, and return their number.
+		Their errors are kept in `figure_errors`.
+		"""
+		builder = FigureBuilder(logger=logger or self.logger, options=self.options)
+		try:
+			return self.timed('figures', builder.build, full_path, self.job_name(full_path), preamble)
+		finally:
+			self.figure_errors.extend(getattr(builder, 'messages', []))
+
+	def log_processor(self, logger=None):
+		"""
+		The processor of the log: that of the current build, unless only the log is parsed.
+		"""
+		return LogProcessor(logger=logger or self.logger, options=dict(self.options, compressed_fallback=not self.options['typesetting']))
+
+	def process_log(self, paths, logger, render, errors_known=None):
+		"""
+		The messages of the log, displayed as they are found if `render` is true.
+		"""
+		log_processor = self.log_processor(logger)
+		log_file_path = log_processor.log_file_path(paths['base'], paths['file_base'])
+		if render:
+			messages = []
+			log_processor.display_log(log_file_path, errors_known, messages)
+		else:
+			messages = log_processor.collect_log(log_file_path, errors_known)
+		self.counts = log_processor.counts
+		self.new_warnings_failed = log_processor.new_warnings_fail()
+		return messages
+
+	def recording(self, file_base):
+		"""
+		The files read and written during the last run of the engine, or None if unknown.
+		"""
+		try:
+			return Recording(Cleaner.fls_file(file_base))
+		except (IOError, OSError):
+			return None
 
-	def clean(self, base, file_base):
-		cleaner = Cleaner(logger=self.logger, options=self.options)
+	def clean(self, base, file_base, logger=None):
+		cleaner = Cleaner(logger=logger or self.logger, options=self.options)
 		cleaner.handle_aux(base, file_base)
 
-	def open_pdf(self, root):
-		opener = OpenPdf(logger=self.logger, options=self.options)
+	def open_pdf(self, root, logger=None):
+		opener = OpenPdf(logger=logger or self.logger, options=self.options)
 		opener.open_pdf(root)
 
-	def run(self, tex_path=None):
+	def timed(self, phase, function, *args, **kwargs):
+		time_start = time.time()
+		result = function(*args, **kwargs)
+		self.timings[phase] = time.time() - time_start
+		return result
+
+	def log_size(self, paths):
+		log_file_path = LogProcessor.log_file_path(paths['base'], paths['file_base'])
+		try:
+			return os.path.getsize(log_file_path)
+		except OSError:
+			return None
+
+	def record(self, paths, success, logger=None):
+		"""
+		Record the statistics of the build in the history, and warn if it was unusually slow.
+		"""
+		history = BuildHistory(self.options['history'])
+		log_size = self.log_size(paths)
+		total = time.time() - self.started
+		history.record(paths['full_path'], started=self.started, success=success, passes=self.passes,
+				typesetting=self.timings.get('typesetting'), log_parsing=self.timings.get('log_parsing'), cleaning=self.timings.get('cleaning'),
+				total=total, warnings=sum(count for kind, count in self.counts.items() if kind != 'error'), errors=self.counts.get('error'), log_size=log_size)
+		if success:
+			usual = history.regression(paths['full_path'], total)
+			if usual is not None:
+				(logger or self.logger).warning('Performance regression: "{name}" took {time:.1f}s instead of {usual:.1f}s usually.'.format(name=paths['full_path'], time=total, usual=usual))
+
+	def metrics(self, paths, success):
+		"""
+		The metrics of the last build.
+		"""
+		metrics = Metrics()
+		metrics.inc('pydflatex_builds_total', result='success' if success else 'failure')
+		for phase, duration in self.timings.items():
+			metrics.observe('pydflatex_phase_duration_seconds', duration, phase=phase)
+		if 'typesetting' in self.timings:
+			metrics.observe('pydflatex_passes', self.passes)
+		if self.violation is not None:
+			metrics.inc('pydflatex_limit_violations_total', kind=self.violation.kind)
+		for (cache, result), count in self.cache_lookups.items():
+			metrics.inc('pydflatex_cache_requests_total', count, cache=cache, result=result)
+		for kind, count in self.counts.items():
+			metrics.inc('pydflatex_messages_total', count, kind=kind)
+		log_size = self.log_size(paths)
+		if log_size is not None and 'log_parsing' in self.timings:
+			metrics.inc('pydflatex_log_bytes_total', log_size)
+			if self.timings['log_parsing'] > 0:
+				metrics.observe('pydflatex_parse_throughput_bytes_per_second', log_size / self.timings['log_parsing'])
+		return metrics
+
+	def export_metrics(self, build_metrics):
+		"""
+		Add the metrics of a build to the textfile, which may be shared by concurrent builds.
+		"""
+		build_metrics.export(self.options['metrics_file'])
+
+	def archive_log(self, paths, logger=None):
+		"""
+		Compress the analysed log, if required.
+		"""
+		if self.options['log_parsing']:
+			log_processor = LogProcessor(logger=logger or self.logger, options=self.options)
+			log_processor.archive_log(log_processor.log_file_path(paths['base'], paths['file_base']))
+
+	def build(self, tex_path=None, render=False):
 		"""
-		Compile the current tex file.
+		Compile the tex file and return a `BuildResult`.
+		Nothing is displayed, unless `render` is true: the progress and the messages are then displayed as they come.
+		The errors in the document are part of the result: they do not raise exceptions.
+		With `single_flight`, the result may be that of a concurrent build of the same sources.
 		"""
+		logger = self.logger if render else latex_logger.silent_logger()
 		tex_path, paths = self.prepare(tex_path)
+		if not self.options['single_flight']:
+			return self.build_paths(paths, logger, render)
+		built = []
+		def build():
+			built.append(paths['full_path'])
+			return self.build_paths(paths, logger, render)
+		result = SingleFlight(paths['root']).build(paths['full_path'], build)
+		if render and not built:
+			# the result of a concurrent build
+			result.render(logger)
+		return result
 
-		full_path = paths['full_path']
+	def run(self, tex_path=None):
+		"""
+		Compile the tex file, display the progress and the messages, and raise an exception if the build failed.
+		The errors in the document only make it fail with `halt_on_errors`.
+		"""
+		result = self.build(tex_path, render=True)
+		if result.violation is not None:
+			raise ResourceLimitExceeded(result.violation, Typesetter(logger=self.logger, options=self.options).violation_message(result.violation))
+		if result.errors:
+			if self.options['halt_on_errors']:
+				raise LaTeXError(result.errors[0].text)
+		elif not result.success:
+			raise LaTeXError('New warnings since the previous build')
+		return result
+
+	def build_paths(self, paths, logger, render):
+		self.started = time.time()
+		self.timings = {}
+		self.passes = 0
+		self.counts = {}
+		self.violation = None
+		self.cache_lookups = Counter()
+		self.figure_errors = []
+		self.new_warnings_failed = False
+		messages = []
+		success = False
+		try:
+			messages = self.run_phases(paths, logger, render)
+			success = self.violation is None and not self.new_warnings_failed and not any(message.kind in ('error', 'abort') for message in messages)
+		finally:
+			if self.options['history']:
+				self.record(paths, success, logger)
+			self.build_metrics = self.metrics(paths, success)
+			if self.options['metrics_file']:
+				self.export_metrics(self.build_metrics)
+			self.archive_log(paths, logger)
+
+		recording = self.recording(paths['file_base'])
+		return BuildResult(paths['full_path'],
+				success=success,
+				messages=messages,
+				passes=self.passes,
+				timings=self.timings,
+				pdf_path=paths['root'] + os.path.extsep + 'pdf',
+				inputs=recording.inputs if recording else (),
+				outputs=recording.outputs if recording else (),
+				violation=self.violation.kind if self.violation else None)
+
+	def run_phases(self, paths, logger, render):
+		# the new warnings, which may make the build fail, are only known once the log is processed
+		if not (self.options['typesetting'] and self.options['overlap_stages']) or self.options['fail_on_new_warnings']:
+			return self.phases(paths, logger, render)
+		stages = Stages(logger)
+		try:
+			messages = self.phases(paths, logger, render, stages)
+		except Exception:
+			stages.join(raise_errors=False)
+			raise
+		stages.join()
+		return messages
+
+	def completed(self, errors):
+		"""
+		True if the build is to be post processed: no exceeded limit, failed figure, or error stopping the build.
+		"""
+		return self.violation is None and not self.figure_errors and not (errors and self.options['halt_on_errors']) and not self.new_warnings_failed
 
+	def phases(self, paths, logger, render, stages=None):
+		"""
+		Typeset, process the log and post process, and return the messages of the build.
+		With `stages`, the post processing stages run while the warnings of the log are being processed:
+		the cleaning starts and the pdf is opened as soon as it is known that there is no error.
+		Their output comes after the success message.
+		"""
+		full_path = paths['full_path']
 		if self.options['typesetting']:
-			time_diff = self.typeset(full_path)
+			self.convert_graphics(paths, logger)
+			log_file_path = LogProcessor.log_file_path(paths['base'], paths['file_base'])
+			time_diff = self.timed('typesetting', self.typeset, full_path, log_file_path, self.preamble(paths, logger), logger)
 			success_message = 'Typesetting of "{name}" completed in {time:.1f}s.'.format(name=full_path, time=(time_diff))
 
-		if self.options['log_parsing']:
-			# Parse log
-			error = self.process_log(paths['base'], paths['file_base'])
-			if error and self.options['halt_on_errors']:
-				raise LaTeXError(error.get('text'))
+		def errors_known(errors):
+			if stages is None or not self.completed(errors):
+				return
+			stages.start(self.timed, 'cleaning', self.clean, paths['base'], paths['file_base'])
+			if render and self.options['open_after']:
+				stages.start(self.open_pdf, paths['root'])
 
-		if self.options['typesetting']:
-			# Print success message
-			self.logger.success(success_message)
-			# Post process
-			self.clean(paths['base'], paths['file_base'])
-			# Open pdf
-			if self.options['open_after']:
-				self.open_pdf(paths['root'])
+		messages = []
+		if self.options['log_parsing']:
+			try:
+				messages = self.timed('log_parsing', self.process_log, paths, logger, render, errors_known)
+			except (IOError, OSError, ValueError):
+				# the log of a stopped engine may be missing or truncated
+				if self.violation is None:
+					raise
+		else:
+			errors_known([])
+		messages = self.figure_errors + messages
 
+		if self.options['typesetting'] and self.completed([message for message in messages if message.kind in ('error', 'abort')]):
+			logger.success(success_message)
+			if stages is None:
+				self.timed('cleaning', self.clean, paths['base'], paths['file_base'], logger=logger)
+				if render and self.options['open_after']:
+					self.open_pdf(paths['root'], logger=logger)
+		return messages
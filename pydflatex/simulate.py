@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: UTF-8
+"""
+Simulated TeX engine, taking the arguments of pdflatex, to exercise pydflatex without a TeX installation:
+
+	pydflatex --engine "python -m pydflatex.simulate --scenario scenario.json" file.tex
+
+It writes the log, .aux, .fls and pdf files of the job, as described by a JSON scenario (see `Scenario`).
+"""
+from __future__ import division
+
+import os
+import re
+import sys
+import json
+import time
+
+re_input = re.compile(r"\\input\{(?P<file>[^}]*)\}$")
+re_pass = re.compile(r"^% simulated pass (?P<count>[0-9]+)$", re.MULTILINE)
+re_rerun = re.compile("LaTeX Warning:.*Rerun")
+re_pwd = re.compile(r"^PWD .*$", re.MULTILINE)
+
+rerun_warning = 'LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.'
+
+class Scenario(object):
+	"""
+	Behaviour of the simulated engine, given as a JSON object with the entries:
+		- delay: duration of each run, in seconds
+		- log: path of a recorded log to replay, relative to the scenario file, instead of the generated one;
+		  its rerun warnings are replaced by those of the scenario
+		- aux, fls: paths of a recorded .aux and .fls file to replay, relative to the scenario file
+		- reruns: number of runs asking for a rerun, counted from a build without .aux file
+		- error: text of an error, which makes the run fail
+		- warnings, boxes: number of warnings and overfull boxes in the generated log
+		- inputs: additional files recorded as read
+		- outputs: additional files written, as a dictionary mapping their path to their content
+		- jobs: dictionary mapping jobnames to the entries which differ for them
+	"""
+	defaults = {
+		'delay': 0.,
+		'log': None,
+		'aux': None,
+		'fls': None,
+		'reruns': 0,
+		'error': None,
+		'warnings': 0,
+		'boxes': 0,
+		'inputs': [],
+		'outputs': {},
+	}
+
+	def __init__(self, spec=None, directory=os.curdir):
+		spec = dict(spec or {})
+		self.jobs = spec.pop('jobs', {})
+		self.spec = dict(self.defaults, **spec)
+		self.directory = directory
+
+	@classmethod
+	def load(self, path):
+		with open(path) as spec:
+			return self(json.load(spec), os.path.dirname(path))
+
+	def settings(self, jobname):
+		return dict(self.spec, **self.jobs.get(jobname, {}))
+
+class Engine(object):
+	"""
+	One run of the simulated engine.
+	"""
+	def __init__(self, scenario, source, jobname=None, halt_on_error=False):
+		self.source = source
+		self.jobname = jobname or os.path.splitext(os.path.basename(source))[0]
+		self.settings = scenario.settings(self.jobname)
+		self.directory = scenario.directory
+		self.halt_on_error = halt_on_error
+
+	def path(self, extension):
+		return self.jobname + os.path.extsep + extension
+
+	def recorded(self, name):
+		"""
+		The content of the recorded file of the scenario entry `name`.
+		"""
+		with open(os.path.join(self.directory, self.settings[name])) as recorded:
+			return recorded.read()
+
+	def previous_passes(self):
+		"""
+		The number of runs recorded in the .aux file.
+		"""
+		try:
+			with open(self.path('aux')) as aux:
+				m = re_pass.search(aux.read())
+		except (IOError, OSError):
+			return 0
+		return int(m.group('count')) if m else 0
+
+	def log(self, rerun, failed):
+		lines = ['This is pdfTeX, Version 3.14159265-2.6-1.40.21 (simulated)', 'entering extended mode', '({0}'.format(self.source)]
+		for index in range(self.settings['warnings']):
+			lines += ["LaTeX Warning: Reference `ref{0}' on page 1 undefined on input line {1}.".format(index, index + 1), '']
+		for index in range(self.settings['boxes']):
+			lines += ['Overfull \\hbox (1.0pt too wide) in paragraph at lines {0}--{1}'.format(index + 1, index + 2), '[]\\OT1/cmr/m/n/10 Word', ' []', '']
+		if failed:
+			lines += ['! {0}'.format(self.settings['error']), 'l.1 \\oops', '']
+			if self.halt_on_error:
+				lines += ['!  ==> Fatal error occurred, no output PDF file produced!']
+				return lines
+		lines += [' [1] )']
+		if rerun:
+			lines += ['', rerun_warning, '']
+		lines += ['Output written on {0} (1 page, 1000 bytes).'.format(self.path('pdf'))]
+		return lines
+
+	def replayed_log(self, rerun):
+		"""
+		The lines of the recorded log, asking for a rerun if and only if `rerun` is true.
+		"""
+		lines = [line for line in self.recorded('log').splitlines() if not re_rerun.match(line)]
+		if rerun:
+			written = [index for index, line in enumerate(lines) if line.startswith('Output written on ')]
+			index = written[-1] if written else len(lines)
+			lines[index:index] = ['', rerun_warning, '']
+		return lines
+
+	def run(self):
+		"""
+		Write the output files, and return the exit code.
+		"""
+		time.sleep(self.settings['delay'])
+		passes = self.previous_passes() + 1
+		rerun = passes <= self.settings['reruns']
+		failed = self.settings['error'] is not None
+		if self.settings['log'] is not None:
+			lines = self.replayed_log(rerun)
+		else:
+			lines = self.log(rerun, failed)
+		with open(self.path('log'), 'w') as log:
+			log.write('\n'.join(lines) + '\n')
+		with open(self.path('aux'), 'w') as aux:
+			aux.write(self.recorded('aux') if self.settings['aux'] is not None else '\\relax\n')
+			aux.write('% simulated pass {0}\n'.format(min(passes, self.settings['reruns'] + 1)))
+		outputs = [self.path('log'), self.path('aux')]
+		for path, content in self.settings['outputs'].items():
+			with open(path, 'w') as output:
+				output.write(content)
+			outputs.append(path)
+		if not (failed and self.halt_on_error):
+			with open(self.path('pdf'), 'wb') as pdf:
+				pdf.write(b'%PDF-1.4\n%%EOF\n')
+			outputs.append(self.path('pdf'))
+		with open(self.path('fls'), 'w') as fls:
+			if self.settings['fls'] is not None:
+				# recorded in another directory
+				fls.write(re_pwd.sub(lambda m: 'PWD {0}'.format(os.getcwd()), self.recorded('fls')))
+			else:
+				fls.write('PWD {0}\n'.format(os.getcwd()))
+				for path in [self.source] + list(self.settings['inputs']) + [self.path('aux')]:
+					fls.write('INPUT {0}\n'.format(path))
+				for path in outputs:
+					fls.write('OUTPUT {0}\n'.format(path))
+		return 1 if failed else 0
+
+def main(arguments):
+	scenario = Scenario()
+	jobname = None
+	halt_on_error = False
+	arguments = list(arguments)
+	if not arguments:
+		sys.stderr.write('No file given\n')
+		return 1
+	source = arguments.pop()
+	while arguments:
+		argument = arguments.pop(0)
+		if argument == '--scenario':
+			scenario = Scenario.load(arguments.pop(0))
+		elif argument.startswith('-jobname='):
+			jobname = argument[len('-jobname='):]
+		elif argument == '-halt-on-error':
+			halt_on_error = True
+	m = re_input.search(source)
+	if m:
+		source = m.group('file')
+	sys.stdout.write('This is pdfTeX, Version 3.14159265-2.6-1.40.21 (simulated)\n')
+	return Engine(scenario, source, jobname, halt_on_error).run()
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import stat
+import json
+import hashlib
+import tempfile
+
+from .result import BuildResult
+from .manifest import input_digest
+from .files import file_lock, atomic_write
+
+def lock_directory():
+	"""
+	The directory of the states and locks of the builds of the current user, private to that user,
+	who would otherwise receive the results written there by others.
+	"""
+	uid = getattr(os, 'getuid', lambda: None)()
+	directory = os.path.join(tempfile.gettempdir(), 'pydflatex-locks-{0}'.format(uid if uid is not None else os.environ.get('USERNAME', 'default')))
+	try:
+		os.mkdir(directory, 0o700)
+	except OSError:
+		# created earlier, maybe by another process
+		pass
+	info = os.lstat(directory)
+	if uid is not None and not (stat.S_ISDIR(info.st_mode) and info.st_uid == uid and not info.st_mode & 0o077):
+		raise OSError('The lock directory {0} is not private'.format(directory))
+	return directory
+
+class SingleFlight(object):
+	"""
+	Coalesce the builds of one document requested concurrently, by several threads or processes.
+	A build requested while a build from the same sources is running waits for it and receives its result.
+	The builds requested while a build from older sources is running are collapsed into one follow-up build.
+	The builds are numbered: the state of the document, shared through a file, records the number of the last
+	build started, the digest of its sources, the number of the last build finished and its result.
+	"""
+	def __init__(self, root, directory=None):
+		directory = directory or lock_directory()
+		if not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				# created by another process
+				pass
+		key = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()
+		self.state_lock_path = os.path.join(directory, key + '.state.lock')
+		self.build_lock_path = os.path.join(directory, key + '.build.lock')
+		self.state_path = os.path.join(directory, key + '.json')
+
+	def state_lock(self):
+		"""
+		Lock held while the state is read or written.
+		"""
+		return file_lock(self.state_lock_path)
+
+	def build_lock(self):
+		"""
+		Lock held during a build.
+		"""
+		return file_lock(self.build_lock_path)
+
+	def load(self):
+		try:
+			with open(self.state_path) as state_file:
+				return json.load(state_file)
+		except (IOError, OSError, ValueError):
+			return {'started': 0, 'finished': 0, 'digest': None, 'result': None}
+
+	def save(self, state):
+		with atomic_write(self.state_path) as state_file:
+			json.dump(state, state_file)
+
+	def target(self, digest):
+		"""
+		The number of the build whose result is suitable for a request made now.
+		"""
+		with self.state_lock():
+			state = self.load()
+		running = state['started'] > state['finished']
+		if running and state['digest'] == digest:
+			return state['started']
+		return state['started'] + 1
+
+	def build(self, tex_path, build):
+		"""
+		Return the `BuildResult` of a build of `tex_path` requested now:
+		that of a suitable build run by someone else, or that of `build()`, called here otherwise.
+		"""
+		target = self.target(input_digest(tex_path))
+		with self.build_lock():
+			with self.state_lock():
+				state = self.load()
+				if state['finished'] >= target and state['result'] is not None:
+					return BuildResult.from_dict(state['result'])
+				# a build which was interrupted is started again
+				state['started'] = state['finished'] + 1
+				state['digest'] = input_digest(tex_path)
+				self.save(state)
+			result = None
+			try:
+				result = build()
+			finally:
+				with self.state_lock():
+					state = self.load()
+					state['finished'] = state['started']
+					state['result'] = result.to_dict() if result is not None else None
+					self.save(state)
+			return result
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+from concurrent.futures import ThreadPoolExecutor
+
+from . import latex_logger
+
+class Stages(object):
+	"""
+	Independent stages running concurrently on a small thread pool.
+	Each stage is called with a `logger` keyword argument: its output is buffered,
+	and displayed when the stages are joined, in the order in which they were started.
+	"""
+	def __init__(self, logger, workers=2):
+		self.logger = logger
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		self.stages = []
+
+	def start(self, function, *args):
+		logger, handler = latex_logger.buffered_logger(self.logger)
+		future = self.executor.submit(function, *args, logger=logger)
+		self.stages.append((future, handler))
+
+	def join(self, raise_errors=True):
+		"""
+		Wait for the stages, display their output, and raise the first exception they raised, if any.
+		"""
+		self.executor.shutdown(wait=True)
+		error = None
+		for future, handler in self.stages:
+			handler.replay(self.logger)
+			if error is None:
+				error = future.exception()
+		self.stages = []
+		if error is not None and raise_errors:
+			raise error
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+
+from .latexlogparser import LogCheck, re_file
+from . import compression
+
+def reverse_lines(path, block_size=1 << 16):
+	"""
+	Generate the lines of a file from the last one, reading it backwards by blocks.
+	The lines end with their line feed, as those of `LogCheck.lines`.
+	Compressed files cannot be read backwards: they are read entirely.
+	"""
+	if compression.method(path) is not None:
+		with compression.open_text(path) as log_file:
+			lines = log_file.readlines()
+		for line in reversed(lines):
+			yield line
+		return
+	with open(path, 'rb') as log_file:
+		log_file.seek(0, os.SEEK_END)
+		position = log_file.tell()
+		rest = b''
+		while position > 0:
+			size = min(block_size, position)
+			position -= size
+			log_file.seek(position)
+			block = log_file.read(size) + rest
+			lines = block.split(b'\n')
+			# the first line may be incomplete
+			rest = lines.pop(0)
+			for line in reversed(lines):
+				yield (line + b'\n').decode('utf-8', 'replace')
+		if rest:
+			yield (rest + b'\n').decode('utf-8', 'replace')
+
+class TailCheck(LogCheck):
+	"""
+	Find the last error of a log by reading it from the end: with -halt-on-error, the fatal error is near the end.
+	The file in which the error occurred is reconstructed by matching the parentheses of the file names backwards,
+	so that a full forward parse is only needed if the warnings are required.
+	"""
+	def __init__(self, wide=False, block_size=1 << 16):
+		LogCheck.__init__(self, wide)
+		self.block_size = block_size
+
+	def logical_lines(self, path):
+		"""
+		Generate the lines from the last one, joining the lines broken at 79 characters, without their line feed.
+		"""
+		pending = None
+		for line in reverse_lines(path, self.block_size):
+			line = line[:-1]
+			if pending is not None and not self.wide and self.continued(line):
+				pending = line + pending
+				continue
+			if pending is not None:
+				yield pending
+			pending = line
+		if pending is not None:
+			yield pending
+
+	def last_error(self, path):
+		"""
+		The last error of the log, as generated by `get_errors`, or None if there is none.
+		"""
+		tail = []
+		lines = self.logical_lines(path)
+		for line in lines:
+			tail.append(line)
+			if line[:1] != '!':
+				continue
+			# parse forward from that line
+			errors = list(self.parse(errors=True, lines=[text + '\n' for text in reversed(tail)]))
+			if errors:
+				error = errors[-1]
+				if error.get('file') is None:
+					try:
+						error['file'] = self.open_file(lines)
+					except AmbiguousTail:
+						# the messages before the error cannot be told apart backwards
+						self.read(path)
+						error = list(self.get_errors())[-1]
+				return error
+		return None
+
+	def open_file(self, lines):
+		"""
+		The current file at the end of the given lines, generated backwards:
+		the innermost file whose opening is not matched by a closing parenthesis.
+		The text of the messages is ignored, as in `parse`.
+		"""
+		closed = 0
+		last = None
+		for paragraph in self.paragraphs(lines):
+			for line in reversed(paragraph):
+				for m in reversed(list(re_file.finditer(line))):
+					if line[m.start()] == ')':
+						closed += 1
+					elif closed:
+						closed -= 1
+						if not closed and last is None:
+							# the last file closed
+							last = m.group('file')
+					else:
+						return m.group('file')
+		return last
+
+	def paragraphs(self, lines):
+		"""
+		Group the lines generated backwards into paragraphs in forward order,
+		without the lines of the messages.
+		"""
+		paragraph = []
+		for line in lines:
+			if line == '':
+				if paragraph:
+					yield self.unskipped(paragraph[::-1])
+				paragraph = []
+			else:
+				paragraph.append(line)
+		if paragraph:
+			yield self.unskipped(paragraph[::-1])
+
+	def unskipped(self, paragraph):
+		"""
+		The lines of a paragraph in which `parse` tracks the files: those which are not part of a warning, an error or a bad box message.
+		Only the text of an error may continue after an empty line, so that AmbiguousTail is raised if a paragraph may start or end within an error.
+		"""
+		kept = []
+		parsing = False
+		prefix = None
+		for line in paragraph:
+			if parsing:
+				if self.re_line.match(line) or line[0:3] == '***':
+					# the rest of the paragraph is skipped
+					return kept
+				if line[0:15] == 'Type X to quit ':
+					parsing = False
+				continue
+			if line[0] == '!' or line == 'Runaway argument?':
+				parsing = True
+				continue
+			if self.re_line.match(line):
+				raise AmbiguousTail(line)
+			if prefix is not None:
+				if line[:len(prefix)] != prefix:
+					prefix = None
+				continue
+			if self.re_reference.match(line) or self.re_citation.match(line) or self.re_label.match(line) or self.re_missing_character.match(line):
+				continue
+			if 'Warning' in line:
+				m = self.re_warning.match(line)
+				if m:
+					prefix = ('' if m.group('pkg') is None else '(%s)' % m.group('pkg')).ljust(m.start('text'))
+				continue
+			if self.re_badbox.match(line):
+				return kept
+			kept.append(line)
+		if parsing:
+			raise AmbiguousTail(paragraph[-1])
+		return kept
+
+class AmbiguousTail(Exception):
+	"""
+	Raised when the file of an error cannot be found by reading the log backwards.
+	"""
@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 
+import sys
 import subprocess
+import shlex
 import datetime
+import signal
 import os
 
+try:
+	import resource
+except ImportError: # not available on Windows
+	resource = None
+
 from .processor import Processor, LaTeXError
 
 class Typesetter(Processor):
@@ -12,22 +20,56 @@ class Typesetter(Processor):
 	Options:
 		- halt_on_errors
 		- xetex
+		- cpu_limit: maximal CPU time, in seconds
+		- memory_limit: maximal address space, in bytes
+		- file_size_limit: maximal size of the written files, in bytes
+		- timeout: maximal wall-clock time, in seconds, after which the engine and its children are killed
+		- wide_lines: let the engine write each message of the log on a single line
+		- engine: command run instead of pdflatex or xelatex, as a string or a list, e.g., the simulated engine of `pydflatex.simulate`;
+		  it is given the same arguments
 	"""
 
 	defaults = Processor.defaults.copy()
 	defaults.update({
 			'halt_on_errors': True,
 			'xetex': False,
+			'cpu_limit': None,
+			'memory_limit': None,
+			'file_size_limit': None,
+			'timeout': None,
+			'wide_lines': False,
+			'engine': None,
 			})
 
+	# TeX parameters of the wide log lines (error_line must stay below 255)
+	wide_parameters = {
+			'max_print_line': '100000',
+			'error_line': '254',
+			'half_error_line': '238',
+			}
+
+	# the kind of limit which was exceeded during the last run, if any
+	violation = None
+
 	def engine(self):
 		return ['pdflatex','xelatex'][self.options['xetex']]
 
+	def engine_command(self):
+		"""
+		The command running the engine, before its arguments.
+		"""
+		command = self.options['engine']
+		if command is None:
+			return [self.engine()]
+		if isinstance(command, (list, tuple)):
+			return list(command)
+		return shlex.split(command)
+
 	def arguments(self):
 		"""
 		Arguments to the (pdf|xe)latex command.
 		"""
-		args = [self.engine(),
+		args = self.engine_command() + [
 				'-8bit',
 				'-no-mktex=pk',
 				'-interaction=batchmode',
@@ -37,21 +79,119 @@ class Typesetter(Processor):
 			args.insert(-1, '-halt-on-error')
 		return args
 
-	def typeset(self, full_path, ):
+	def command(self, full_path, preamble=None, jobname=None):
+		"""
+		Full command typesetting the given file.
+		The TeX code `preamble` is executed before reading the file.
+		"""
+		arguments = self.arguments()
+		if preamble and jobname is None:
+			# otherwise the job would be called texput
+			jobname = os.path.splitext(os.path.basename(full_path))[0]
+		if jobname is not None:
+			arguments.append('-jobname={0}'.format(jobname))
+		# append file name
+		if preamble:
+			arguments.append('{preamble}\\input{{{file}}}'.format(preamble=preamble, file=full_path))
+		else:
+			arguments.append(full_path)
+		return arguments
+
+	def environment(self):
+		"""
+		Environment of the engine, or None to inherit ours.
+		"""
+		if not self.options['wide_lines']:
+			return None
+		environment = os.environ.copy()
+		environment.update(self.wide_parameters)
+		return environment
+
+	def limits(self):
+		"""
+		Command prefix running the engine with the resource limits (see `pydflatex.limited`), empty if there are no limits.
+		"""
+		limits = []
+		for option, name in [('cpu_limit', '--cpu'), ('memory_limit', '--memory'), ('file_size_limit', '--file-size')]:
+			if self.options[option] is not None:
+				limits += [name, str(int(self.options[option]))]
+		if not limits:
+			return []
+		if resource is None:
+			raise LaTeXError('Resource limits are not supported on this platform')
+		return [sys.executable, '-m', 'pydflatex.limited'] + limits + ['--']
+
+	def limit_violation(self, returncode, output):
+		"""
+		The kind of limit that the engine exceeded, if any, from its return code and output (standard output and error).
+		"""
+		signals = {
+			getattr(signal, 'SIGXCPU', None): 'cpu',
+			getattr(signal, 'SIGXFSZ', None): 'file_size',
+			}
+		if returncode < 0:
+			kind = signals.get(-returncode)
+			if kind is not None:
+				return kind
+		if self.options['memory_limit'] is not None and returncode != 0:
+			lower = output.lower()
+			if returncode < 0 or b'memory exhausted' in lower or b'out of memory' in lower or b'cannot allocate' in lower:
+				return 'memory'
+		return None
+
+	def kill(self, process):
+		"""
+		Kill the engine, and the processes it started.
+		"""
+		if not hasattr(os, 'killpg'): # Windows
+			process.kill()
+			return
+		try:
+			os.killpg(process.pid, signal.SIGKILL)
+		except OSError:
+			# already finished
+			pass
+
+	def violation_message(self, kind):
+		if kind == 'timeout':
+			return 'Engine killed after {0}s'.format(self.options['timeout'])
+		option = {'cpu': 'cpu_limit', 'memory': 'memory_limit', 'file_size': 'file_size_limit'}[kind]
+		return '{0} limit of {1} exceeded'.format(kind.replace('_', ' ').capitalize(), self.options[option])
+
+	def typeset(self, full_path, preamble=None, jobname=None):
 		"""
 		Typeset one given file.
+		Return the kind of resource limit exceeded by the engine, if any.
 		"""
 		# make sure that the file exists
 		if not os.path.exists(full_path):
 			raise LaTeXError('File {0} not found'.format(full_path))
 		# run pdflatex
 		now = datetime.datetime.now().strftime('%Y-%m-%d %H.%M.%S')
-		self.logger.message("\t[{now}] {engine} {file}".format(engine=self.engine(), file=full_path, now=now))
-		arguments = self.arguments()
-		# append file name
-		arguments.append(full_path)
+		self.logger.message("\t[{now}] {engine} {file}".format(engine=' '.join(self.engine_command()), file=full_path, now=now))
+		arguments = self.limits() + self.command(full_path, preamble, jobname)
 		self.logger.debug("\n"+" ".join(arguments)+"\n")
-		output = subprocess.Popen(arguments, stdout=subprocess.PIPE).communicate()[0]
-		self.logger.message(output.splitlines()[0].decode('utf8'))
+		# in a session of its own, so that the children of the engine are killed with it
+		process = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environment(), start_new_session=True)
+		try:
+			output, errors = process.communicate(timeout=self.options['timeout'])
+		except subprocess.TimeoutExpired:
+			self.kill(process)
+			output, errors = process.communicate()
+			self.violation = 'timeout'
+		except BaseException:
+			self.kill(process)
+			process.wait()
+			raise
+		else:
+			self.violation = self.limit_violation(process.returncode, output + errors)
+		lines = output.splitlines()
+		if lines:
+			self.logger.message(lines[0].decode('utf8'))
+		if errors.strip():
+			self.logger.message(errors.decode('utf8', 'replace').rstrip())
+		if self.violation is not None:
+			self.logger.error(self.violation_message(self.violation))
+		return self.violation
 
 
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding: UTF-8
+from __future__ import division
+
+import os
+import re
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .processor import Processor, LaTeXError
+from .runner import Runner
+from .graphics import GraphicsConverter
+from .cleaner import Cleaner
+from .recorder import Recording
+from .result import BuildResult
+from .metrics import Metrics
+
+re_macro = re.compile(r'^[a-zA-Z]+$')
+re_include = re.compile(r'\\include\s*\{')
+re_comment = re.compile(r'(?<!\\)%.*$', re.MULTILINE)
+
+def load_variants(path):
+	"""
+	The variants described in a JSON file, in their order in the file.
+	The file maps each jobname to:
+		- definitions: macros defined before the document, as a dictionary mapping their name to their replacement text
+		- options: options of `Runner` for that variant, e.g., 'xetex' or 'max_passes'
+	For instance: {"slides": {}, "handout": {"definitions": {"handout": ""}, "options": {"max_passes": 2}}}
+	"""
+	with open(path) as spec:
+		variants = json.load(spec, object_pairs_hook=OrderedDict)
+	for jobname, variant in variants.items():
+		unknown = set(variant) - set(['definitions', 'options'])
+		if unknown:
+			raise LaTeXError('Unknown keys for variant {0}: {1}'.format(jobname, ', '.join(sorted(unknown))))
+		unknown = set(variant.get('options', {})) - set(Runner.defaults)
+		if unknown:
+			raise LaTeXError('Unknown options for variant {0}: {1}'.format(jobname, ', '.join(sorted(unknown))))
+		invalid = [name for name in variant.get('definitions', {}) if not re_macro.match(name)]
+		if invalid:
+			raise LaTeXError('Invalid macro names for variant {0}: {1}'.format(jobname, ', '.join(sorted(invalid))))
+	return variants
+
+def definitions(variant):
+	"""
+	TeX code defining the macros of a variant, whose names must consist of letters.
+	"""
+	for name in variant.get('definitions', {}):
+		if not re_macro.match(name):
+			raise LaTeXError('Invalid macro name: {0}'.format(name))
+	return ''.join('\\def\\{0}{{{1}}}'.format(name, text) for name, text in variant.get('definitions', {}).items())
+
+class VariantRunner(Runner):
+	"""
+	Build one variant: the definitions of the variant come before the usual preamble.
+	"""
+	defaults = Runner.defaults.copy()
+	defaults.update({
+		'definitions': '',
+	})
+
+	def preamble(self, paths, logger=None):
+		preamble = Runner.preamble(self, paths, logger)
+		return (self.options['definitions'] + (preamble or '')) or None
+
+def includes(full_path):
+	"""
+	True if the source uses \\include, outside of the comments.
+	"""
+	try:
+		with open(full_path) as source:
+			return re_include.search(re_comment.sub('', source.read())) is not None
+	except (IOError, OSError, UnicodeDecodeError):
+		return False
+
+def build_variant(tex_path, options):
+	"""
+	Build one variant, and return its result as a dictionary. This runs in a worker process.
+	The metrics of the build are returned to the main process, which exports them.
+	"""
+	runner = VariantRunner(options=options)
+	time_start = time.time()
+	try:
+		result = runner.build(tex_path)
+	except Exception as e:
+		return dict(BuildResult(tex_path).to_dict(), error='{0}: {1}'.format(type(e).__name__, e))
+	metrics = runner.build_metrics.items() if runner.build_metrics is not None else []
+	return dict(result.to_dict(), duration=time.time() - time_start, metrics=metrics)
+
+class VariantBuilder(Processor):
+	"""
+	Build several variants of one tex file in parallel, each with its own jobname,
+	so that their output files and logs are separate.
+	The variants share the sources, which are read in place, and the graphics files, which are converted once for all.
+	Options (besides those of `Runner`, which the variants may override):
+		- variants: JSON file describing the variants (see `load_variants`)
+		- variant_jobs: number of variants built in parallel (defaults to the number of processors)
+	"""
+
+	defaults = Runner.defaults.copy()
+	defaults.update({
+		'variants': None,
+		'variant_jobs': None,
+	})
+
+	def options_of(self, jobname, variant):
+		options = dict((key, value) for key, value in self.options.items() if key in Runner.defaults)
+		options.update(variant.get('options', {}))
+		# converted before the variants are built
+		options.update(jobname=jobname, definitions=definitions(variant), convert_graphics=False, open_after=False)
+		# the files shared by the builds: the history is by source, and the metrics are exported by the main process
+		options.update(history=None, metrics_file=None, single_flight=False)
+		if options['fingerprint_file']:
+			base, extension = os.path.splitext(options['fingerprint_file'])
+			options['fingerprint_file'] = base + os.path.extsep + jobname + extension
+		return options
+
+	def shared_aux(self, full_path, jobnames):
+		"""
+		True if the variants would share the .aux files of \\include'd files:
+		if the source includes files, or if the previous builds wrote such .aux files.
+		"""
+		if includes(full_path):
+			return True
+		for jobname in jobnames:
+			try:
+				recording = Recording(Cleaner.fls_file(jobname))
+			except (IOError, OSError):
+				continue
+			if next(recording.included_files(jobname), None) is not None:
+				return True
+		return False
+
+	def run(self, tex_path):
+		"""
+		Build all the variants, report them, and raise an error if some of them failed.
+		Return a dictionary mapping each jobname to its `BuildResult`.
+		"""
+		if not self.options['variants']:
+			raise LaTeXError('No variant given')
+		variants = load_variants(self.options['variants'])
+		paths = Runner.paths(tex_path)
+		if self.options['convert_graphics'] and self.options['typesetting']:
+			GraphicsConverter(logger=self.logger, options=self.options).convert_all(paths['full_path'], paths['file_base'])
+		jobs = self.options['variant_jobs']
+		if self.shared_aux(paths['full_path'], variants):
+			self.logger.warning('The variants share the .aux files of the included files: building them one at a time')
+			jobs = 1
+		results = OrderedDict()
+		metrics = Metrics()
+		with ProcessPoolExecutor(max_workers=jobs) as executor:
+			futures = [(jobname, executor.submit(build_variant, tex_path, self.options_of(jobname, variant))) for jobname, variant in variants.items()]
+			for jobname, future in futures:
+				result = future.result()
+				metrics.merge(result.pop('metrics', []))
+				error = result.pop('error', None)
+				duration = result.pop('duration', None)
+				results[jobname] = BuildResult.from_dict(result)
+				self.report(jobname, results[jobname], duration, error)
+		if self.options['metrics_file']:
+			metrics.export(self.options['metrics_file'])
+		failed = [jobname for jobname, result in results.items() if not result.success]
+		if failed:
+			raise LaTeXError('{0} of {1} variants failed: {2}'.format(len(failed), len(results), ', '.join(failed)))
+		return results
+
+	def report(self, jobname, result, duration=None, error=None):
+		if error is not None:
+			self.logger.error('Variant {0}: {1}'.format(jobname, error))
+			return
+		result.render(self.logger)
+		if result.success:
+			self.logger.success('Variant {0} built in {1:.1f}s'.format(jobname, duration))
+		else:
+			self.logger.error('Variant {0} failed'.format(jobname))
@@ -80,6 +80,12 @@ class TestLogParse(Harness):
 		finally:
 			self.output = self.logfile.read().decode('utf8')
 
+	def test_counts(self):
+		self.t.collect_log(os.path.join(test_dir, 'latex', 'box.testlog'))
+		self.assertEqual(self.t.counts['error'], 0)
+		# not shared between the instances
+		self.assertIsNot(LogProcessor().counts, LogProcessor().counts)
+
 	def test_error(self):
 		self.process_log('error')
 		self.assert_contains(colours['error'])
@@ -125,6 +131,50 @@ class TestLogParse(Harness):
 		print(self.output)
 
 
+	def test_aggregate(self):
+		self.t.options['aggregate_warnings'] = True
+		self.process_log('encoding')
+		self.assertEqual(self.output.count('Missing character'), 1)
+		self.assert_contains('2 times: p.1')
+
+	def test_no_aggregate(self):
+		self.process_log('encoding')
+		self.assertEqual(self.output.count('Missing character'), 2)
+
+	def test_new_only(self):
+		fingerprints = tempfile.NamedTemporaryFile(suffix='.json')
+		self.t.options.update({'new_only': True, 'fingerprint_file': fingerprints.name})
+		# without a previous build, all the warnings are shown, and none is new
+		self.process_log('cite')
+		self.assert_contains('citation')
+		self.assertEqual(self.t.new_warnings, 0)
+		self.setup_logger()
+		self.process_log('cite')
+		self.assertNotIn('citation', self.output)
+		self.assertEqual(self.t.new_warnings, 0)
+		self.setup_logger()
+		self.process_log('ref')
+		self.assert_contains('nonexistent')
+		self.assert_contains("resolved")
+		self.assert_contains("Citation `citation' undefined.")
+
+	def test_fail_on_new(self):
+		fingerprints = tempfile.NamedTemporaryFile(suffix='.json')
+		self.t.options.update({'fail_on_new_warnings': True, 'fingerprint_file': fingerprints.name})
+		self.process_log('cite')
+		with self.assertRaises(LaTeXError):
+			self.process_log('ref')
+		# the new warnings are not accepted by a retry
+		with self.assertRaises(LaTeXError):
+			self.process_log('ref')
+		self.process_log('cite')
+
+	def test_errors_known(self):
+		known = []
+		self.t.process_log(os.path.join(test_dir, 'latex', 'error.testlog'), known.append)
+		self.assertEqual(len(known), 1)
+		self.assertIn('nonexistingmacro', known[0][0]['text'])
+
 	def test_colours(self):
 		self.process_log('cite')
 		self.assert_contains('citation', line=0, regexp=False)
@@ -140,6 +190,1245 @@ class TestLogParse(Harness):
 		self.setup_logger()
 		self.process_log('encoding')
 
+class TestFilters(unittest.TestCase):
+	def parse(self, name, rules, **kinds):
+		from pydflatex.latexlogparser import LogCheck
+		from pydflatex.filters import MessageFilter
+		parser = LogCheck()
+		parser.read(os.path.join(latex_dir, name + os.path.extsep + 'testlog'))
+		return list(parser.parse(filters=MessageFilter(rules), **kinds))
+
+	def test_box_text(self):
+		self.assertEqual(len(self.parse('box', [], boxes=True)), 1)
+		self.assertEqual(self.parse('box', [{'kind': 'box', 'text': 'Overfull'}], boxes=True), [])
+		self.assertEqual(len(self.parse('box', [{'kind': 'box', 'text': 'Underfull'}], boxes=True)), 1)
+
+	def test_file_glob(self):
+		self.assertEqual(self.parse('cite', [{'kind': 'ref', 'file': 'cite.tex'}], refs=True), [])
+		self.assertEqual(len(self.parse('cite', [{'kind': 'ref', 'file': '*.sty'}], refs=True)), 1)
+
+	def test_package(self):
+		warnings = self.parse('encoding', [{'pkg': 'hyperref'}], warnings=True)
+		self.assertEqual(len(warnings), 2)
+		self.assertEqual(self.parse('encoding', [{'text': '^Missing character'}], warnings=True), [])
+
+	def test_suppresses_all(self):
+		from pydflatex.filters import MessageFilter
+		filters = MessageFilter([{'kind': 'box'}, {'kind': 'ref', 'text': 'x'}])
+		self.assertTrue(filters.suppresses_all('box'))
+		self.assertFalse(filters.suppresses_all('ref'))
+
+	def test_wrong_kind(self):
+		from pydflatex.filters import FilterRule
+		with self.assertRaises(ValueError):
+			FilterRule(kind='nonexistent')
+
+class TestAggregator(unittest.TestCase):
+	def test_bounded(self):
+		from pydflatex.aggregate import Aggregator
+		aggregator = Aggregator(max_ranges=2, max_groups=1)
+		for page in [1, 2, 3, 5, 9, 4]:
+			aggregator.add('warning', {'text': 'same', 'page': page})
+		aggregator.add('warning', {'text': 'other', 'page': 1})
+		group, = list(aggregator)
+		self.assertEqual(group.count, 6)
+		self.assertEqual(str(group.pages), '1-5,...')
+		self.assertEqual(aggregator.dropped, 1)
+
+class TestFingerprint(unittest.TestCase):
+	def test_stable(self):
+		from pydflatex.incremental import fingerprint
+		first = {'text': 'Float too large for page by 3pt on input line 12.', 'file': './a.tex', 'line': '12'}
+		moved = {'text': 'Float too large for page by 3pt on input line 40.', 'file': 'a.tex', 'line': '40', 'page': 3}
+		other = {'text': 'Float too large for page by 5pt on input line 12.', 'file': './a.tex'}
+		self.assertEqual(fingerprint('warning', first), fingerprint('warning', moved))
+		self.assertNotEqual(fingerprint('warning', first), fingerprint('warning', other))
+		self.assertNotEqual(fingerprint('warning', first), fingerprint('box', first))
+
+def copy_logs(names, directory):
+	"""
+	Copy test logs into `directory`, as regular log files.
+	"""
+	import shutil
+	paths = []
+	for name in names:
+		shutil.copy(os.path.join(latex_dir, name + os.path.extsep + 'testlog'), os.path.join(directory, name + os.path.extsep + 'log'))
+		paths.append(os.path.join(directory, name + os.path.extsep + 'tex'))
+	return paths
+
+class TestTail(unittest.TestCase):
+	log = """This is pdfTeX, Version 3.1415926-2.5-1.40.14 (TeX Live 2013)
+(./main.tex (./chapter.tex (./figure.tex) [1]
+
+Overfull \\hbox (1.0pt too wide) in paragraph at lines 1--2
+ (./notafile.tex
+
+(./section.tex) (./table.tex
+! Undefined control sequence.
+l.12 \\oops
+            
+Here is how much of TeX's memory you used:
+ 197 strings out of 493315
+
+!  ==> Fatal error occurred, no output PDF file produced!
+"""
+
+	def setUp(self):
+		self.logfile = tempfile.NamedTemporaryFile(suffix='.log')
+		self.logfile.write(self.log.encode('utf8'))
+		self.logfile.flush()
+
+	def test_identical(self):
+		from pydflatex.latexlogparser import LogCheck
+		from pydflatex.tail import TailCheck
+		for name in [self.logfile.name] + [os.path.join(latex_dir, name + '.testlog') for name in ['error', 'box', 'ref']]:
+			parser = LogCheck()
+			parser.read(name)
+			errors = list(parser.get_errors())
+			for block_size in [7, 1 << 16]:
+				self.assertEqual(TailCheck(block_size=block_size).last_error(name), errors[-1] if errors else None)
+
+	def test_file(self):
+		from pydflatex.tail import TailCheck
+		self.assertEqual(TailCheck().last_error(self.logfile.name)['file'], './table.tex')
+		self.logfile.write(b'! Missing $ inserted.\n) l.13 x\n')
+		self.logfile.flush()
+		self.assertEqual(TailCheck().last_error(self.logfile.name)['file'], './table.tex')
+
+	def assert_same_file(self, log):
+		from pydflatex.latexlogparser import LogCheck
+		from pydflatex.tail import TailCheck
+		logfile = tempfile.NamedTemporaryFile(suffix='.log')
+		logfile.write(('This is pdfTeX, Version 3.1415926-2.5-1.40.14 (TeX Live 2013)\n' + log).encode('utf8'))
+		logfile.flush()
+		parser = LogCheck()
+		parser.read(logfile.name)
+		error = list(parser.get_errors())[-1]
+		self.assertEqual(error['file'], './main.tex')
+		self.assertEqual(TailCheck().last_error(logfile.name), error)
+
+	def test_messages(self):
+		error = "! Undefined control sequence.\nl.5 \\oops\n\n"
+		self.assert_same_file("(./main.tex\nLaTeX Warning: foo (bar on input line 3.\n\n" + error)
+		self.assert_same_file("(./main.tex\n! Missing $ inserted.\nl.3 a_(b\n\n" + error)
+		# the text of the first error continues after an empty line
+		self.assert_same_file("(./main.tex\n! Missing $ inserted.\n\n<inserted text> (b\nl.3 a_(b\n\n" + error)
+
+	def test_quick_errors(self):
+		processor = LogProcessor(options={'quick_errors': True})
+		processor.logger = processor.setup_logger([])
+		error = processor.process_log(self.logfile.name)
+		self.assertEqual(error['line'], '12')
+		self.assertEqual(processor.counts, {'error': 1})
+
+class TestSourceContext(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		os.chdir(self.directory)
+		with open('chapter.tex', 'w') as f:
+			f.write(''.join('line {0}\n'.format(number) for number in range(1, 11)))
+		with open('main.log', 'w') as f:
+			f.write('This is pdfTeX, Version 3.14\n(./chapter.tex\nLaTeX Warning: Reference `fig\' on page 1 undefined on input line 9.\n\n! Undefined control sequence.\nl.5 \\oops\n\n)\n')
+
+	def tearDown(self):
+		import shutil
+		os.chdir(self.cwd)
+		shutil.rmtree(self.directory)
+
+	def test_messages(self):
+		messages = LogProcessor().collect_log('main.log')
+		context = dict((message.kind, message.context) for message in messages)
+		self.assertEqual(context['error'], [[number, 'line {0}'.format(number)] for number in range(3, 8)])
+		# the warnings are not displayed with their context
+		self.assertIsNone(context['ref'])
+		messages = LogProcessor(options={'source_context': 0}).collect_log('main.log')
+		self.assertEqual([message.context for message in messages], [None, None])
+
+	def test_quick_errors(self):
+		processor = LogProcessor(options={'quick_errors': True})
+		processor.logger = processor.setup_logger([])
+		messages = []
+		error = processor.display_log('main.log', collected=messages)
+		expected = [[number, 'line {0}'.format(number)] for number in range(3, 8)]
+		self.assertEqual(error['context'], expected)
+		self.assertEqual(messages[0].context, expected)
+
+	def test_index(self):
+		from pydflatex.context import SourceIndex, LineIndex
+		index = SourceIndex()
+		first = index.index('chapter.tex')
+		self.assertIs(index.index('chapter.tex'), first)
+		self.assertEqual(len(first.offsets), 1)
+		self.assertEqual(index.context('chapter.tex', '1', 1), [[1, 'line 1'], [2, 'line 2']])
+		self.assertEqual(len(first.offsets), 3)
+		with open('chapter.tex', 'a') as f:
+			f.write('last line without line feed')
+		self.assertIsNot(index.index('chapter.tex'), first)
+		self.assertEqual(index.context('chapter.tex', 11, 1), [[10, 'line 10'], [11, 'last line without line feed']])
+		self.assertIsNone(index.context('missing.tex', 1))
+		self.assertIsNone(index.context(os.curdir, 1))
+		versions = {}
+		self.assertEqual(index.context('chapter.tex', 1, 0, versions), [[1, 'line 1']])
+		with open('chapter.tex', 'w') as f:
+			f.write('changed\n')
+		# the version checked first is kept
+		self.assertEqual(index.context('chapter.tex', 1, 0, versions), [[1, 'line 1']])
+		self.assertEqual(index.context('chapter.tex', 1, 0), [[1, 'changed']])
+		self.assertEqual(LineIndex('chapter.tex').lines(1, 2), [[1, 'changed']])
+
+	def test_display(self):
+		import logging
+		processor = LogProcessor()
+		logfile = tempfile.NamedTemporaryFile()
+		processor.logger = processor.setup_logger([logging.FileHandler(logfile.name)])
+		processor.process_log('main.log')
+		with open(logfile.name) as f:
+			output = f.read()
+		self.assertIn('>L    5| line 5', output)
+
+class TestCompression(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cite, = copy_logs(['cite'], self.directory)
+		self.log = os.path.splitext(self.cite)[0] + os.path.extsep + 'log'
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def test_parse(self):
+		from pydflatex import compression
+		expected = LogProcessor.parse_log(self.log).lines
+		compressed = compression.compress(self.log, 'gz')
+		self.assertEqual(compressed, self.log + '.gz')
+		self.assertFalse(os.path.exists(self.log))
+		self.assertEqual(LogProcessor.parse_log(self.log).lines, expected)
+
+	def test_log_only(self):
+		runner = Runner(options={'typesetting': False, 'compress_log': 'gz'})
+		runner.logger = runner.setup_logger([])
+		result = runner.build(self.cite)
+		self.assertTrue(os.path.exists(self.log + '.gz'))
+		# the compressed log is analysed again
+		self.assertEqual(runner.build(self.cite).to_dict()['messages'], result.to_dict()['messages'])
+
+	def test_stale(self):
+		from pydflatex import compression
+		compression.compress(self.log, 'gz')
+		runner = Runner(options={'compress_log': 'gz'})
+		runner.logger = runner.setup_logger([])
+		# the log of a previous build is not reported after a run of the engine
+		with self.assertRaises((IOError, OSError)):
+			runner.log_processor().collect_log(self.log)
+		self.assertFalse(runner.rerun_needed(self.log))
+		runner.options['typesetting'] = False
+		self.assertTrue(runner.log_processor().collect_log(self.log))
+
+class TestHistory(unittest.TestCase):
+	def setUp(self):
+		from pydflatex.history import BuildHistory
+		self.db = tempfile.NamedTemporaryFile(suffix='.sqlite')
+		self.history = BuildHistory(self.db.name)
+
+	def test_expected_duration(self):
+		self.assertIsNone(self.history.expected_duration('doc.tex'))
+		for total in [3., 1., 2.]:
+			self.history.record('doc.tex', total=total)
+		self.history.record('doc.tex', total=100., success=False)
+		self.assertEqual(self.history.expected_duration('doc.tex'), 2.)
+		self.assertEqual(len(self.history.builds('doc.tex')), 4)
+
+	def test_regression(self):
+		for i in range(6):
+			self.history.record('doc.tex', total=10.+i/10)
+		self.assertIsNone(self.history.regression('doc.tex', 10.))
+		self.history.record('doc.tex', total=30.)
+		self.assertAlmostEqual(self.history.regression('doc.tex', 30.), 10.25)
+
+class TestBatch(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.db = os.path.join(self.directory, 'history.sqlite')
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def test_schedule(self):
+		from pydflatex import BatchRunner, BuildHistory
+		history = BuildHistory(self.db)
+		history.record('short.tex', total=1.)
+		history.record('long.tex', total=10.)
+		runner = BatchRunner(options={'history': self.db})
+		self.assertEqual(runner.schedule(['short.tex', 'new.tex', 'long.tex']), ['new.tex', 'long.tex', 'short.tex'])
+
+	def test_run(self):
+		from pydflatex import BatchRunner, BuildHistory
+		tex_paths = copy_logs(['cite', 'error', 'ref'], self.directory)
+		runner = BatchRunner(options={'history': self.db, 'typesetting': False, 'jobs': 2})
+		with self.assertRaises(LaTeXError):
+			runner.run(tex_paths)
+		builds = BuildHistory(self.db).builds(tex_paths[1])
+		self.assertEqual(len(builds), 1)
+		self.assertFalse(builds[0]['success'])
+		self.assertEqual(builds[0]['errors'], 1)
+		self.assertEqual(BuildHistory(self.db).builds(tex_paths[0])[0]['warnings'], 2)
+
+	def test_metrics(self):
+		from pydflatex import BatchRunner
+		from pydflatex.metrics import Metrics
+		metrics_file = os.path.join(self.directory, 'pydflatex.prom')
+		tex_paths = copy_logs(['cite', 'ref'], self.directory)
+		runner = BatchRunner(options={'metrics_file': metrics_file, 'typesetting': False, 'jobs': 2})
+		runner.run(tex_paths)
+		metrics = dict(Metrics.load(metrics_file).items())
+		self.assertEqual(metrics['pydflatex_builds_total', (('result', 'success'),)], 2)
+		self.assertEqual(metrics['pydflatex_phase_duration_seconds_count', (('phase', 'log_parsing'),)], 2)
+
+	def test_resume(self):
+		from pydflatex import BatchRunner
+		from pydflatex.manifest import Manifest
+		manifest = os.path.join(self.directory, 'batch.json')
+		tex_paths = copy_logs(['cite', 'ref'], self.directory)
+		for tex_path in tex_paths:
+			with open(tex_path, 'w') as f:
+				f.write('\\relax')
+		options = {'manifest': manifest, 'resume': True, 'typesetting': False, 'jobs': 2}
+		self.assertEqual(len(BatchRunner(options=options).run(tex_paths)), 2)
+		self.assertEqual(Manifest(manifest).entries[tex_paths[0]]['status'], 'built')
+		self.assertEqual(BatchRunner(options=options).run(tex_paths), [])
+		with open(tex_paths[1], 'a') as f:
+			f.write('%')
+		self.assertEqual([result['tex_path'] for result in BatchRunner(options=options).run(tex_paths)], [tex_paths[1]])
+
+	def test_resume_typeset(self):
+		import sys
+		import json
+		from pydflatex import BatchRunner, simulate
+		cwd = os.getcwd()
+		os.chdir(self.directory)
+		try:
+			for name in ['a.tex', 'b.tex', 'chapter.tex']:
+				with open(name, 'w') as f:
+					f.write(name)
+			with open('scenario.json', 'w') as f:
+				json.dump({'inputs': ['chapter.tex']}, f)
+			options = {'manifest': 'batch.json', 'resume': True, 'jobs': 2, 'open_after': False, 'engine': [sys.executable, os.path.abspath(simulate.__file__), '--scenario', 'scenario.json']}
+			self.assertEqual(len(BatchRunner(options=options).run(['a.tex', 'b.tex'])), 2)
+			# the sources read by the first build are known
+			self.assertEqual(BatchRunner(options=options).run(['a.tex', 'b.tex']), [])
+			with open('chapter.tex', 'a') as f:
+				f.write('%')
+			self.assertEqual(sorted(result['tex_path'] for result in BatchRunner(options=options).run(['a.tex', 'b.tex'])), ['a.tex', 'b.tex'])
+		finally:
+			os.chdir(cwd)
+
+	def test_retry(self):
+		from pydflatex import BatchRunner
+		from pydflatex.manifest import Manifest
+		manifest = os.path.join(self.directory, 'batch.json')
+		tex_paths = copy_logs(['error'], self.directory)
+		runner = BatchRunner(options={'manifest': manifest, 'typesetting': False, 'retries': 2, 'retry_delay': 0, 'transient_errors': ['LaTeXError']})
+		with self.assertRaises(LaTeXError):
+			runner.run(tex_paths)
+		entry = Manifest(manifest).entries[tex_paths[0]]
+		self.assertEqual(entry['status'], 'failed')
+		self.assertEqual(entry['attempts'], 3)
+
+	def test_delayed_retry(self):
+		from pydflatex import BatchRunner
+		from pydflatex.metrics import Metrics
+		tex_paths = copy_logs(['error', 'cite'], self.directory)
+		runner = BatchRunner(options={'typesetting': False, 'jobs': 1, 'retries': 1, 'retry_delay': .5, 'transient_errors': ['LaTeXError']})
+		runner.logger = runner.setup_logger([])
+		runner.metrics = Metrics()
+		results = []
+		runner.build_all(tex_paths, results)
+		# the other document is built while the retry waits
+		self.assertEqual([result['tex_path'] for result in results], tex_paths[::-1])
+
+	def test_transient(self):
+		from pydflatex import BatchRunner
+		runner = BatchRunner()
+		self.assertTrue(runner.transient({'error_types': ['ConnectionResetError', 'ConnectionError', 'OSError', 'Exception']}))
+		self.assertFalse(runner.transient({'error_types': ['FileNotFoundError', 'OSError', 'Exception']}))
+		self.assertFalse(runner.transient({'error_types': ['PermissionError', 'OSError', 'Exception']}))
+		self.assertFalse(runner.transient({'error_types': ['LaTeXError', 'Exception']}))
+
+class TestFiles(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'state.json')
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def test_atomic_write(self):
+		from pydflatex.files import atomic_write, file_digest
+		with atomic_write(self.path) as f:
+			f.write('first')
+		with self.assertRaises(ValueError):
+			with atomic_write(self.path) as f:
+				f.write('partial')
+				raise ValueError()
+		# the file is kept, and the temporary file removed
+		with open(self.path) as f:
+			self.assertEqual(f.read(), 'first')
+		self.assertEqual(os.listdir(self.directory), ['state.json'])
+		import hashlib
+		self.assertEqual(file_digest(self.path), hashlib.sha256(b'first').hexdigest())
+
+class TestMetrics(unittest.TestCase):
+	def test_render(self):
+		from pydflatex.metrics import Metrics
+		metrics = Metrics()
+		metrics.inc('pydflatex_messages_total', 3, kind='box')
+		metrics.observe('pydflatex_passes', 2)
+		text = metrics.render()
+		self.assertIn('# TYPE pydflatex_passes histogram\n', text)
+		self.assertIn('pydflatex_passes_bucket{le="1"} 0\n', text)
+		self.assertIn('pydflatex_passes_bucket{le="+Inf"} 1\n', text)
+		self.assertIn('pydflatex_messages_total{kind="box"} 3\n', text)
+		# merging the parsed metrics doubles them
+		metrics.merge(Metrics.parse(text).items())
+		self.assertIn('pydflatex_passes_sum 4\n', metrics.render())
+
+	def test_runner(self):
+		directory = tempfile.mkdtemp()
+		try:
+			cite, = copy_logs(['cite'], directory)
+			metrics_file = os.path.join(directory, 'pydflatex.prom')
+			runner = Runner(options={'typesetting': False, 'metrics_file': metrics_file})
+			runner.logger = runner.setup_logger([])
+			runner.run(cite)
+			runner.run(cite)
+			with open(metrics_file) as f:
+				text = f.read()
+			self.assertIn('pydflatex_builds_total{result="success"} 2\n', text)
+			self.assertIn('pydflatex_messages_total{kind="ref"} 2\n', text)
+			self.assertIn('pydflatex_log_bytes_total {0}\n'.format(2*os.path.getsize(os.path.join(directory, 'cite.log'))), text)
+		finally:
+			import shutil
+			shutil.rmtree(directory)
+
+	def test_concurrent_export(self):
+		import threading
+		from pydflatex.metrics import Metrics
+		directory = tempfile.mkdtemp()
+		try:
+			metrics_file = os.path.join(directory, 'pydflatex.prom')
+			build_metrics = Metrics()
+			build_metrics.inc('pydflatex_builds_total', result='success')
+			runners = [Runner(options={'metrics_file': metrics_file}) for index in range(8)]
+			threads = [threading.Thread(target=runner.export_metrics, args=(build_metrics,)) for runner in runners]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+			self.assertEqual(dict(Metrics.load(metrics_file).items()), {('pydflatex_builds_total', (('result', 'success'),)): 8})
+			self.assertEqual(sorted(os.listdir(directory)), ['pydflatex.prom', 'pydflatex.prom.lock'])
+			self.assertIsNot(runners[0].cache_lookups, runners[1].cache_lookups)
+		finally:
+			import shutil
+			shutil.rmtree(directory)
+
+class TestChunked(unittest.TestCase):
+	def setUp(self):
+		from pydflatex.latexlogparser import LogCheck
+		from pydflatex.chunked import ChunkedLogCheck
+		lines = []
+		for name in ['box', 'cite', 'error', 'encoding', 'ref', 'twicelabel', 'unicode']*2:
+			parser = LogCheck()
+			parser.read(os.path.join(latex_dir, name + os.path.extsep + 'testlog'))
+			lines.extend(parser.lines)
+		self.sequential = LogCheck()
+		self.sequential.lines = lines
+		self.chunked = ChunkedLogCheck(jobs=2, chunk_lines=10, min_lines=0)
+		self.chunked.lines = lines
+
+	def tearDown(self):
+		self.chunked.close()
+
+	def test_identical(self):
+		for flags in [{'errors': True}, {'boxes': True}, {'refs': True}, {'warnings': True}, {'errors': True, 'boxes': True, 'refs': True, 'warnings': True}]:
+			self.assertEqual(list(self.chunked.parse(**flags)), list(self.sequential.parse(**flags)))
+		self.assertGreater(len(self.chunked.chunks), 10)
+
+	def test_file_filter(self):
+		from pydflatex.filters import MessageFilter
+		filters = MessageFilter([{'kind': 'ref', 'file': 'cite.tex'}])
+		self.assertEqual(list(self.chunked.parse(refs=True, filters=filters)), list(self.sequential.parse(refs=True, filters=filters)))
+
+class TestInstrument(unittest.TestCase):
+	def setUp(self):
+		from pydflatex.latexlogparser import LogCheck
+		from pydflatex.instrument import InstrumentedLogCheck
+		self.names = [os.path.join(latex_dir, name + os.path.extsep + 'testlog') for name in ['box', 'cite', 'error', 'ref', 'unicode']]
+		self.plain = LogCheck
+		self.instrumented = InstrumentedLogCheck
+
+	def test_identical(self):
+		for name in self.names:
+			plain = self.plain()
+			plain.read(name)
+			instrumented = self.instrumented()
+			instrumented.read(name)
+			flags = {'errors': True, 'boxes': True, 'refs': True, 'warnings': True}
+			self.assertEqual(list(instrumented.parse(**flags)), list(plain.parse(**flags)))
+			self.assertEqual(instrumented.lines_parsed, len(plain.lines))
+			self.assertLessEqual(instrumented.skipped + instrumented.untested, instrumented.lines_parsed)
+
+	def test_counts(self):
+		parser = self.instrumented()
+		parser.read(os.path.join(latex_dir, 'error.testlog'))
+		errors = list(parser.get_errors())
+		stats = parser.stats
+		self.assertEqual(stats['line'].matched, len(errors))
+		self.assertGreaterEqual(stats['cseq'].tested, stats['cseq'].matched)
+		self.assertEqual(stats['continued'].matched, parser.accumulated)
+		# the plain parser is not instrumented
+		self.assertIs(self.plain.re_line, self.plain().re_line)
+		report = parser.report()
+		self.assertIn('continued', report)
+		self.assertIn('{0} lines parsed'.format(len(parser.lines)), report)
+
+	def test_skipped(self):
+		parser = self.instrumented()
+		parser.read(os.path.join(latex_dir, 'box.testlog'))
+		boxes = list(parser.get_boxes())
+		self.assertTrue(boxes)
+		# the text of each bad box is skipped, not the blank line ending it
+		self.assertGreaterEqual(parser.skipped, len(boxes))
+		blank = len([line for line in parser.lines if not line.strip()])
+		self.assertGreaterEqual(parser.untested, blank - len(boxes))
+		parser = self.instrumented()
+		parser.read(os.path.join(latex_dir, 'cite.testlog'))
+		list(parser.get_boxes())
+		self.assertEqual(parser.skipped, 0)
+
+	def test_option(self):
+		processor = LogProcessor(options={'profile_parser': True})
+		messages = []
+		processor.logger = processor.setup_logger([])
+		processor.logger.message = messages.append
+		processor.process_log(os.path.join(latex_dir, 'box.testlog'))
+		self.assertTrue(any(message.startswith('Log parser profile') for message in messages))
+
+	def test_passes(self):
+		processor = LogProcessor(options={'profile_parser': True})
+		messages = []
+		processor.logger = processor.setup_logger([])
+		processor.logger.message = messages.append
+		path = os.path.join(latex_dir, 'box.testlog')
+		processor.process_log(path)
+		with open(path) as f:
+			count = len(f.readlines())
+		report = [message for message in messages if message.startswith('Log parser profile')][0]
+		# one report for each pass, each over the whole log
+		self.assertIn('Pass searching errors:', report)
+		self.assertEqual(report.count('\n{0} lines parsed,'.format(count)), report.count('Pass searching'))
+		self.assertNotIn('{0} lines parsed'.format(2*count), report)
+
+class TestWideLines(unittest.TestCase):
+	def setUp(self):
+		from pydflatex.latexlogparser import LogCheck
+		self.broken = LogCheck()
+		self.broken.lines = []
+		for name in ['box', 'cite', 'encoding', 'ref', 'twicelabel', 'unicode']:
+			parser = LogCheck()
+			parser.read(os.path.join(latex_dir, name + os.path.extsep + 'testlog'))
+			self.broken.lines.extend(parser.lines)
+		# the same log, as written with a large max_print_line
+		self.wide = LogCheck(wide=True)
+		self.wide.lines = []
+		accu = ''
+		for line in self.broken.lines:
+			if self.broken.continued(line[:-1]):
+				accu += line[:-1]
+			else:
+				self.wide.lines.append(accu + line)
+				accu = ''
+
+	def test_identical(self):
+		flags = {'errors': True, 'boxes': True, 'refs': True, 'warnings': True}
+		self.assertLess(len(self.wide.lines), len(self.broken.lines))
+		self.assertEqual(list(self.wide.parse(**flags)), list(self.broken.parse(**flags)))
+
+	def test_no_continuation(self):
+		self.wide.lines = ['This is pdfTeX\n', '! ' + 'x'*77 + '\n', 'l.3 \\foo\n']
+		errors = list(self.wide.parse(errors=True))
+		self.assertEqual(errors[0]['text'], 'x'*77)
+
+	def test_environment(self):
+		self.assertIsNone(Typesetter().environment())
+		environment = Typesetter(options={'wide_lines': True}).environment()
+		self.assertEqual(environment['max_print_line'], '100000')
+		self.assertLess(int(environment['error_line']), 255)
+
+class TestFastPreview(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		fls = """PWD {0}
+INPUT /usr/local/texlive/2014/texmf-dist/tex/latex/base/book.cls
+INPUT ./book.tex
+OUTPUT book.log
+INPUT ./book.aux
+INPUT ./chapters/intro.tex
+OUTPUT chapters/intro.aux
+INPUT ./chapters/end.tex
+OUTPUT chapters/end.aux
+OUTPUT book.aux
+OUTPUT book.pdf
+""".format(self.directory)
+		self.fls = os.path.join(self.directory, 'book.fls')
+		with open(self.fls, 'w') as f:
+			f.write(fls)
+		os.mkdir(os.path.join(self.directory, 'chapters'))
+		for name in ['intro.tex', 'end.tex', 'intro.aux', 'end.aux']:
+			path = os.path.join(self.directory, 'chapters', name)
+			open(path, 'w').close()
+			os.utime(path, (1000, 1000 if name.endswith('tex') else 2000))
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def test_included_files(self):
+		from pydflatex.recorder import Recording
+		included = list(Recording(self.fls).included_files('book'))
+		self.assertEqual([name for name, tex_path, aux_path in included], ['chapters/intro', 'chapters/end'])
+		self.assertEqual(included[0][2], os.path.join(self.directory, 'chapters/intro.aux'))
+
+	def test_changed(self):
+		runner = Runner()
+		self.assertIsNone(runner.changed_includes(self.fls, 'book'))
+		os.utime(os.path.join(self.directory, 'chapters', 'end.tex'), (3000, 3000))
+		self.assertEqual(runner.changed_includes(self.fls, 'book'), ['chapters/end'])
+		self.assertIsNone(runner.changed_includes(os.path.join(self.directory, 'nonexistent.fls'), 'book'))
+
+	def test_successive_previews(self):
+		runner = Runner()
+		os.utime(os.path.join(self.directory, 'chapters', 'end.tex'), (3000, 3000))
+		self.assertEqual(runner.changed_includes(self.fls, 'book'), ['chapters/end'])
+		# the fast preview only records the included file
+		with open(self.fls, 'w') as f:
+			f.write('PWD {0}\nINPUT ./chapters/end.tex\nOUTPUT chapters/end.aux\nOUTPUT book.aux\n'.format(self.directory))
+		os.utime(os.path.join(self.directory, 'chapters', 'end.aux'), (3500, 3500))
+		os.utime(os.path.join(self.directory, 'chapters', 'intro.tex'), (4000, 4000))
+		self.assertEqual(runner.changed_includes(self.fls, 'book'), ['chapters/intro'])
+
+	def test_command(self):
+		t = Typesetter()
+		command = t.command('path/book.tex', '\\includeonly{end}')
+		self.assertEqual(command[-2:], ['-jobname=book', '\\includeonly{end}\\input{path/book.tex}'])
+		self.assertEqual(t.command('path/book.tex')[-1], 'path/book.tex')
+
+class TestGraphics(unittest.TestCase):
+	def setUp(self):
+		import sys
+		from pydflatex.graphics import GraphicsConverter
+		self.directory = tempfile.mkdtemp()
+		self.tex = os.path.join(self.directory, 'paper.tex')
+		with open(self.tex, 'w') as f:
+			f.write('\\includegraphics[width=3cm]{fig}\n\\includegraphics{plot.svg}\n\\includegraphics{photo}\n')
+		for name in ['fig.eps', 'plot.svg', 'photo.png']:
+			with open(os.path.join(self.directory, name), 'w') as f:
+				f.write(name)
+		class CopyConverter(GraphicsConverter):
+			converters = dict((ext, [sys.executable, '-c', 'import shutil, sys; shutil.copy(sys.argv[2], sys.argv[1])', '{output}', '{source}']) for ext in ['eps', 'svg'])
+		self.converter = CopyConverter(options={'graphics_cache': os.path.join(self.directory, 'cache')})
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def test_graphics(self):
+		graphics = self.converter.graphics(self.tex, 'paper')
+		self.assertEqual([os.path.basename(path) for path in graphics], ['fig.eps', 'plot.svg'])
+
+	def test_cache(self):
+		converted = os.path.join(self.directory, 'fig-eps-converted-to.pdf')
+		self.converter.convert_all(self.tex, 'paper')
+		with open(converted) as f:
+			self.assertEqual(f.read(), 'fig.eps')
+		self.assertEqual(self.converter.lookups['miss'], 2)
+		# up to date
+		self.converter.convert_all(self.tex, 'paper')
+		self.assertEqual(sum(self.converter.lookups.values()), 2)
+		os.remove(converted)
+		self.converter.convert_all(self.tex, 'paper')
+		self.assertEqual(self.converter.lookups['hit'], 1)
+
+class TestPrefetch(unittest.TestCase):
+	engine = """#!{python}
+open('paper.log', 'w').close()
+open('paper.pdf', 'w').close()
+"""
+
+	def setUp(self):
+		import sys
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		self.path = os.environ['PATH']
+		os.chdir(self.directory)
+		with open('pdflatex', 'w') as f:
+			f.write(self.engine.format(python=sys.executable))
+		os.chmod('pdflatex', 0o755)
+		os.environ['PATH'] = self.directory + os.pathsep + self.path
+		open('paper.tex', 'w').close()
+		with open('style.sty', 'w') as f:
+			f.write('x'*1000)
+		with open('paper.fls', 'w') as f:
+			f.write('PWD {0}\nINPUT paper.tex\nINPUT style.sty\nINPUT style.sty\nINPUT /nonexistent/font.pfb\nOUTPUT paper.log\n'.format(self.directory))
+
+	def tearDown(self):
+		import shutil
+		os.chdir(self.cwd)
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.directory)
+
+	def test_prefetch(self):
+		from pydflatex.prefetch import Prefetcher
+		prefetcher = Prefetcher()
+		prefetcher.logger = prefetcher.setup_logger([])
+		prefetcher.start('paper')
+		prefetcher.stop()
+		self.assertEqual((prefetcher.listed, prefetcher.requested, prefetcher.size), (3, 2, 1000))
+		prefetcher = Prefetcher()
+		prefetcher.start('unknown')
+		prefetcher.stop()
+		self.assertEqual(prefetcher.listed, 0)
+
+	def test_runner(self):
+		runner = Runner(options={'prefetch_inputs': True, 'log_parsing': False})
+		runner.logger = runner.setup_logger([])
+		runner.run('paper.tex')
+		self.assertEqual(runner.cache_lookups, {('prefetch', 'requested'): 2, ('prefetch', 'skipped'): 1})
+
+class TestSingleFlight(unittest.TestCase):
+	def setUp(self):
+		import threading
+		from pydflatex.singleflight import SingleFlight
+		self.directory = tempfile.mkdtemp()
+		self.tex_path = os.path.join(self.directory, 'notes.tex')
+		with open(self.tex_path, 'w') as f:
+			f.write('first')
+		self.flight = SingleFlight(os.path.join(self.directory, 'notes'), os.path.join(self.directory, 'locks'))
+		self.builds = 0
+		self.running = threading.Event()
+		self.release = threading.Event()
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def build(self):
+		from pydflatex.result import BuildResult
+		self.builds += 1
+		self.running.set()
+		self.release.wait(5)
+		return BuildResult(self.tex_path, success=True, passes=self.builds)
+
+	def burst(self, change=False):
+		"""
+		Request a build, then four others while it is running, and return the number of passes of each result.
+		"""
+		import threading
+		results = []
+		def request():
+			results.append(self.flight.build(self.tex_path, self.build).passes)
+		first = threading.Thread(target=request)
+		first.start()
+		self.running.wait(5)
+		if change:
+			with open(self.tex_path, 'w') as f:
+				f.write('second')
+		threads = [threading.Thread(target=request) for i in range(4)]
+		for thread in threads:
+			thread.start()
+		import time
+		time.sleep(.2)
+		self.release.set()
+		for thread in [first] + threads:
+			thread.join()
+		return results
+
+	def test_shared(self):
+		self.assertEqual(self.burst(), [1]*5)
+		self.assertEqual(self.builds, 1)
+
+	def test_follow_up(self):
+		self.assertEqual(sorted(self.burst(change=True)), [1, 2, 2, 2, 2])
+		self.assertEqual(self.builds, 2)
+
+	def test_sequential(self):
+		self.release.set()
+		self.assertEqual(self.flight.build(self.tex_path, self.build).passes, 1)
+		self.assertEqual(self.flight.build(self.tex_path, self.build).passes, 2)
+
+	def test_failure(self):
+		def fail():
+			raise OSError('engine crashed')
+		with self.assertRaises(OSError):
+			self.flight.build(self.tex_path, fail)
+		self.release.set()
+		self.assertEqual(self.flight.build(self.tex_path, self.build).passes, 1)
+
+class TestVariants(unittest.TestCase):
+	"""
+	Variants built by a fake pdflatex, which writes the pdf, a copy of a test log and its arguments.
+	"""
+	engine = """#!{python}
+import sys, shutil
+jobname = [argument for argument in sys.argv if argument.startswith('-jobname=')][0][9:]
+open(jobname + '.pdf', 'w').close()
+open(jobname + '.fls', 'w').write('PWD .\\nINPUT talk.tex\\nOUTPUT ' + jobname + '.log\\n')
+open(jobname + '.args', 'w').write(sys.argv[-1])
+shutil.copy({latex_dir!r} + ('/error.testlog' if 'handout' in sys.argv[-1] else '/cite.testlog'), jobname + '.log')
+"""
+
+	def setUp(self):
+		import sys
+		import json
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		self.path = os.environ['PATH']
+		os.chdir(self.directory)
+		with open('pdflatex', 'w') as f:
+			f.write(self.engine.format(python=sys.executable, latex_dir=os.path.abspath(latex_dir)))
+		os.chmod('pdflatex', 0o755)
+		os.environ['PATH'] = self.directory + os.pathsep + self.path
+		open('talk.tex', 'w').close()
+		self.spec = {'slides': {}, 'notes': {'definitions': {'notes': 'yes'}, 'options': {'max_passes': 2}}}
+		with open('variants.json', 'w') as f:
+			json.dump(self.spec, f)
+
+	def tearDown(self):
+		import shutil
+		os.chdir(self.cwd)
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.directory)
+
+	def builder(self):
+		from pydflatex.variants import VariantBuilder
+		builder = VariantBuilder(options={'variants': 'variants.json', 'variant_jobs': 2})
+		builder.logger = builder.setup_logger([])
+		return builder
+
+	def test_variants(self):
+		results = self.builder().run('talk.tex')
+		self.assertEqual(sorted(results), ['notes', 'slides'])
+		self.assertEqual(results['notes'].pdf_path, 'notes.pdf')
+		self.assertEqual(len(results['slides'].messages), len(results['notes'].messages))
+		with open('notes.args') as f:
+			self.assertEqual(f.read(), '\\def\\notes{yes}\\input{talk.tex}')
+		with open('slides.args') as f:
+			self.assertEqual(f.read(), 'talk.tex')
+		self.assertFalse(os.path.exists('talk.log'))
+
+	def test_failure(self):
+		import json
+		self.spec['handout'] = {'definitions': {'handout': ''}}
+		with open('variants.json', 'w') as f:
+			json.dump(self.spec, f)
+		with self.assertRaises(LaTeXError) as context:
+			self.builder().run('talk.tex')
+		self.assertIn('handout', str(context.exception))
+		self.assertTrue(os.path.exists('slides.pdf'))
+
+	def test_unknown_option(self):
+		import json
+		from pydflatex.variants import load_variants
+		with open('variants.json', 'w') as f:
+			json.dump({'slides': {'options': {'shading': True}}}, f)
+		with self.assertRaises(LaTeXError):
+			load_variants('variants.json')
+
+	def test_macro_names(self):
+		import json
+		from pydflatex.variants import load_variants
+		with open('variants.json', 'w') as f:
+			json.dump({'slides': {'definitions': {'relax\\def\\x': ''}}}, f)
+		with self.assertRaises(LaTeXError):
+			load_variants('variants.json')
+
+	def test_shared_files(self):
+		from pydflatex.variants import VariantBuilder
+		builder = VariantBuilder(options={'history': 'h.sqlite', 'metrics_file': 'm.prom', 'single_flight': True, 'fingerprint_file': 'f.json'})
+		options = builder.options_of('slides', {})
+		self.assertEqual((options['history'], options['metrics_file'], options['single_flight']), (None, None, False))
+		self.assertEqual(options['fingerprint_file'], 'f.slides.json')
+
+	def test_shared_aux(self):
+		from pydflatex.variants import VariantBuilder
+		builder = VariantBuilder()
+		with open('talk.tex', 'w') as f:
+			f.write('% \\include{old}\n\\input{preamble}\n')
+		self.assertFalse(builder.shared_aux('talk.tex', ['slides']))
+		with open('talk.tex', 'a') as f:
+			f.write('\\include{chapter}\n')
+		self.assertTrue(builder.shared_aux('talk.tex', ['slides']))
+
+	def test_jobname(self):
+		runner = Runner(options={'jobname': 'draft'})
+		result = runner.build('talk.tex')
+		self.assertEqual(result.pdf_path, 'draft.pdf')
+		self.assertEqual(result.outputs, ['draft.log'])
+
+class TestSimulatedEngine(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		os.chdir(self.directory)
+		open('thesis.tex', 'w').close()
+
+	def tearDown(self):
+		import shutil
+		os.chdir(self.cwd)
+		shutil.rmtree(self.directory)
+
+	def runner(self, scenario, **options):
+		import sys
+		import json
+		from pydflatex import simulate
+		with open('scenario.json', 'w') as f:
+			json.dump(scenario, f)
+		options['engine'] = [sys.executable, os.path.abspath(simulate.__file__), '--scenario', 'scenario.json']
+		runner = Runner(options=options)
+		runner.logger = runner.setup_logger([])
+		return runner
+
+	def test_command(self):
+		t = Typesetter(options={'engine': 'python -m pydflatex.simulate --scenario "my scenario.json"'})
+		self.assertEqual(t.arguments()[:5], ['python', '-m', 'pydflatex.simulate', '--scenario', 'my scenario.json'])
+		self.assertEqual(Typesetter().arguments()[0], 'pdflatex')
+
+	def test_reruns(self):
+		runner = self.runner({'reruns': 2, 'warnings': 3}, max_passes=5)
+		result = runner.build('thesis.tex')
+		self.assertTrue(result.success)
+		self.assertEqual(result.passes, 3)
+		self.assertEqual(len([message for message in result.messages if message.kind == 'ref']), 3)
+		self.assertIn('thesis.aux', result.inputs)
+		# the references are stable
+		self.assertEqual(runner.build('thesis.tex').passes, 1)
+
+	def test_failure(self):
+		runner = self.runner({'error': 'Undefined control sequence.', 'jobs': {'draft': {'error': None}}})
+		result = runner.build('thesis.tex')
+		self.assertFalse(result.success)
+		self.assertIn('Undefined control sequence', result.errors[0].text)
+		self.assertFalse(os.path.exists('thesis.pdf'))
+		with self.assertRaises(LaTeXError):
+			runner.run('thesis.tex')
+		# the auxiliary files of a failed build are not cleaned
+		self.assertNotIn('cleaning', runner.timings)
+		runner.options['jobname'] = 'draft'
+		runner.run('thesis.tex')
+		self.assertIn('cleaning', runner.timings)
+		runner.options['jobname'] = 'draft'
+		self.assertTrue(runner.build('thesis.tex').success)
+
+	def test_fail_on_new_warnings(self):
+		runner = self.runner({'warnings': 1}, overlap_stages=True, fail_on_new_warnings=True, open_after=False)
+		runner.run('thesis.tex')
+		self.assertIn('cleaning', runner.timings)
+		runner = self.runner({'warnings': 2}, overlap_stages=True, fail_on_new_warnings=True, open_after=False)
+		with self.assertRaises(LaTeXError):
+			runner.run('thesis.tex')
+		# not cleaned before the new warnings are known
+		self.assertNotIn('cleaning', runner.timings)
+
+	def test_replay(self):
+		import shutil
+		shutil.copy(os.path.join(latex_dir, 'cite.testlog'), 'recorded.log')
+		shutil.copy(os.path.join(latex_dir, 'simple.fls'), 'recorded.fls')
+		with open('recorded.aux', 'w') as f:
+			f.write('\\relax\n\\bibcite{knuth}{1}\n')
+		runner = self.runner({'log': 'recorded.log', 'aux': 'recorded.aux', 'fls': 'recorded.fls', 'reruns': 2}, max_passes=5)
+		result = runner.build('thesis.tex')
+		self.assertEqual(result.passes, 3)
+		self.assertEqual(runner.counts['warning'], 1)
+		self.assertIn('simple.tex', [os.path.basename(path) for path in result.inputs])
+		with open('thesis.aux') as f:
+			self.assertIn('bibcite', f.read())
+		self.assertEqual(runner.build('thesis.tex').passes, 1)
+
+	def test_single_flight(self):
+		import threading
+		runners = [self.runner({'delay': .5, 'warnings': 2}, single_flight=True) for index in range(2)]
+		results = []
+		threads = [threading.Thread(target=lambda runner=runner: results.append(runner.run('thesis.tex'))) for runner in runners]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		# only one of them typeset, the other received its result
+		self.assertEqual(len([runner for runner in runners if hasattr(runner, 'timings')]), 1)
+		self.assertEqual([len(result.warnings) for result in results], [2, 2])
+
+	def test_benchmark(self):
+		from pydflatex.benchmark import Benchmark
+		benchmark = Benchmark(documents=2, repeat=1)
+		try:
+			rows = benchmark.run(jobs=[2])
+		finally:
+			benchmark.close()
+		self.assertEqual([(name, setting, unit) for name, setting, duration, value, unit in rows], [('pass loop', '3 passes', 'ms/pass'), ('stages', 'sequential', 'ms'), ('stages', 'overlap', 'ms'), ('batch', '2 jobs', 'documents/s')])
+
+class TestExternalize(unittest.TestCase):
+	"""
+	Figures compiled by a fake pdflatex, which writes the pdf and a copy of a test log.
+	"""
+	engine = """#!{python}
+import sys, shutil
+jobname = ([argument[9:] for argument in sys.argv if argument.startswith('-jobname=')] or ['report'])[0]
+open(jobname + '.pdf', 'w').close()
+open(jobname + '.fls', 'w').close()
+shutil.copy({latex_dir!r} + ('/error.testlog' if 'bad' in jobname else '/cite.testlog'), jobname + '.log')
+"""
+
+	def setUp(self):
+		import sys
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		self.path = os.environ['PATH']
+		os.chdir(self.directory)
+		with open('pdflatex', 'w') as f:
+			f.write(self.engine.format(python=sys.executable, latex_dir=os.path.abspath(latex_dir)))
+		os.chmod('pdflatex', 0o755)
+		os.environ['PATH'] = self.directory + os.pathsep + self.path
+		open('report.tex', 'w').close()
+		with open('report.figlist', 'w') as f:
+			f.write('report-figure0\nreport-figure1\n')
+
+	def tearDown(self):
+		import shutil
+		os.chdir(self.cwd)
+		os.environ['PATH'] = self.path
+		shutil.rmtree(self.directory)
+
+	def builder(self):
+		import logging
+		from pydflatex.externalize import FigureBuilder
+		self.logfile = tempfile.NamedTemporaryFile()
+		builder = FigureBuilder(options={'figure_jobs': 2})
+		builder.logger = builder.setup_logger([logging.FileHandler(self.logfile.name)])
+		return builder
+
+	def test_build(self):
+		self.assertEqual(self.builder().build('report.tex', 'report'), 2)
+		self.assertTrue(os.path.exists('report-figure1.pdf'))
+		self.assertEqual(self.builder().build('report.tex', 'report'), 0)
+		# the code of a figure changed
+		import time
+		open('report-figure0.md5', 'w').close()
+		later = time.time() + 10
+		os.utime('report-figure0.md5', (later, later))
+		self.assertEqual(self.builder().build('report.tex', 'report'), 1)
+
+	def test_error(self):
+		with open('report.figlist', 'a') as f:
+			f.write('report-bad\n')
+		builder = self.builder()
+		self.assertEqual(builder.build('report.tex', 'report'), 3)
+		output = self.logfile.read().decode('utf8')
+		self.assertIn('Figure report-bad failed', output)
+		self.assertIn('nonexistingmacro', output)
+		self.assertEqual([message.kind for message in builder.messages], ['error'])
+		self.assertIn('nonexistingmacro', builder.messages[0].text)
+
+	def test_build_fails(self):
+		with open('report.figlist', 'a') as f:
+			f.write('report-bad\n')
+		runner = Runner(options={'externalize': True, 'figure_jobs': 2, 'max_passes': 2, 'colour': False})
+		runner.logger = runner.setup_logger([])
+		result = runner.build('report.tex')
+		self.assertFalse(result.success)
+		self.assertIn('nonexistingmacro', result.messages[0].text)
+		os.remove('report-bad.pdf')
+		with self.assertRaises(LaTeXError):
+			runner.run('report.tex')
+
+	def test_options(self):
+		from pydflatex.externalize import FigureBuilder
+		options = FigureBuilder(options={'fingerprint_file': 'f.json', 'fail_on_new_warnings': True, 'history': 'h.sqlite', 'wide_lines': True, 'timeout': 3}).figure_options()
+		self.assertEqual((options['wide_lines'], options['timeout'], options['compressed_fallback']), (True, 3, False))
+		for key in ['fingerprint_file', 'fail_on_new_warnings', 'history', 'new_only', 'metrics_file']:
+			self.assertNotIn(key, options)
+
+class TestDistributed(unittest.TestCase):
+	"""
+	Build on two local workers, with a fake pdflatex writing the pdf, the log and the .fls file.
+	"""
+	engine = """#!{python}
+import os, sys, shutil
+jobname = os.path.splitext(os.path.basename(sys.argv[-1]))[0]
+with open(jobname + '.pdf', 'w') as pdf:
+	pdf.write('%PDF ' + jobname)
+with open(jobname + '.fls', 'w') as fls:
+	fls.write('PWD ' + os.getcwd() + '\\nOUTPUT ' + jobname + '.log\\n')
+shutil.copy(jobname + '.testlog', jobname + '.log')
+"""
+
+	def setUp(self):
+		import sys
+		import shutil
+		from subprocess import Popen, PIPE
+		self.directory = tempfile.mkdtemp()
+		engine_path = os.path.join(self.directory, 'pdflatex')
+		with open(engine_path, 'w') as f:
+			f.write(self.engine.format(python=sys.executable))
+		os.chmod(engine_path, 0o755)
+		env = dict(os.environ, PATH=self.directory + os.pathsep + os.environ['PATH'], PYDFLATEX_SECRET='secret')
+		self.workers = []
+		self.addresses = []
+		for index in range(2):
+			worker = Popen([sys.executable, '-c', 'from pydflatex.distributed import Worker; Worker(options={"colour": False}).serve(0)'], stderr=PIPE, env=env, cwd=os.path.join(test_dir, os.path.pardir))
+			self.workers.append(worker)
+			port = re.search(r'port (\d+)', worker.stderr.readline().decode('utf8')).group(1)
+			self.addresses.append('localhost:' + port)
+		self.tex_paths = []
+		for name in ['cite', 'error', 'ref']:
+			document = os.path.join(self.directory, name)
+			os.mkdir(document)
+			shutil.copy(os.path.join(latex_dir, name + '.testlog'), document)
+			with open(os.path.join(document, 'shared.sty'), 'w') as f:
+				f.write('% shared by all documents')
+			tex_path = os.path.join(document, name + '.tex')
+			open(tex_path, 'w').close()
+			self.tex_paths.append(tex_path)
+
+	def tearDown(self):
+		import shutil
+		for worker in self.workers:
+			worker.kill()
+			worker.wait()
+			worker.stderr.close()
+		shutil.rmtree(self.directory)
+
+	def test_build(self):
+		from pydflatex.distributed import Coordinator
+		coordinator = Coordinator(options={'workers': self.addresses, 'colour': False, 'secret': 'secret'})
+		coordinator.logger = coordinator.setup_logger([])
+		with self.assertRaises(LaTeXError):
+			coordinator.run(self.tex_paths)
+		for tex_path in self.tex_paths:
+			with open(os.path.splitext(tex_path)[0] + '.pdf') as f:
+				self.assertTrue(f.read().startswith('%PDF'))
+
+	def test_results(self):
+		from pydflatex.distributed import Coordinator
+		coordinator = Coordinator(options={'workers': self.addresses[:1], 'colour': False, 'secret': 'secret'})
+		coordinator.logger = coordinator.setup_logger([])
+		results = coordinator.run(self.tex_paths[::2])
+		self.assertEqual(sorted(result.tex_path for result in results), self.tex_paths[::2])
+		self.assertTrue(all(result.success for result in results))
+		self.assertIn('ref', [message.kind for message in results[0].warnings])
+
+	def test_missing(self):
+		import socket
+		from pydflatex.distributed import Coordinator, send, receive, encode
+		coordinator = Coordinator(options={'workers': self.addresses[:1], 'secret': 'secret'})
+		host, port = self.addresses[0].split(':')
+		connection = socket.create_connection((host, int(port)))
+		try:
+			coordinator.authenticate(connection)
+			for tex_path, expected in [(self.tex_paths[0], 3), (self.tex_paths[1], 1)]:
+				job = coordinator.job(tex_path)
+				send(connection, job)
+				need = receive(connection)['hashes']
+				# the style file and the empty .tex file are only sent once
+				self.assertEqual(len(need), expected)
+				blobs = {}
+				for relative, digest in job['tree'].items():
+					with open(os.path.join(os.path.dirname(tex_path), relative), 'rb') as f:
+						blobs[digest] = encode(f.read())
+				send(connection, {'type': 'blobs', 'blobs': dict((digest, blobs[digest]) for digest in need)})
+				self.assertEqual(receive(connection)['type'], 'result')
+		finally:
+			connection.close()
+
+	def test_tree(self):
+		from pydflatex.distributed import Coordinator
+		coordinator = Coordinator(options={'workers': self.addresses[:1], 'secret': 'secret', 'history': 'history.sqlite'})
+		cite, error = [os.path.dirname(tex_path) for tex_path in self.tex_paths[:2]]
+		for name in ['unrelated.bin', 'cite.pdf', 'cite.log.gz', 'cite.fingerprints', 'history.sqlite']:
+			for directory in [cite, error]:
+				open(os.path.join(directory, name), 'w').close()
+		with open(os.path.join(cite, 'cite.fls'), 'w') as f:
+			f.write('PWD {0}\nINPUT /usr/share/texmf/article.cls\nINPUT cite.tex\nINPUT ./shared.sty\nINPUT cite.aux\nOUTPUT cite.aux\nOUTPUT cite.log\n'.format(cite))
+		# the sources recorded by the last build
+		self.assertEqual(sorted(coordinator.job(self.tex_paths[0])['tree']), ['cite.tex', 'shared.sty'])
+		# the files of the directory, without the outputs, for a first build
+		self.assertEqual(sorted(coordinator.job(self.tex_paths[1])['tree']), ['error.testlog', 'error.tex', 'shared.sty', 'unrelated.bin'])
+
+	def test_wrong_secret(self):
+		from pydflatex.distributed import Coordinator
+		coordinator = Coordinator(options={'workers': self.addresses[:1], 'colour': False, 'secret': 'wrong'})
+		coordinator.logger = coordinator.setup_logger([])
+		with self.assertRaises(LaTeXError):
+			coordinator.run(self.tex_paths[:1])
+		self.assertFalse(os.path.exists(os.path.splitext(self.tex_paths[0])[0] + '.pdf'))
+
+	def test_unsafe_job(self):
+		from pydflatex.distributed import Worker, safe_path
+		for relative in ['../escape.tex', '/etc/passwd', 'a/../../escape.tex', '']:
+			with self.assertRaises(ValueError):
+				safe_path(self.directory, relative)
+		self.assertEqual(safe_path(self.directory, 'a/../b.tex'), os.path.join(self.directory, 'b.tex'))
+		worker = Worker(options={'store': os.path.join(self.directory, 'store'), 'secret': 'secret'})
+		self.assertEqual(worker.options_of({'options': {'engine': 'rm -rf /', 'history': 'h.sqlite', 'max_passes': 3}}), {'max_passes': 3})
+		with self.assertRaises(ValueError):
+			worker.store.materialize({'../escape.tex': 'digest'}, os.path.join(self.directory, 'job'))
+		with self.assertRaises(LaTeXError):
+			Worker(options={'store': os.path.join(self.directory, 'store'), 'secret': ''}).serve(host='')
+
+class TestBuildResult(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.error, self.cite = copy_logs(['error', 'cite'], self.directory)
+		self.runner = Runner(options={'typesetting': False})
+		self.logfile = tempfile.NamedTemporaryFile()
+		import logging
+		self.runner.logger = self.runner.setup_logger([logging.FileHandler(self.logfile.name)])
+
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.directory)
+
+	def test_error(self):
+		result = self.runner.build(self.error)
+		self.assertFalse(result.success)
+		error, = result.errors
+		self.assertEqual(error.kind, 'error')
+		self.assertEqual(error.line, 3)
+		self.assertEqual(error.file, './error.tex')
+		self.assertEqual(result.pdf_path, os.path.join(self.directory, 'error.pdf'))
+		self.assertIn('log_parsing', result.timings)
+		self.assertEqual(self.logfile.read(), b'')
+
+	def test_warnings(self):
+		result = self.runner.build(self.cite)
+		self.assertTrue(result.success)
+		self.assertEqual([message.kind for message in result.warnings], ['ref', 'warning'])
+		self.assertEqual(result.warnings[0].cite, 'citation')
+		self.assertEqual(result.warnings[0].page, 1)
+
+	def test_render(self):
+		self.runner.build(self.cite, render=True)
+		self.assertIn(b'[citation] undefined', self.logfile.read())
+
+	def test_serialize(self):
+		import json
+		from pydflatex import BuildResult
+		result = self.runner.build(self.error)
+		copy = BuildResult.from_dict(json.loads(json.dumps(result.to_dict())))
+		self.assertEqual(copy.to_dict(), result.to_dict())
+		self.assertEqual(copy.errors[0].line, 3)
+
 class TestRunnerPath(Harness):
 
 	def test_wrong_ext(self):
@@ -297,6 +1586,84 @@ class TestOutput(Harness):
 		computed = list(Cleaner.output_files(os.path.join(test_dir, 'simple.fls')))
 		self.assertEqual(computed[1:], expected[1:])
 
+class ScriptTypesetter(Typesetter):
+	"""
+	Typesetter running a Python script instead of the engine.
+	"""
+	script = ''
+	def arguments(self):
+		import sys
+		return [sys.executable, '-c', self.script]
+
+class TestLimits(unittest.TestCase):
+	def setUp(self):
+		self.tex = tempfile.NamedTemporaryFile(suffix='.tex')
+
+	def typeset(self, script, **options):
+		t = ScriptTypesetter(options=options)
+		t.script = script
+		return t.typeset(self.tex.name)
+
+	def test_timeout(self):
+		self.assertEqual(self.typeset('import time; time.sleep(10)', timeout=.2), 'timeout')
+
+	def test_file_size(self):
+		output = tempfile.NamedTemporaryFile()
+		# Python ignores SIGXFSZ, unlike TeX
+		script = 'import signal; signal.signal(signal.SIGXFSZ, signal.SIG_DFL); open({0!r}, "w").write("x"*100000)'.format(output.name)
+		self.assertEqual(self.typeset(script, file_size_limit=1000), 'file_size')
+		self.assertIsNone(self.typeset(script))
+
+	def test_cpu(self):
+		self.assertEqual(self.typeset('while True: pass', cpu_limit=1, timeout=10), 'cpu')
+		# killed by someone else
+		self.assertIsNone(self.typeset('import os, signal; os.kill(os.getpid(), signal.SIGKILL)', cpu_limit=10))
+
+	def test_memory(self):
+		# the engine writes to the standard error when an allocation fails, even in batch mode
+		script = 'import sys; sys.stderr.write("fatal: memory exhausted (xmalloc of 65536 bytes).\\n"); sys.exit(1)'
+		self.assertEqual(self.typeset(script, memory_limit=1 << 30), 'memory')
+		self.assertIsNone(self.typeset(script))
+
+	def test_children_killed(self):
+		import time
+		output = tempfile.mktemp()
+		script = 'import subprocess, sys, time; subprocess.Popen([sys.executable, "-c", "import time; time.sleep(.5); open({0!r}, \'w\')"]); time.sleep(10)'.format(output)
+		self.assertEqual(self.typeset(script, timeout=.2), 'timeout')
+		time.sleep(1)
+		self.assertFalse(os.path.exists(output))
+
+class TestStages(unittest.TestCase):
+	def setUp(self):
+		import logging
+		from pydflatex.stages import Stages
+		self.logfile = tempfile.NamedTemporaryFile()
+		self.logger = Runner().setup_logger([logging.FileHandler(self.logfile.name)])
+		self.stages = Stages(self.logger)
+
+	def test_order(self):
+		import time
+		def slow(text, logger):
+			time.sleep(.2)
+			logger.message(text)
+		def fail(logger):
+			logger.message('second')
+			raise ValueError('failed')
+		self.stages.start(slow, 'first')
+		self.stages.start(fail)
+		self.logger.message('main')
+		with self.assertRaises(ValueError):
+			self.stages.join()
+		output = self.logfile.read().decode('utf8')
+		self.assertLess(output.index('main'), output.index('first'))
+		self.assertLess(output.index('first'), output.index('second'))
+
+	def test_no_raise(self):
+		def fail(logger):
+			raise ValueError('failed')
+		self.stages.start(fail)
+		self.stages.join(raise_errors=False)
+
 class TestModules(unittest.TestCase):
 	def test_typesetter(self):
 		t = Typesetter(options={'xetex':True})